@@ -0,0 +1,85 @@
+"""Benchmark: alias replacement latency vs. alias table size.
+
+对比逐条正则替换（旧实现）与预编译 AliasMatcher 的单次扫描：
+    python benchmarks/alias_matcher.py --sizes 100 1000 10000 100000
+"""
+from __future__ import annotations
+
+import argparse
+import random
+import time
+from typing import Dict, List
+
+import regex as re
+
+from rag_query_rewriter.utils.text_norm import AliasMatcher
+
+_HAN = "模型发布版本规格接口时间线文档检索问题更新说明性能兼容限额特性"
+
+
+def _legacy_replace(text: str, alias: Dict[str, str]) -> str:
+    """旧实现：每个别名条目构建一次正则并执行 re.sub。"""
+    for k, v in alias.items():
+        pattern = (
+            rf"(?:(?<![0-9A-Za-z])){re.escape(k)}(?![0-9A-Za-z])"
+            if re.search(r"[^\p{Han}]", k) else rf"{re.escape(k)}"
+        )
+        text = re.sub(pattern, v, text, flags=re.IGNORECASE)
+    return text
+
+
+def _make_table(size: int, rng: random.Random) -> Dict[str, str]:
+    table: Dict[str, str] = {}
+    while len(table) < size:
+        if rng.random() < 0.6:
+            k = "".join(rng.choice("abcdefghijklmnopqrstuvwxyz0123456789")
+                        for _ in range(rng.randint(2, 8)))
+        else:
+            k = "".join(rng.choice(_HAN) for _ in range(rng.randint(2, 4)))
+        table.setdefault(k, f"<{k.upper()}>")
+    return table
+
+
+def _make_queries(table: Dict[str, str], n: int, rng: random.Random) -> List[str]:
+    keys = list(table)
+    return [f"请问 {rng.choice(keys)} 与 {rng.choice(keys)} 在 2024 年的{rng.choice(keys)}差异"
+            for _ in range(n)]
+
+
+def _time_per_query_us(fn, queries: List[str]) -> float:
+    t0 = time.perf_counter()
+    for q in queries:
+        fn(q)
+    return (time.perf_counter() - t0) / len(queries) * 1e6
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Alias matcher benchmark")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000, 100000])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--legacy-max", type=int, default=10000,
+                        help="Skip the legacy per-entry regex path above this table size")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    print(f"{'size':>8} {'build_ms':>10} {'matcher_us/q':>14} {'legacy_us/q':>14} {'speedup':>9}")
+    for size in args.sizes:
+        table = _make_table(size, rng)
+        queries = _make_queries(table, args.queries, rng)
+
+        t0 = time.perf_counter()
+        matcher = AliasMatcher(table)
+        build_ms = (time.perf_counter() - t0) * 1000
+        fast = _time_per_query_us(matcher.replace, queries)
+
+        if size <= args.legacy_max:
+            legacy_queries = queries[: max(1, min(len(queries), 20000 // size))]
+            slow = _time_per_query_us(lambda q: _legacy_replace(q, table), legacy_queries)
+            print(f"{size:>8} {build_ms:>10.1f} {fast:>14.1f} {slow:>14.1f} {slow / fast:>8.0f}x")
+        else:
+            print(f"{size:>8} {build_ms:>10.1f} {fast:>14.1f} {'skipped':>14} {'-':>9}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""Benchmark: IVF ANN recall/latency trade-off against brute-force dense and hybrid retrieval.
+
+    python benchmarks/ann.py --docs 100000 --queries 500
+    python benchmarks/ann.py --nprobe 1,4,16,64 --quantize float32
+    python benchmarks/ann.py --corpus corpus.jsonl --hybrid   # 同时对比 BM25 / 混合检索的延迟
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import random
+import tempfile
+import time
+from typing import List
+
+import numpy as np
+
+from bm25 import _sentence, write_corpus
+from rag_query_rewriter.retrievers.ann import IVFRetriever
+from rag_query_rewriter.retrievers.bm25 import BM25Retriever
+from rag_query_rewriter.retrievers.dense import DenseRetriever
+from rag_query_rewriter.retrievers.hybrid import HybridRetriever
+from rag_query_rewriter.utils.embedding import HashingEmbedder
+
+
+def _recall(approx: List[list], exact: List[list]) -> float:
+    """recall@k：近似结果与精确结果前 k 的交集占比，按查询平均。"""
+    return float(np.mean([len({r.doc_id for r in a} & {r.doc_id for r in e}) / max(1, len(e))
+                          for a, e in zip(approx, exact)]))
+
+
+def _latency(r, queries: List[str], topk: int) -> np.ndarray:
+    lat = []
+    for q in queries:
+        t0 = time.perf_counter()
+        r.search(q, topk=topk)
+        lat.append((time.perf_counter() - t0) * 1000)
+    return np.percentile(lat, [50, 95, 99])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="IVF ANN retriever benchmark")
+    parser.add_argument("--docs", type=int, default=100000)
+    parser.add_argument("--corpus", default=None, help="Existing JSONL corpus (skips generation)")
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--topk", type=int, default=10)
+    parser.add_argument("--dim", type=int, default=256, help="Hashing embedder dimension")
+    parser.add_argument("--lists", type=int, default=None, help="IVF lists (default ~4*sqrt(N))")
+    parser.add_argument("--nprobe", default="1,4,8,16,32,64")
+    parser.add_argument("--quantize", choices=["int8", "float32"], default="int8")
+    parser.add_argument("--hybrid", action="store_true", help="Also benchmark BM25 and hybrid")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    emb = HashingEmbedder(args.dim)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = args.corpus
+        if path is None:
+            path = os.path.join(tmp, "corpus.jsonl")
+            write_corpus(path, args.docs)
+
+        t0 = time.perf_counter()
+        dense = DenseRetriever.from_jsonl(path, emb)
+        print(f"dense index: docs={dense.num_docs} in {time.perf_counter() - t0:.1f}s")
+        t0 = time.perf_counter()
+        ivf = IVFRetriever.from_jsonl(path, emb, n_lists=args.lists, quantize=args.quantize)
+        print(f"ivf index: lists={ivf.arrays.num_lists} quantize={args.quantize} "
+              f"in {time.perf_counter() - t0:.1f}s "
+              f"({ivf.arrays.codes.nbytes / 2**20:.1f}MB vectors)")
+
+        rng = random.Random(args.seed)
+        queries = [_sentence(rng, rng.randint(2, 6)) for _ in range(args.queries)]
+        exact = dense.search_many(queries, topk=args.topk)
+        p50, p95, p99 = _latency(dense, queries, args.topk)
+        print(f"{'dense':>12}: recall=1.000 p50={p50:.2f}ms p95={p95:.2f}ms p99={p99:.2f}ms")
+        for nprobe in (int(x) for x in args.nprobe.split(",")):
+            ivf.nprobe = nprobe
+            rec = _recall(ivf.search_many(queries, topk=args.topk), exact)
+            p50, p95, p99 = _latency(ivf, queries, args.topk)
+            print(f"{'ivf/' + str(nprobe):>12}: recall={rec:.3f} p50={p50:.2f}ms "
+                  f"p95={p95:.2f}ms p99={p99:.2f}ms")
+
+        if args.hybrid:
+            bm25 = BM25Retriever.from_jsonl(path)
+            for name, r in (("bm25", bm25), ("hybrid", HybridRetriever(bm25, ivf))):
+                p50, p95, p99 = _latency(r, queries, args.topk)
+                print(f"{name:>12}: p50={p50:.2f}ms p95={p95:.2f}ms p99={p99:.2f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""Benchmark: BM25Retriever build time and query latency on a synthetic corpus.
+
+    python benchmarks/bm25.py --docs 100000 --queries 500
+    python benchmarks/bm25.py --corpus corpus.jsonl      # 使用已有 JSONL 语料
+    python benchmarks/bm25.py --mmap                     # 同时对比 mmap 索引的打开耗时与延迟
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+from typing import List
+
+import numpy as np
+
+from rag_query_rewriter.retrievers.bm25 import BM25Retriever
+from rag_query_rewriter.retrievers.mmap_index import MmapBM25Retriever, write_index
+
+_HAN = ("版本发布记录特性时间线更新说明修复问题优化性能技术规格接口限额兼容常见解答对比差异分析"
+        "模型训练推理部署数据安全权限日志监控告警")
+_EN = ["api", "release", "spec", "faq", "latency", "gpu", "cache", "index", "query", "token",
+       "model", "deploy", "v1", "v2", "v3", "sdk", "cli", "http", "grpc", "json"]
+
+
+def _sentence(rng: random.Random, n_words: int) -> str:
+    parts: List[str] = []
+    for _ in range(n_words):
+        if rng.random() < 0.3:
+            parts.append(rng.choice(_EN))
+        else:
+            parts.append("".join(rng.choice(_HAN) for _ in range(rng.randint(2, 4))))
+    return " ".join(parts)
+
+
+def write_corpus(path: str, n_docs: int, seed: int = 13) -> None:
+    """生成合成中英混合 JSONL 语料（含 year/type 元数据）。"""
+    rng = random.Random(seed)
+    types = ["release", "spec", "faq", "compare", "guide"]
+    with open(path, "w", encoding="utf-8") as f:
+        for i in range(n_docs):
+            obj = {"id": f"d{i}", "text": _sentence(rng, rng.randint(8, 40)),
+                   "year": str(rng.choice(range(2018, 2026))), "type": rng.choice(types)}
+            f.write(json.dumps(obj, ensure_ascii=False) + "\n")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="BM25 retriever benchmark")
+    parser.add_argument("--docs", type=int, default=100000)
+    parser.add_argument("--corpus", default=None, help="Existing JSONL corpus (skips generation)")
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--topk", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--mmap", action="store_true", help="Also benchmark the mmap index")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = args.corpus
+        if path is None:
+            path = os.path.join(tmp, "corpus.jsonl")
+            t0 = time.perf_counter()
+            write_corpus(path, args.docs)
+            print(f"generated {args.docs} docs in {time.perf_counter() - t0:.1f}s")
+
+        t0 = time.perf_counter()
+        ret = BM25Retriever.from_jsonl(path)
+        print(f"built index: docs={ret.num_docs} in {time.perf_counter() - t0:.1f}s")
+        retrievers = [("memory", ret)]
+        if args.mmap:
+            idx_dir = os.path.join(tmp, "idx")
+            t0 = time.perf_counter()
+            write_index(ret._a, idx_dir)
+            print(f"wrote mmap index in {time.perf_counter() - t0:.1f}s")
+            t0 = time.perf_counter()
+            mm = MmapBM25Retriever(idx_dir)
+            print(f"opened mmap index in {(time.perf_counter() - t0) * 1000:.1f}ms")
+            retrievers.append(("mmap", mm))
+
+        rng = random.Random(args.seed)
+        queries = [_sentence(rng, rng.randint(2, 6)) for _ in range(args.queries)]
+        filters = {"must_filters": {"year": ["2023", "2024"]}, "not_filters": {"type": ["faq"]}}
+        for name, r in retrievers:
+            for label, f in (("no-filter", None), ("filtered", filters)):
+                lat = []
+                for q in queries:
+                    t0 = time.perf_counter()
+                    r.search(q, topk=args.topk, filters=f)
+                    lat.append((time.perf_counter() - t0) * 1000)
+                p50, p95, p99 = np.percentile(lat, [50, 95, 99])
+                print(f"{name:>6} {label:>10}: p50={p50:.2f}ms p95={p95:.2f}ms "
+                      f"p99={p99:.2f}ms qps={len(lat) / (sum(lat) / 1000):.0f}")
+
+            t0 = time.perf_counter()
+            r.search_many(queries, topk=args.topk, filters=filters)
+            print(f"{name:>6} search_many: {len(queries)} queries in "
+                  f"{(time.perf_counter() - t0) * 1000:.1f}ms")
+        retrievers.clear()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""Benchmark: per-strategy LLM calls vs. one combined rewrite prompt, against the stub server.
+
+    PYTHONPATH=. python benchmarks/combined_prompt.py --latency-ms 80 --queries 20
+"""
+from __future__ import annotations
+
+import argparse
+import statistics
+import time
+from typing import Dict, List
+
+from rag_query_rewriter.config import AppConfig
+from rag_query_rewriter.llm.http import HTTPLLMClient
+from rag_query_rewriter.llm.stub_server import StubLLMServer
+from rag_query_rewriter.logging_setup import setup_logging
+from rag_query_rewriter.pipeline.orchestrator import rewrite_and_retrieve
+from rag_query_rewriter.retrievers.mock import MockRetriever
+
+_QUERIES = [
+    "它什么时候发布？",
+    "2023 年的发布记录",
+    "GPT-5 发布时间",
+    "最新版本的技术规格",
+    "2024 版本更新",
+]
+
+
+def _run(server: StubLLMServer, combined: bool, queries: List[str]) -> Dict[str, float]:
+    cfg = AppConfig()
+    cfg.router.combined_prompt = combined
+    llm, ret = HTTPLLMClient(server.url), MockRetriever()
+    rewrite_and_retrieve(queries[0], "上文实体=GPT-5", cfg, llm, ret)  # 预热
+    server.reset()
+    lat = []
+    for q in queries:
+        t0 = time.perf_counter()
+        rewrite_and_retrieve(q, "上文实体=GPT-5", cfg, llm, ret)
+        lat.append((time.perf_counter() - t0) * 1000)
+    return {"calls_per_query": server.stats()["total"] / len(queries),
+            "p50_ms": statistics.median(lat), "mean_ms": statistics.fmean(lat)}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Combined rewrite prompt benchmark")
+    parser.add_argument("--latency-ms", type=float, default=80.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--queries", type=int, default=20)
+    args = parser.parse_args()
+    setup_logging("WARNING")
+
+    queries = [_QUERIES[i % len(_QUERIES)] + ("" if i < len(_QUERIES) else f" {i}")
+               for i in range(args.queries)]
+    with StubLLMServer(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms) as server:
+        for combined in (False, True):
+            r = _run(server, combined, queries)
+            print(f"{'combined' if combined else 'per-strategy':>13}: "
+                  f"llm_calls/query={r['calls_per_query']:.2f} "
+                  f"p50={r['p50_ms']:.1f}ms mean={r['mean_ms']:.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
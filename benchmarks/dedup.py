@@ -0,0 +1,75 @@
+"""Benchmark: near-duplicate filtering — legacy loop vs. vectorized greedy vs. SimHash LSH.
+
+    python benchmarks/dedup.py --sizes 10 100 1000 5000 --lsh-sizes 100000 1000000
+"""
+from __future__ import annotations
+
+import argparse
+import random
+import time
+from typing import List
+
+from sklearn.metrics.pairwise import cosine_similarity
+
+from benchmarks.bm25 import _sentence
+from rag_query_rewriter.utils.near_dup import SimHashDeduper
+from rag_query_rewriter.utils.similarity import TfidfEmbedder, dedup_texts_by_cosine
+
+
+def _legacy_dedup(texts: List[str], thr: float) -> List[str]:
+    """旧实现：逐条候选与已保留集合分别调用一次 cosine_similarity。"""
+    emb = TfidfEmbedder().fit_transform(texts)
+    keep: List[int] = []
+    for i in range(len(texts)):
+        if not keep or cosine_similarity(emb[i], emb[keep]).ravel().max() < thr:
+            keep.append(i)
+    return [texts[i] for i in keep]
+
+
+def _rewrites(rng: random.Random, n: int) -> List[str]:
+    """合成改写日志：约一半为已有条目的轻微变体（近重复）。"""
+    out: List[str] = []
+    for _ in range(n):
+        if out and rng.random() < 0.5:
+            out.append(rng.choice(out) + rng.choice(["", " 呢", " 说明", "？"]))
+        else:
+            out.append(_sentence(rng, rng.randint(4, 10)))
+    return out
+
+
+def _ms(fn) -> float:
+    t0 = time.perf_counter()
+    fn()
+    return (time.perf_counter() - t0) * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Near-duplicate dedup benchmark")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000, 5000])
+    parser.add_argument("--lsh-sizes", type=int, nargs="*", default=[100000])
+    parser.add_argument("--thr", type=float, default=0.92)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    print(f"{'n':>8} {'legacy_ms':>10} {'matrix_ms':>10} {'simhash_ms':>11} {'kept':>6} "
+          f"{'lsh_kept':>8}")
+    for n in args.sizes:
+        texts = _rewrites(rng, n)
+        kept: List[List[str]] = []
+        legacy = _ms(lambda: kept.append(_legacy_dedup(texts, args.thr)))
+        matrix = _ms(lambda: kept.append(dedup_texts_by_cosine(texts, args.thr)))
+        lsh = _ms(lambda: kept.append(dedup_texts_by_cosine(texts, args.thr, method="simhash")))
+        assert kept[0] == kept[1], "vectorized dedup diverged from the legacy loop"
+        print(f"{n:>8} {legacy:>10.1f} {matrix:>10.1f} {lsh:>11.1f} {len(kept[1]):>6} "
+              f"{len(kept[2]):>8}")
+
+    for n in args.lsh_sizes:
+        texts = _rewrites(rng, n)
+        d = SimHashDeduper(args.thr)
+        ms = _ms(lambda: d.dedup(texts))
+        print(f"simhash n={n}: {ms / 1000:.1f}s ({n / (ms / 1000):.0f} texts/s) kept={len(d)}")
+
+
+if __name__ == "__main__":
+    main()
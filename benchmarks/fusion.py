@@ -0,0 +1,82 @@
+"""Benchmark: score fusion over many pools — legacy dict RRF vs. FusionAccumulator.
+
+    python benchmarks/fusion.py --pools 50 --depth 1000 --universe 20000 --top-n 50
+"""
+from __future__ import annotations
+
+import argparse
+import random
+import time
+from typing import Dict, List, Optional
+
+from rag_query_rewriter.fusion.fuser import FusionAccumulator, fuse_pools
+from rag_query_rewriter.retrievers.base import SearchResult
+
+
+def _legacy_rrf(pools: List[Optional[List[SearchResult]]], k: int = 60) -> List[SearchResult]:
+    """旧实现：dict 累加 + 为每个文档创建 SearchResult + 对全集完整排序。"""
+    score: Dict[str, float] = {}
+    first_seen: Dict[str, SearchResult] = {}
+    for results in pools:
+        if results is None:
+            continue
+        for rank, r in enumerate(results, start=1):
+            score[r.doc_id] = score.get(r.doc_id, 0.0) + 1.0 / (k + rank)
+            first_seen.setdefault(r.doc_id, r)
+    fused = [SearchResult(d, s, first_seen[d].text) for d, s in score.items()]
+    fused.sort(key=lambda x: (-x.score, x.doc_id))
+    return fused
+
+
+def _make_pools(rng: random.Random, n_pools: int, depth: int,
+                universe: int) -> List[List[SearchResult]]:
+    pools = []
+    for _ in range(n_pools):
+        ids = rng.sample(range(universe), depth)
+        pools.append([SearchResult(f"d{d}", 1.0 / (r + 1), f"text {d}")
+                      for r, d in enumerate(ids)])
+    return pools
+
+
+def _ms(fn, repeat: int) -> float:
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - t0) * 1000 / repeat
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Fusion benchmark")
+    parser.add_argument("--pools", type=int, default=50)
+    parser.add_argument("--depth", type=int, default=1000)
+    parser.add_argument("--universe", type=int, default=20000)
+    parser.add_argument("--top-n", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    pools = _make_pools(random.Random(args.seed), args.pools, args.depth, args.universe)
+    legacy = _legacy_rrf(pools)
+    assert fuse_pools(pools, top_n=args.top_n) == legacy[:args.top_n], "fusion diverged"
+
+    def streaming() -> List[SearchResult]:
+        acc = FusionAccumulator("rrf")
+        for p in pools:
+            acc.add(p)
+        return acc.result(args.top_n)
+
+    rows = [
+        ("legacy rrf (full sort)", lambda: _legacy_rrf(pools)),
+        ("rrf full", lambda: fuse_pools(pools)),
+        (f"rrf top-{args.top_n}", lambda: fuse_pools(pools, top_n=args.top_n)),
+        (f"streaming top-{args.top_n}", streaming),
+        (f"combsum top-{args.top_n}", lambda: fuse_pools(pools, "combsum", top_n=args.top_n)),
+        (f"combmnz top-{args.top_n}", lambda: fuse_pools(pools, "combmnz", top_n=args.top_n)),
+    ]
+    print(f"pools={args.pools} depth={args.depth} unique_docs={len(legacy)}")
+    for name, fn in rows:
+        print(f"{name:>24}: {_ms(fn, args.repeat):8.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
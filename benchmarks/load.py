@@ -0,0 +1,144 @@
+"""Benchmark: end-to-end load test of rewrite_and_retrieve with per-stage percentiles and baseline gates.
+
+    PYTHONPATH=. python benchmarks/load.py --mode closed --concurrency 8 --requests 400
+    PYTHONPATH=. python benchmarks/load.py --mode open --rate 100 --duration 20 --llm-latency-ms 40
+    PYTHONPATH=. python benchmarks/load.py --baseline benchmarks/baselines/closed_default.json
+    PYTHONPATH=. python benchmarks/load.py --baseline benchmarks/baselines/closed_default.json --update-baseline
+    PYTHONPATH=. python benchmarks/load.py --telemetry-out /tmp/metrics.prom   # 开启埋点（度量其开销）
+
+退出码：存在超过阈值的回归时为 1（可直接用作 CI 门禁）。
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+
+from rag_query_rewriter.bench.load import run_closed_loop, run_open_loop
+from rag_query_rewriter.bench.report import (
+    compare_to_baseline, format_regressions, format_report, load_report, save_report, summarize,
+)
+from rag_query_rewriter.bench.stubs import LatencyLLM, LatencyModel, LatencyRetriever
+from rag_query_rewriter.bench.workload import generate_corpus, generate_queries, read_queries
+from rag_query_rewriter.config import AppConfig
+from rag_query_rewriter.llm.http import HTTPLLMClient
+from rag_query_rewriter.llm.stub_server import StubLLMServer
+from rag_query_rewriter.logging_setup import setup_logging
+from rag_query_rewriter.pipeline.orchestrator import rewrite_and_retrieve
+from rag_query_rewriter.retrievers.bm25 import BM25Retriever
+from rag_query_rewriter.retrievers.mock import MockRetriever
+from rag_query_rewriter.telemetry.core import get_telemetry
+from rag_query_rewriter.telemetry.export import write_telemetry
+
+_GATE_ARGS = {"threshold", "min_delta_ms", "gate_quantiles"}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="End-to-end load benchmark")
+    parser.add_argument("--mode", choices=["closed", "open"], default="closed")
+    parser.add_argument("--concurrency", type=int, default=8, help="Closed-loop workers")
+    parser.add_argument("--rate", type=float, default=50.0, help="Open-loop arrivals per second")
+    parser.add_argument("--arrivals", choices=["poisson", "uniform"], default="poisson")
+    parser.add_argument("--max-inflight", type=int, default=64, help="Open-loop concurrency cap")
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--duration", type=float, default=None, help="Seconds (overrides --requests)")
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--queries", type=int, default=200, help="Generated query-log size")
+    parser.add_argument("--queries-file", default=None, help="JSONL query log (q/ctx/qtype)")
+    parser.add_argument("--retriever", choices=["bm25", "mock"], default="bm25")
+    parser.add_argument("--docs", type=int, default=5000, help="Synthetic corpus size for bm25")
+    parser.add_argument("--llm-latency-ms", type=float, default=20.0)
+    parser.add_argument("--llm-jitter-ms", type=float, default=5.0)
+    parser.add_argument("--llm-p-slow", type=float, default=0.0, help="Probability of a slow call")
+    parser.add_argument("--llm-slow-ms", type=float, default=0.0, help="Extra latency of slow calls")
+    parser.add_argument("--llm-server", action="store_true",
+                        help="Serve the LLM over HTTP via the stub server instead of in-process")
+    parser.add_argument("--retriever-latency-ms", type=float, default=2.0)
+    parser.add_argument("--retriever-jitter-ms", type=float, default=1.0)
+    parser.add_argument("--config", default=None, help="JSON file with AppConfig overrides")
+    parser.add_argument("--telemetry-out", default=None,
+                        help="Enable spans/metrics during the run and write them here "
+                             "(.prom → Prometheus text, otherwise JSON without spans)")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--out", default=None, help="Write the JSON report here")
+    parser.add_argument("--baseline", default=None, help="Baseline report to gate against")
+    parser.add_argument("--update-baseline", action="store_true",
+                        help="Overwrite --baseline with this run instead of comparing")
+    parser.add_argument("--threshold", type=float, default=0.3,
+                        help="Allowed relative regression per stage/quantile")
+    parser.add_argument("--min-delta-ms", type=float, default=5.0,
+                        help="Ignore regressions smaller than this many milliseconds")
+    parser.add_argument("--gate-quantiles", default="p50,p95",
+                        help="Quantiles compared against the baseline (p99 needs many requests)")
+    args = parser.parse_args()
+    setup_logging("WARNING")
+
+    cfg = AppConfig()
+    if args.config:
+        with open(args.config, "r", encoding="utf-8") as f:
+            cfg = AppConfig.model_validate(json.load(f))
+    if args.telemetry_out:
+        cfg.telemetry.enabled = True
+    items = read_queries(args.queries_file) if args.queries_file \
+        else generate_queries(args.queries, seed=args.seed)
+    inner = BM25Retriever.from_docs(generate_corpus(args.docs)) if args.retriever == "bm25" \
+        else MockRetriever()
+    retriever = LatencyRetriever(inner, LatencyModel(args.retriever_latency_ms,
+                                                     args.retriever_jitter_ms, seed=args.seed))
+    llm_latency = LatencyModel(args.llm_latency_ms, args.llm_jitter_ms, args.llm_p_slow,
+                               args.llm_slow_ms, seed=args.seed)
+    server = None
+    if args.llm_server:
+        server = StubLLMServer(latency_ms=args.llm_latency_ms, jitter_ms=args.llm_jitter_ms)
+        server.start()
+        llm = HTTPLLMClient(server.url)
+    else:
+        llm = LatencyLLM(llm_latency)
+
+    def fn(item):
+        return rewrite_and_retrieve(item.q, item.ctx, cfg, llm, retriever)
+
+    try:
+        if args.mode == "closed":
+            result = run_closed_loop(fn, items, concurrency=args.concurrency,
+                                     requests=None if args.duration else args.requests,
+                                     duration_s=args.duration, warmup=args.warmup)
+        else:
+            result = run_open_loop(fn, items, rate_qps=args.rate,
+                                   requests=None if args.duration else args.requests,
+                                   duration_s=args.duration, max_inflight=args.max_inflight,
+                                   arrivals=args.arrivals, seed=args.seed, warmup=args.warmup)
+    finally:
+        if server is not None:
+            server.stop()
+
+    if args.telemetry_out:
+        write_telemetry(get_telemetry(cfg), args.telemetry_out,
+                        "prometheus" if args.telemetry_out.endswith(".prom") else "metrics-json")
+    report = summarize(result)
+    report["setup"] = {k: v for k, v in vars(args).items()
+                       if k not in ("out", "baseline", "update_baseline", "telemetry_out")}
+    report["setup"]["telemetry"] = bool(args.telemetry_out)
+    print(format_report(report))
+    if args.out:
+        save_report(report, args.out)
+    if args.baseline and args.update_baseline:
+        save_report(report, args.baseline)
+        print(f"baseline updated: {args.baseline}")
+    elif args.baseline:
+        baseline = load_report(args.baseline)
+        diff = sorted(k for k, v in report["setup"].items()
+                      if k not in _GATE_ARGS and baseline.get("setup", {}).get(k, v) != v)
+        if diff:
+            print(f"warning: setup differs from baseline in {diff}; comparison may be meaningless")
+        regressions = compare_to_baseline(report, baseline,
+                                          threshold=args.threshold, min_delta_ms=args.min_delta_ms,
+                                          quantiles=args.gate_quantiles.split(","))
+        if regressions:
+            print(format_regressions(regressions))
+            sys.exit(1)
+        print(f"no regressions vs {args.baseline} (threshold={args.threshold:.0%})")
+
+
+if __name__ == "__main__":
+    main()
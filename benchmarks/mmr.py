@@ -0,0 +1,81 @@
+"""Benchmark: incremental MMR vs. the legacy dense n×n implementation.
+
+    python benchmarks/mmr.py --sizes 1000 5000 20000 50000 --topk 8
+"""
+from __future__ import annotations
+
+import argparse
+import random
+import time
+from typing import List
+
+import numpy as np
+from sklearn.metrics.pairwise import cosine_similarity
+
+from benchmarks.bm25 import _sentence
+from rag_query_rewriter.fusion.fuser import mmr_select
+from rag_query_rewriter.utils.similarity import DocVectorCache, TfidfEmbedder
+
+
+def _legacy_mmr(query: str, docs: List[str], topk: int, lamb: float) -> List[int]:
+    """旧实现：每次重新拟合 TF-IDF，构建 n×n 稠密相似度矩阵，逐轮重算与已选集合的最大相似度。"""
+    X = TfidfEmbedder().fit_transform([query] + docs)
+    sim_qd = cosine_similarity(X[0], X[1:]).ravel()
+    sim_dd = cosine_similarity(X[1:], X[1:])
+    selected: List[int] = []
+    candidates = list(range(len(docs)))
+    while candidates and len(selected) < topk:
+        if not selected:
+            i = int(np.argmax(sim_qd[candidates]))
+        else:
+            max_sim = np.array([max(sim_dd[c][selected]) for c in candidates])
+            i = int(np.argmax(lamb * sim_qd[candidates] - (1.0 - lamb) * max_sim))
+        selected.append(candidates.pop(i))
+    return selected
+
+
+def _ms(fn) -> float:
+    t0 = time.perf_counter()
+    fn()
+    return (time.perf_counter() - t0) * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="MMR selection benchmark")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 5000, 20000, 50000])
+    parser.add_argument("--topk", type=int, default=8)
+    parser.add_argument("--lamb", type=float, default=0.7)
+    parser.add_argument("--legacy-max", type=int, default=5000,
+                        help="Skip the legacy n×n path above this size (memory grows as n²)")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    print(f"{'n':>7} {'legacy_ms':>10} {'refit_ms':>10} {'prefit_ms':>10} {'cached_ms':>10} "
+          f"{'same':>5}")
+    for n in args.sizes:
+        docs = [_sentence(rng, rng.randint(8, 30)) for _ in range(n)]
+        keys = list(range(n))
+        query = _sentence(rng, 4)
+
+        refit = _ms(lambda: mmr_select(query, docs, args.topk, args.lamb))
+        cache = DocVectorCache(TfidfEmbedder().fit([query] + docs), capacity=n)
+        prefit = _ms(lambda: mmr_select(query, docs, args.topk, args.lamb,
+                                        embedder=cache.embedder,
+                                        doc_vectors=cache.matrix(keys, docs)))
+        cached = _ms(lambda: mmr_select(query, docs, args.topk, args.lamb,
+                                        embedder=cache.embedder,
+                                        doc_vectors=cache.matrix(keys, docs)))
+        if n <= args.legacy_max:
+            picks: List[List[int]] = []
+            legacy = _ms(lambda: picks.append(_legacy_mmr(query, docs, args.topk, args.lamb)))
+            same = picks[0] == mmr_select(query, docs, args.topk, args.lamb)
+            print(f"{n:>7} {legacy:>10.1f} {refit:>10.1f} {prefit:>10.1f} {cached:>10.1f} "
+                  f"{str(same):>5}")
+        else:
+            print(f"{n:>7} {'skipped':>10} {refit:>10.1f} {prefit:>10.1f} {cached:>10.1f} "
+                  f"{'-':>5}")
+
+
+if __name__ == "__main__":
+    main()
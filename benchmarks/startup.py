@@ -0,0 +1,182 @@
+"""Benchmark: cold-start import cost per module (python -X importtime) and CLI startup time, with gates.
+
+    PYTHONPATH=. python benchmarks/startup.py
+    PYTHONPATH=. python benchmarks/startup.py --targets orchestrator --top 20
+    PYTHONPATH=. python benchmarks/startup.py --module rag_query_rewriter.retrievers.ann
+    PYTHONPATH=. python benchmarks/startup.py --baseline benchmarks/baselines/startup_default.json
+    PYTHONPATH=. python benchmarks/startup.py --baseline benchmarks/baselines/startup_default.json --update-baseline
+
+每个目标在全新子进程中运行 --repeat 次（python -X importtime），取中位数：
+    wall_ms   子进程总耗时（含解释器启动与 importtime 自身开销）
+    import_ms 各模块自身导入耗时之和
+    top       按导入耗时排序的模块：本包模块逐个列出，第三方按顶层包汇总
+退出码：目标加载了禁止的重依赖（FORBID）或 import_ms 相对基线回归超过阈值时为 1。
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_PKG = "rag_query_rewriter"
+_HEAVY = ("sklearn", "scipy", "dateparser", "yaml", "pydantic", "numpy")
+
+# 目标名 → python 之后的参数
+TARGETS: Dict[str, List[str]] = {
+    "fast": ["-c", f"import {_PKG}.rewrite.fast"],
+    "config": ["-c", f"import {_PKG}.config"],
+    "orchestrator": ["-c", f"import {_PKG}.pipeline.orchestrator"],
+    "batch": ["-c", f"import {_PKG}.pipeline.batch"],
+    "serving": ["-c", f"import {_PKG}.serving.prefork"],
+    "cli-help": ["cli.py", "--help"],
+    "cli-cqr": ["cli.py", "--log-level", "WARNING", "cqr", "--q", "它什么时候发布？",
+                "--ctx", "上文实体=GPT-5"],
+}
+
+# 导入即加载这些包视为回归（首次使用时才应导入）；cli-cqr 会加载别名表，因此允许 yaml
+_DEFERRED = ["sklearn", "scipy", "dateparser", "yaml"]
+FORBID: Dict[str, List[str]] = {
+    "fast": _DEFERRED + ["pydantic", "numpy"],
+    "config": _DEFERRED + ["numpy"],
+    "orchestrator": _DEFERRED,
+    "batch": _DEFERRED,
+    "serving": _DEFERRED,
+    "cli-help": _DEFERRED + ["pydantic", "numpy"],
+    "cli-cqr": ["sklearn", "scipy", "pydantic", "numpy"],
+}
+
+
+def parse_importtime(stderr: str) -> Dict[str, float]:
+    """解析 -X importtime 输出 → {模块名: 自身导入耗时 ms}（每个模块只出现一次）。"""
+    out: Dict[str, float] = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, _, name = line[len("import time:"):].split("|", 2)
+        out[name.strip()] = int(self_us) / 1000.0
+    return out
+
+
+def _group(module: str) -> str:
+    return module if module.split(".")[0] == _PKG else module.split(".")[0]
+
+
+def run_target(argv: List[str], repeat: int) -> Tuple[float, Dict[str, float]]:
+    """在全新子进程中运行 repeat 次，返回 (中位 wall_ms, {模块: 中位自身耗时 ms})。"""
+    env = {**os.environ, "PYTHONPATH": _ROOT + os.pathsep + os.environ.get("PYTHONPATH", "")}
+    walls: List[float] = []
+    samples: Dict[str, List[float]] = defaultdict(list)
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        proc = subprocess.run([sys.executable, "-X", "importtime", *argv], cwd=_ROOT, env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+        walls.append((time.perf_counter() - t0) * 1000)
+        if proc.returncode != 0:
+            tail = "\n".join(ln for ln in proc.stderr.splitlines()
+                             if not ln.startswith("import time:"))[-2000:]
+            raise RuntimeError(f"{' '.join(argv)} exited with {proc.returncode}:\n{tail}")
+        for mod, ms in parse_importtime(proc.stderr).items():
+            samples[mod].append(ms)
+    return statistics.median(walls), {m: statistics.median(v) for m, v in samples.items()}
+
+
+def summarize(name: str, wall_ms: float, modules: Dict[str, float], top: int) -> Dict[str, object]:
+    groups: Dict[str, float] = defaultdict(float)
+    for mod, ms in modules.items():
+        groups[_group(mod)] += ms
+    roots = {m.split(".")[0] for m in modules}
+    return {
+        "wall_ms": round(wall_ms, 1),
+        "import_ms": round(sum(modules.values()), 1),
+        "modules": len(modules),
+        "heavy": [h for h in _HEAVY if h in roots],
+        "top": [[g, round(ms, 1)] for g, ms in
+                sorted(groups.items(), key=lambda kv: -kv[1])[:top]],
+        "forbidden": sorted(set(FORBID.get(name, [])) & roots),
+    }
+
+
+def format_report(report: Dict[str, Dict[str, object]]) -> str:
+    lines = [f"{'target':<14} {'wall_ms':>9} {'import_ms':>10} {'modules':>8}  heavy"]
+    for name, r in report.items():
+        lines.append(f"{name:<14} {r['wall_ms']:>9.1f} {r['import_ms']:>10.1f} {r['modules']:>8}"
+                     f"  {','.join(r['heavy']) or '-'}")
+    for name, r in report.items():
+        lines.append(f"\n[{name}] top modules by import time (ms)")
+        lines.extend(f"  {ms:>9.1f}  {g}" for g, ms in r["top"])
+    return "\n".join(lines)
+
+
+def compare_to_baseline(report: Dict[str, Dict[str, object]], baseline: Dict[str, Dict[str, object]],
+                        threshold: float, min_delta_ms: float) -> List[str]:
+    """import_ms 同时超过相对阈值与绝对下限的目标（只比较两边都有的目标）。"""
+    out = []
+    for name, r in report.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        cur, ref = float(r["import_ms"]), float(base["import_ms"])
+        if cur > ref * (1 + threshold) and cur - ref > min_delta_ms:
+            out.append(f"{name}: import_ms {ref:.1f} -> {cur:.1f} (+{(cur / ref - 1):.0%})")
+    return out
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Startup / import-time benchmark")
+    parser.add_argument("--targets", nargs="+", choices=sorted(TARGETS), default=list(TARGETS))
+    parser.add_argument("--module", action="append", default=[],
+                        help="Extra module to measure as 'import <module>' (repeatable)")
+    parser.add_argument("--repeat", type=int, default=5, help="Fresh processes per target")
+    parser.add_argument("--top", type=int, default=8, help="Modules listed per target")
+    parser.add_argument("--out", default=None, help="Write the JSON report here")
+    parser.add_argument("--baseline", default=None, help="Baseline report to gate against")
+    parser.add_argument("--update-baseline", action="store_true",
+                        help="Overwrite --baseline with this run instead of comparing")
+    parser.add_argument("--threshold", type=float, default=0.5,
+                        help="Relative import_ms increase counted as a regression")
+    parser.add_argument("--min-delta-ms", type=float, default=30.0,
+                        help="Ignore regressions smaller than this (absolute)")
+    args = parser.parse_args()
+
+    targets = {name: TARGETS[name] for name in args.targets}
+    targets.update({m: ["-c", f"import {m}"] for m in args.module})
+    report = {}
+    for name, argv in targets.items():
+        wall_ms, modules = run_target(argv, args.repeat)
+        report[name] = summarize(name, wall_ms, modules, args.top)
+    print(format_report(report))
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+    failed = False
+    forbidden = {name: r["forbidden"] for name, r in report.items() if r["forbidden"]}
+    if forbidden:
+        print(f"\nheavy dependencies imported eagerly: {forbidden}")
+        failed = True
+    if args.baseline and args.update_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"baseline updated: {args.baseline}")
+    elif args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare_to_baseline(report, baseline, args.threshold, args.min_delta_ms)
+        if regressions:
+            print("\nimport-time regressions:\n  " + "\n  ".join(regressions))
+            failed = True
+        else:
+            print(f"no regressions vs {args.baseline} (threshold={args.threshold:.0%})")
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
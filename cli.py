@@ -2,12 +2,13 @@
 from __future__ import annotations
 
 import argparse
+import json
+import sys
 from loguru import logger
 from rag_query_rewriter.logging_setup import setup_logging
-from rag_query_rewriter.config import AppConfig
-from rag_query_rewriter.llm.dummy import DummyLLM
-from rag_query_rewriter.retrievers.mock import MockRetriever
-from rag_query_rewriter.pipeline.orchestrator import rewrite_and_retrieve
+
+# 子命令的依赖在分支内导入：rqw 常作为短生命周期进程运行，只为用到的子命令付出导入代价
+# （cqr 不导入 pydantic / NumPy，构建与检索子命令才导入 scikit-learn，见 benchmarks/startup.py）
 
 
 def main() -> None:
@@ -26,18 +27,164 @@ def main() -> None:
     p2.add_argument("--ctx", default="", help="History brief")
     p2.add_argument("--alias", default="examples/terms_alias.yaml", help="Alias table yaml path")
 
+    p8 = sub.add_parser("cqr", help="Normalize + CQR only (no retrieval, LLM or config; fast startup)")
+    p8.add_argument("--q", default=None, help="User query")
+    p8.add_argument("--ctx", default="", help="History brief")
+    p8.add_argument("--in", dest="inp", default=None,
+                    help="JSONL file of {q, ctx} items instead of --q (one JSON result per line)")
+    p8.add_argument("--out", default=None, help="Output JSONL path (default: stdout)")
+    p8.add_argument("--alias", default="examples/terms_alias.yaml", help="Alias table yaml path")
+
+    p7 = sub.add_parser("serve", help="Serve rewrite / rewrite+retrieve over HTTP (JSON)")
+    p7.add_argument("--host", default=None, help="Bind address (default: server.host)")
+    p7.add_argument("--port", type=int, default=None, help="Bind port (default: server.port)")
+    p7.add_argument("--workers", type=int, default=None,
+                    help="Pre-forked worker processes (default: server.workers)")
+    p7.add_argument("--config", default=None,
+                    help="AppConfig JSON file; re-read on SIGHUP or POST /admin/reload")
+    p7.add_argument("--alias", default=None, help="Alias table yaml path (overrides --config)")
+
+    for p in (p1, p2, p7):
+        p.add_argument("--index", default=None, help="Optional mmap BM25 index dir (see build-index)")
+        p.add_argument("--ann-index", default=None,
+                       help="Optional IVF vector index dir (see build-ann-index); "
+                            "combined with --index into a hybrid BM25+dense retriever")
+        p.add_argument("--nprobe", type=int, default=8, help="IVF lists scanned per query")
+        p.add_argument("--llm-cache", default=None,
+                       help="Optional SQLite file memoizing LLM calls across invocations")
+    for p in (p1, p2):
+        p.add_argument("--telemetry-out", default=None,
+                       help="Enable stage spans/metrics and write them to this file after the run")
+        p.add_argument("--telemetry-format", choices=["json", "prometheus", "otlp"],
+                       default="json", help="Format of --telemetry-out")
+
+    p3 = sub.add_parser("build-index", help="Build a memory-mapped BM25 index from a JSONL corpus")
+    p3.add_argument("--corpus", required=True, help="JSONL corpus path (one document per line)")
+    p3.add_argument("--out", required=True, help="Output index directory")
+    p3.add_argument("--id-field", default="id", help="Document id field")
+    p3.add_argument("--text-field", default="text", help="Document text field")
+    p3.add_argument("--meta-fields", default=None,
+                    help="Comma-separated metadata fields (default: all other scalar fields)")
+
+    p6 = sub.add_parser("build-ann-index", help="Build an IVF vector index from a JSONL corpus")
+    p6.add_argument("--corpus", required=True, help="JSONL corpus path (one document per line)")
+    p6.add_argument("--out", required=True, help="Output index directory")
+    p6.add_argument("--id-field", default="id", help="Document id field")
+    p6.add_argument("--text-field", default="text", help="Document text field")
+    p6.add_argument("--meta-fields", default=None,
+                    help="Comma-separated metadata fields (default: all other scalar fields)")
+    p6.add_argument("--lists", type=int, default=None, help="Number of IVF lists (default ~4*sqrt(N))")
+    p6.add_argument("--quantize", choices=["int8", "float32"], default="int8")
+    p6.add_argument("--embedding", choices=["hashing", "local"], default="hashing",
+                    help="Embedding backend (recorded in the index manifest)")
+    p6.add_argument("--hashing-features", type=int, default=None,
+                    help="Hashing dimension (default: embedding.hashing_features)")
+    p6.add_argument("--model-path", default=None, help="Local model dir for --embedding local")
+
+    p4 = sub.add_parser("dedup-log", help="Stream near-duplicate filtering of logged rewrites")
+    p4.add_argument("--in", dest="inp", required=True, help="Input file, one rewrite per line")
+    p4.add_argument("--out", required=True, help="Output file for kept lines")
+    p4.add_argument("--thr", type=float, default=None,
+                    help="Cosine threshold (default and semantics: router.dedup_cosine_thr)")
+
+    p5 = sub.add_parser("train-router", help="Train the adaptive router's strategy classifier")
+    p5.add_argument("--in", dest="inp", required=True,
+                    help="JSONL log written via router.adaptive.log_path")
+    p5.add_argument("--out", required=True,
+                    help="Output classifier JSON (router.adaptive.classifier_path)")
+
     args = parser.parse_args()
 
     setup_logging(args.log_level, file_path=args.log_file)
-    cfg = AppConfig()
-    cfg.normalizer.alias_table_path = args.alias
 
-    llm = DummyLLM()
-    retriever = MockRetriever()
+    if args.cmd == "cqr":
+        from rag_query_rewriter.rewrite.fast import normalize_and_cqr
+        if (args.q is None) == (args.inp is None):
+            parser.error("cqr needs exactly one of --q / --in")
+        if args.inp:
+            with open(args.inp, "r", encoding="utf-8") as f:
+                items = [json.loads(ln) for ln in f if ln.strip()]
+        else:
+            items = [{"q": args.q, "ctx": args.ctx}]
+        fout = open(args.out, "w", encoding="utf-8") if args.out else sys.stdout
+        try:
+            for it in items:
+                out = normalize_and_cqr(it["q"], it.get("ctx", ""), args.alias)
+                fout.write(json.dumps(out, ensure_ascii=False) + "\n")
+        finally:
+            if fout is not sys.stdout:
+                fout.close()
+        return
+    if args.cmd == "build-index":
+        from rag_query_rewriter.retrievers.mmap_index import build_mmap_index
+        meta_fields = args.meta_fields.split(",") if args.meta_fields else None
+        manifest = build_mmap_index(args.corpus, args.out, id_field=args.id_field,
+                                    text_field=args.text_field, meta_fields=meta_fields)
+        logger.success("索引构建完成：{}", manifest)
+        return
+    if args.cmd == "build-ann-index":
+        from rag_query_rewriter.config import EmbeddingConfig
+        from rag_query_rewriter.retrievers.ann import build_ivf_index
+        from rag_query_rewriter.utils.embedding import build_embedder
+        opts = {"backend": args.embedding, "model_path": args.model_path}
+        if args.hashing_features is not None:
+            opts["hashing_features"] = args.hashing_features
+        ecfg = EmbeddingConfig(**opts)
+        meta_fields = args.meta_fields.split(",") if args.meta_fields else None
+        manifest = build_ivf_index(
+            args.corpus, args.out, build_embedder(ecfg), id_field=args.id_field,
+            text_field=args.text_field, meta_fields=meta_fields, n_lists=args.lists,
+            quantize=args.quantize, batch_size=ecfg.batch_size,
+            embedding=ecfg.model_dump(include={"backend", "model_path", "hashing_features"}))
+        logger.success("向量索引构建完成：{}", manifest)
+        return
+    if args.cmd == "dedup-log":
+        from rag_query_rewriter.config import AppConfig
+        from rag_query_rewriter.utils.near_dup import SimHashDeduper
+        deduper = SimHashDeduper(args.thr if args.thr is not None
+                                 else AppConfig().router.dedup_cosine_thr)
+        kept = 0
+        with open(args.inp, "r", encoding="utf-8") as fin, \
+                open(args.out, "w", encoding="utf-8") as fout:
+            for line in deduper.iter_dedup(ln.rstrip("\n") for ln in fin):
+                fout.write(line + "\n")
+                kept += 1
+        logger.success("去重完成：输入={} 保留={}", deduper.seen, kept)
+        return
+    if args.cmd == "train-router":
+        from rag_query_rewriter.rewrite.adaptive import StrategyClassifier
+        with open(args.inp, "r", encoding="utf-8") as f:
+            records = [json.loads(ln) for ln in f if ln.strip()]
+        clf = StrategyClassifier.fit(records)
+        clf.save(args.out)
+        logger.success("路由分类器训练完成：样本={} 策略={}", len(records), sorted(clf.models))
+        return
+
+    from rag_query_rewriter.serving.service import (
+        ServiceOptions, build_llm, build_retriever, load_config,
+    )
+    options = ServiceOptions(config_path=getattr(args, "config", None), alias_path=args.alias,
+                             index=args.index, ann_index=args.ann_index, nprobe=args.nprobe,
+                             llm_cache=args.llm_cache)
+    if args.cmd == "serve":
+        from rag_query_rewriter.serving.prefork import serve
+        serve(options, host=args.host, port=args.port, workers=args.workers)
+        return
+
+    cfg = load_config(options)
+    cfg.telemetry.enabled = bool(args.telemetry_out)
+    llm = build_llm(cfg)
+    retriever = build_retriever(cfg, options)
 
     if args.cmd in {"rewrite", "e2e"}:
+        from rag_query_rewriter.pipeline.orchestrator import rewrite_and_retrieve
         out = rewrite_and_retrieve(q=args.q, ctx=args.ctx, cfg=cfg, llm=llm, retriever=retriever)
         logger.success("改写完成：\n{}", out)
+        if args.telemetry_out:
+            from rag_query_rewriter.telemetry.core import get_telemetry
+            from rag_query_rewriter.telemetry.export import write_telemetry
+            write_telemetry(get_telemetry(cfg), args.telemetry_out, args.telemetry_format)
+            logger.info("埋点数据已写入：{}", args.telemetry_out)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,143 @@
+"""Closed- and open-loop load generators recording end-to-end and per-stage latency."""
+from __future__ import annotations
+
+from concurrent.futures import ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Sequence
+import itertools
+import random
+import threading
+import time
+
+from loguru import logger
+
+from .workload import QueryItem
+
+RequestFn = Callable[[QueryItem], Dict[str, Any]]
+
+
+@dataclass
+class Sample:
+    """单个请求的测量值。"""
+    qtype: str
+    latency_ms: float  # 端到端（开环时从计划到达时刻算起，含排队）
+    service_ms: float  # 实际执行耗时（不含排队）
+    stage_ms: Dict[str, float] = field(default_factory=dict)
+    error: Optional[str] = None
+
+
+@dataclass
+class LoadResult:
+    """一次压测的原始结果。"""
+    mode: str
+    samples: List[Sample]
+    wall_s: float
+    params: Dict[str, Any] = field(default_factory=dict)
+
+    @property
+    def errors(self) -> int:
+        return sum(s.error is not None for s in self.samples)
+
+
+def _measure(fn: RequestFn, item: QueryItem, t_sched: float) -> Sample:
+    t0 = time.perf_counter()
+    try:
+        out = fn(item)
+        err = None
+    except Exception as exc:  # noqa: BLE001
+        out, err = {}, f"{type(exc).__name__}: {exc}"
+    t1 = time.perf_counter()
+    stage_ms = dict((out.get("metrics") or {}).get("stage_ms") or {})
+    return Sample(item.qtype, (t1 - t_sched) * 1000, (t1 - t0) * 1000, stage_ms, err)
+
+
+def run_closed_loop(fn: RequestFn, items: Sequence[QueryItem], concurrency: int = 8,
+                    requests: Optional[int] = None, duration_s: Optional[float] = None,
+                    warmup: int = 0) -> LoadResult:
+    """闭环压测：concurrency 个工作线程各自“请求返回后立即发下一个”，度量饱和吞吐。
+
+    中文说明：
+        - 按 items 顺序循环取查询；requests 与 duration_s 至少给一个，先到者结束；
+        - warmup 条请求先串行执行且不计入结果（填充缓存 / JIT / 连接池）。
+    """
+    if concurrency < 1 or not items:
+        raise ValueError("concurrency must be >= 1 and items non-empty")
+    if requests is None and duration_s is None:
+        raise ValueError("either requests or duration_s is required")
+    for item in itertools.islice(itertools.cycle(items), warmup):
+        fn(item)
+    counter = itertools.count()
+    samples: List[Sample] = []
+    lock = threading.Lock()
+    t_start = time.perf_counter()
+    deadline = t_start + duration_s if duration_s is not None else None
+
+    def worker() -> None:
+        while True:
+            i = next(counter)
+            if (requests is not None and i >= requests) \
+                    or (deadline is not None and time.perf_counter() >= deadline):
+                return
+            s = _measure(fn, items[i % len(items)], time.perf_counter())
+            with lock:
+                samples.append(s)
+
+    threads = [threading.Thread(target=worker, name=f"rqw-load-{k}", daemon=True)
+               for k in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - t_start
+    return LoadResult("closed", samples, wall,
+                      {"concurrency": concurrency, "requests": requests, "duration_s": duration_s})
+
+
+def run_open_loop(fn: RequestFn, items: Sequence[QueryItem], rate_qps: float,
+                  requests: Optional[int] = None, duration_s: Optional[float] = None,
+                  max_inflight: int = 64, arrivals: str = "poisson",
+                  seed: Optional[int] = None, warmup: int = 0) -> LoadResult:
+    """开环压测：按固定速率（泊松或均匀间隔）到达，与服务快慢无关，度量给定负载下的尾延迟。
+
+    中文说明：
+        - 延迟从计划到达时刻算起：请求因工作线程占满而排队的时间计入延迟，
+          避免闭环压测的“协同遗漏”（慢请求压低发压速率、掩盖尾延迟）；
+        - max_inflight 为并发执行上限，超出部分在线程池队列中等待；
+        - 发压线程落后于计划时立即补发，仍按计划时刻计算延迟（最大落后量记入 params）。
+    """
+    if rate_qps <= 0 or not items:
+        raise ValueError("rate_qps must be positive and items non-empty")
+    if requests is None and duration_s is None:
+        raise ValueError("either requests or duration_s is required")
+    if arrivals not in ("poisson", "uniform"):
+        raise ValueError(f"unknown arrival process: {arrivals}")
+    for item in itertools.islice(itertools.cycle(items), warmup):
+        fn(item)
+    rng = random.Random(seed)
+    pool = ThreadPoolExecutor(max_workers=max_inflight, thread_name_prefix="rqw-load")
+    futures = []
+    t_start = time.perf_counter()
+    t_next = t_start
+    i = 0
+    max_lag = 0.0
+    try:
+        while (requests is None or i < requests) \
+                and (duration_s is None or t_next - t_start < duration_s):
+            delay = t_next - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                max_lag = max(max_lag, -delay)
+            futures.append(pool.submit(_measure, fn, items[i % len(items)], t_next))
+            i += 1
+            t_next += rng.expovariate(rate_qps) if arrivals == "poisson" else 1.0 / rate_qps
+        wait(futures)
+    finally:
+        pool.shutdown(wait=True)
+    wall = time.perf_counter() - t_start
+    if max_lag > 0.1:
+        logger.warning("开环发压最多落后计划 {:.0f}ms，发压线程本身成为瓶颈", max_lag * 1000)
+    return LoadResult("open", [f.result() for f in futures], wall,
+                      {"rate_qps": rate_qps, "requests": requests, "duration_s": duration_s,
+                       "max_inflight": max_inflight, "arrivals": arrivals,
+                       "max_schedule_lag_ms": round(max_lag * 1000, 3)})
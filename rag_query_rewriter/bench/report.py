@@ -0,0 +1,125 @@
+"""Latency percentile reports and baseline regression gates for load-test results."""
+from __future__ import annotations
+
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+import json
+import os
+
+import numpy as np
+
+from .load import LoadResult
+
+QUANTILES = (50, 95, 99)
+
+
+def percentiles(values: Sequence[float]) -> Dict[str, float]:
+    """p50 / p95 / p99 / mean / n（毫秒，保留三位小数）。"""
+    if not values:
+        return {"n": 0}
+    arr = np.asarray(values, dtype=np.float64)
+    out = {f"p{q}": round(float(v), 3) for q, v in zip(QUANTILES, np.percentile(arr, QUANTILES))}
+    out.update(mean=round(float(arr.mean()), 3), n=int(arr.size))
+    return out
+
+
+def summarize(result: LoadResult) -> Dict[str, Any]:
+    """压测结果 → 报告：吞吐、错误率、端到端与逐阶段分位数、按问句类型的端到端分位数。
+
+    中文说明：失败请求计入错误率，不参与延迟分位数；阶段只统计实际执行过的请求。
+    """
+    ok = [s for s in result.samples if s.error is None]
+    stages: Dict[str, List[float]] = {}
+    by_type: Dict[str, List[float]] = {}
+    for s in ok:
+        for name, ms in s.stage_ms.items():
+            stages.setdefault(name, []).append(ms)
+        by_type.setdefault(s.qtype, []).append(s.latency_ms)
+    n = len(result.samples)
+    return {
+        "mode": result.mode,
+        "params": result.params,
+        "requests": n,
+        "errors": result.errors,
+        "error_rate": round(result.errors / n, 4) if n else 0.0,
+        "throughput_qps": round(len(ok) / result.wall_s, 3) if result.wall_s > 0 else 0.0,
+        "latency": {
+            "total": percentiles([s.latency_ms for s in ok]),
+            "service": percentiles([s.service_ms for s in ok]),
+            **{f"stage:{k}": percentiles(v) for k, v in sorted(stages.items())},
+        },
+        "by_type": {k: percentiles(v) for k, v in sorted(by_type.items())},
+    }
+
+
+def save_report(report: Dict[str, Any], path: str) -> None:
+    d = os.path.dirname(path)
+    if d:
+        os.makedirs(d, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+def load_report(path: str) -> Dict[str, Any]:
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def compare_to_baseline(report: Dict[str, Any], baseline: Dict[str, Any],
+                        threshold: float = 0.2, min_delta_ms: float = 5.0,
+                        quantiles: Iterable[str] = ("p50", "p95"),
+                        metrics: Optional[Iterable[str]] = None) -> List[Dict[str, Any]]:
+    """与基线比较，返回回归项列表（为空表示通过）。
+
+    中文说明：
+        - 某指标的某分位数同时满足“超过基线 (1 + threshold) 倍”与“绝对增量 > min_delta_ms”
+          时记为回归；绝对阈值避免亚毫秒级阶段的噪声误报；
+        - metrics 缺省比较基线中出现的全部指标（total / service / stage:*），只在一侧出现的忽略；
+        - 错误率上升超过 threshold（绝对值）与吞吐下降超过 threshold（相对值）同样记为回归。
+    """
+    qs = list(quantiles)
+    cur_lat, base_lat = report.get("latency", {}), baseline.get("latency", {})
+    names = list(metrics) if metrics is not None else list(base_lat)
+    out: List[Dict[str, Any]] = []
+    for name in names:
+        cur, base = cur_lat.get(name), base_lat.get(name)
+        if not cur or not base:
+            continue
+        for q in qs:
+            c, b = cur.get(q), base.get(q)
+            if c is None or b is None:
+                continue
+            if c > b * (1.0 + threshold) and c - b > min_delta_ms:
+                out.append({"metric": name, "quantile": q, "baseline": b, "current": c,
+                            "ratio": round(c / b, 3) if b > 0 else float("inf")})
+    if report.get("error_rate", 0.0) > baseline.get("error_rate", 0.0) + threshold:
+        out.append({"metric": "error_rate", "quantile": None,
+                    "baseline": baseline.get("error_rate", 0.0), "current": report["error_rate"],
+                    "ratio": None})
+    b_qps, c_qps = baseline.get("throughput_qps"), report.get("throughput_qps")
+    if report.get("mode") == baseline.get("mode") == "closed" and b_qps and c_qps is not None \
+            and c_qps < b_qps * (1.0 - threshold):
+        out.append({"metric": "throughput_qps", "quantile": None, "baseline": b_qps,
+                    "current": c_qps, "ratio": round(c_qps / b_qps, 3)})
+    return out
+
+
+def format_report(report: Dict[str, Any]) -> str:
+    """人类可读的分位数表格。"""
+    lines = [f"mode={report['mode']} requests={report['requests']} "
+             f"errors={report['errors']} throughput={report['throughput_qps']:.1f} qps"]
+    lines.append(f"{'metric':<24}{'p50':>10}{'p95':>10}{'p99':>10}{'mean':>10}{'n':>8}")
+    rows = list(report["latency"].items()) + [(f"type:{k}", v)
+                                              for k, v in report["by_type"].items()]
+    for name, p in rows:
+        if not p.get("n"):
+            continue
+        lines.append(f"{name:<24}{p['p50']:>10.2f}{p['p95']:>10.2f}{p['p99']:>10.2f}"
+                     f"{p['mean']:>10.2f}{p['n']:>8}")
+    return "\n".join(lines)
+
+
+def format_regressions(regressions: Sequence[Dict[str, Any]]) -> str:
+    return "\n".join(
+        f"REGRESSION {r['metric']}{'/' + r['quantile'] if r['quantile'] else ''}: "
+        f"baseline={r['baseline']} current={r['current']} ratio={r['ratio']}"
+        for r in regressions)
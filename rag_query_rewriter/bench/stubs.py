@@ -0,0 +1,116 @@
+"""Latency-injecting LLM and retriever wrappers for load tests."""
+from __future__ import annotations
+
+from typing import Any, Dict, List, Optional
+import random
+import threading
+import time
+
+from ..llm.base import LLMClient
+from ..llm.dummy import DummyLLM
+from ..retrievers.base import Retriever, SearchResult
+
+
+class LatencyModel:
+    """注入延迟的分布：基础延迟 ± 均匀抖动，外加以 p_slow 概率出现的长尾延迟。
+
+    中文说明：
+        - sample() 返回秒；mean_ms 为 0 且 p_slow 为 0 时不休眠；
+        - 带 seed 时抽样序列确定（线程间共享一个加锁的随机源）。
+    """
+
+    def __init__(self, mean_ms: float = 0.0, jitter_ms: float = 0.0, p_slow: float = 0.0,
+                 slow_ms: float = 0.0, seed: Optional[int] = None) -> None:
+        if mean_ms < 0 or jitter_ms < 0 or slow_ms < 0 or not 0.0 <= p_slow <= 1.0:
+            raise ValueError("invalid latency model parameters")
+        self.mean_ms, self.jitter_ms = mean_ms, jitter_ms
+        self.p_slow, self.slow_ms = p_slow, slow_ms
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def sample(self) -> float:
+        with self._lock:
+            ms = self.mean_ms + self._rng.uniform(-self.jitter_ms, self.jitter_ms)
+            if self.p_slow and self._rng.random() < self.p_slow:
+                ms += self.slow_ms
+        return max(ms, 0.0) / 1000.0
+
+    def sleep(self) -> None:
+        s = self.sample()
+        if s > 0:
+            time.sleep(s)
+
+    def describe(self) -> Dict[str, float]:
+        return {"mean_ms": self.mean_ms, "jitter_ms": self.jitter_ms,
+                "p_slow": self.p_slow, "slow_ms": self.slow_ms}
+
+
+class LatencyLLM(LLMClient):
+    """在被包装 LLM（默认 DummyLLM）的每次调用前注入延迟；批量调用按一次往返计。"""
+
+    def __init__(self, latency: LatencyModel, inner: Optional[LLMClient] = None) -> None:
+        self.latency = latency
+        self.inner = inner if inner is not None else DummyLLM()
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def _wait(self) -> None:
+        with self._lock:
+            self.calls += 1
+        self.latency.sleep()
+
+    def generate(self, prompt: str, max_tokens: int = 256) -> str:
+        self._wait()
+        return self.inner.generate(prompt, max_tokens=max_tokens)
+
+    def generate_lines(self, prompt: str, n_lines: int = 6,
+                       max_tokens: int = 512) -> List[str]:
+        self._wait()
+        return self.inner.generate_lines(prompt, n_lines=n_lines, max_tokens=max_tokens)
+
+    def generate_json(self, prompt: str, schema_hint: Optional[str] = None,
+                      max_tokens: int = 512) -> Any:
+        self._wait()
+        return self.inner.generate_json(prompt, schema_hint=schema_hint, max_tokens=max_tokens)
+
+    def generate_batch(self, prompts: List[str], max_tokens: int = 256) -> List[str]:
+        self._wait()
+        return self.inner.generate_batch(prompts, max_tokens=max_tokens)
+
+    def generate_lines_batch(self, prompts: List[str], n_lines: int = 6,
+                             max_tokens: int = 512) -> List[List[str]]:
+        self._wait()
+        return self.inner.generate_lines_batch(prompts, n_lines=n_lines, max_tokens=max_tokens)
+
+    def generate_json_batch(self, prompts: List[str], schema_hint: Optional[str] = None,
+                            max_tokens: int = 512) -> List[Any]:
+        self._wait()
+        return self.inner.generate_json_batch(prompts, schema_hint=schema_hint,
+                                              max_tokens=max_tokens)
+
+
+class LatencyRetriever(Retriever):
+    """在被包装检索器的每次调用前注入延迟；search_many 按一次往返加 per_query_ms × 条数计。
+
+    与被包装检索器同名，共享执行器隔离舱。
+    """
+
+    def __init__(self, inner: Retriever, latency: LatencyModel, per_query_ms: float = 0.0) -> None:
+        self.inner = inner
+        self.latency = latency
+        self.per_query_ms = per_query_ms
+        self.name = getattr(inner, "name", type(inner).__name__)
+
+    def search(self, query: str, topk: int = 10,
+               filters: Optional[Dict[str, Any]] = None) -> List[SearchResult]:
+        self.latency.sleep()
+        if self.per_query_ms:
+            time.sleep(self.per_query_ms / 1000.0)
+        return self.inner.search(query, topk=topk, filters=filters)
+
+    def search_many(self, queries: List[str], topk: int = 10,
+                    filters: Optional[Dict[str, Any]] = None) -> List[List[SearchResult]]:
+        self.latency.sleep()
+        if self.per_query_ms and queries:
+            time.sleep(self.per_query_ms * len(queries) / 1000.0)
+        return self.inner.search_many(queries, topk=topk, filters=filters)
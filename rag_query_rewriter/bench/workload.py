@@ -0,0 +1,118 @@
+"""Synthetic corpus and query-log generator covering every rewrite router branch."""
+from __future__ import annotations
+
+from collections import Counter
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Optional
+import json
+import random
+
+from ..config import AppConfig
+from ..rewrite.router import choose_strategy
+
+_HAN_WORDS = ["版本", "发布", "记录", "特性", "时间线", "更新", "说明", "修复", "问题", "优化",
+              "性能", "技术", "规格", "接口", "限额", "兼容", "常见", "解答", "对比", "差异",
+              "分析", "模型", "训练", "推理", "部署", "数据", "安全", "权限", "日志", "监控", "告警"]
+_EN_WORDS = ["api", "release", "spec", "faq", "latency", "gpu", "cache", "index", "query",
+             "token", "model", "deploy", "sdk", "cli", "http", "grpc", "json"]
+_ENTITIES = ["GPT-5", "K8s", "RAG 平台", "检索服务", "推理引擎", "SDK v3", "向量库", "网关"]
+_TOPICS = ["接口限额", "部署方式", "性能优化", "权限模型", "日志监控", "兼容性", "缓存策略", "告警规则"]
+_DOC_TYPES = ["release", "spec", "faq", "compare", "guide"]
+_YEARS = [str(y) for y in range(2019, 2026)]
+
+# 问句类型 → 主要触发的路由分支（启发式路由，见 rewrite.router.choose_strategy）：
+#   short_fact  短事实问句            → MultiQuery + HyDE
+#   followup    依赖上文的指代问句    → CQR 补全后 MultiQuery + HyDE
+#   compare     对比型问句            → Decompose（+ PRF）
+#   time        含年份/月份的问句     → Self-Query + MultiQuery（+ PRF）
+#   long        长描述型问句          → PRF
+QUERY_TYPES = ("short_fact", "followup", "compare", "time", "long")
+DEFAULT_MIX = {"short_fact": 0.25, "followup": 0.15, "compare": 0.2, "time": 0.2, "long": 0.2}
+
+
+@dataclass
+class QueryItem:
+    """查询日志中的一条：问句、对话上下文摘要与问句类型。"""
+    q: str
+    ctx: str
+    qtype: str
+
+    def to_dict(self) -> Dict[str, str]:
+        return {"q": self.q, "ctx": self.ctx, "qtype": self.qtype}
+
+
+def _mixed_sentence(rng: random.Random, n_words: int) -> str:
+    return " ".join(rng.choice(_EN_WORDS) if rng.random() < 0.3 else rng.choice(_HAN_WORDS)
+                    for _ in range(n_words))
+
+
+def generate_corpus(n_docs: int, seed: int = 13) -> List[Dict[str, Any]]:
+    """中英混合合成语料：每篇含 entity/topic 正文与 year/type 元数据（供 Self-Query 过滤）。"""
+    rng = random.Random(seed)
+    docs = []
+    for i in range(n_docs):
+        ent, topic, year = rng.choice(_ENTITIES), rng.choice(_TOPICS), rng.choice(_YEARS)
+        text = f"{year} 年 {ent} {topic}：{_mixed_sentence(rng, rng.randint(6, 30))}"
+        docs.append({"id": f"d{i}", "text": text, "year": year, "type": rng.choice(_DOC_TYPES)})
+    return docs
+
+
+def write_jsonl(path: str, rows: Iterable[Dict[str, Any]]) -> None:
+    with open(path, "w", encoding="utf-8") as f:
+        for row in rows:
+            f.write(json.dumps(row, ensure_ascii=False) + "\n")
+
+
+def _make_query(rng: random.Random, qtype: str) -> QueryItem:
+    ent, topic = rng.choice(_ENTITIES), rng.choice(_TOPICS)
+    if qtype == "short_fact":
+        return QueryItem(rng.choice([f"{ent} 的{topic}", f"{ent} {rng.choice(_EN_WORDS)}",
+                                     f"{topic}是什么"]), "", qtype)
+    if qtype == "followup":
+        return QueryItem(rng.choice(["它什么时候发布？", "它的限额是多少？", "它支持哪些接口？"]),
+                         f"上文实体={ent}", qtype)
+    if qtype == "compare":
+        a, b = rng.sample(_ENTITIES, 2)
+        return QueryItem(rng.choice([f"{a} 与 {b} 在{topic}上的差异",
+                                     f"对比 {a} 和 {b} 的{topic}",
+                                     f"{a} vs {b} {topic} 分别有什么优缺点"]), "", qtype)
+    if qtype == "time":
+        y = rng.choice(_YEARS)
+        return QueryItem(rng.choice([f"{y} 年 {ent} 的{topic}更新",
+                                     f"{ent} {y} release notes",
+                                     f"{y}年{rng.randint(1, 12)}月 {topic}变更记录"]), "", qtype)
+    if qtype == "long":
+        return QueryItem(f"请详细介绍一下 {ent} 的{topic}，以及在不同场景中的表现、"
+                         f"主要限制以及常见的{rng.choice(_TOPICS)}问题", "", qtype)
+    raise ValueError(f"unknown query type: {qtype}")
+
+
+def generate_queries(n: int, seed: int = 7,
+                     mix: Optional[Dict[str, float]] = None) -> List[QueryItem]:
+    """按类型配比生成查询日志（同一 seed 结果确定）。"""
+    mix = mix or DEFAULT_MIX
+    unknown = set(mix) - set(QUERY_TYPES)
+    if unknown:
+        raise ValueError(f"unknown query types: {sorted(unknown)}")
+    rng = random.Random(seed)
+    types, weights = list(mix), list(mix.values())
+    return [_make_query(rng, rng.choices(types, weights)[0]) for _ in range(n)]
+
+
+def read_queries(path: str) -> List[QueryItem]:
+    """读取 JSONL 查询日志（字段 q / ctx / qtype；缺省 qtype 记为 "unknown"）。"""
+    with open(path, "r", encoding="utf-8") as f:
+        rows = [json.loads(ln) for ln in f if ln.strip()]
+    return [QueryItem(r["q"], r.get("ctx", ""), r.get("qtype", "unknown")) for r in rows]
+
+
+def branch_coverage(queries: Iterable[QueryItem], cfg: Optional[AppConfig] = None
+                    ) -> Dict[str, int]:
+    """按启发式路由统计各分支被触发的查询数（CQR 之前的原句，近似即可）。"""
+    r = (cfg or AppConfig()).router
+    counts: Counter = Counter()
+    for item in queries:
+        plan = choose_strategy(item.q, r.enable_multiquery, r.enable_decompose, r.enable_hyde,
+                               r.enable_prf, r.enable_self_query)
+        counts.update(k[len("use_"):] for k, v in vars(plan).items() if v)
+    return {b: counts.get(b, 0) for b in ("multiquery", "decompose", "hyde", "prf", "self_query")}
@@ -2,7 +2,22 @@
 from __future__ import annotations
 
 from pydantic import BaseModel, Field, field_validator
-from typing import Dict, List, Optional
+from typing import Dict, List, Literal, Optional
+
+
+class AdaptiveRouterConfig(BaseModel):
+    """自适应路由配置（见 rewrite.adaptive.AdaptiveRouter）。"""
+    min_samples: int = Field(default=20, ge=1)  # 单 (问句类型, 策略) 样本不足时沿用启发式
+    ewma_alpha: float = Field(default=0.1, gt=0.0, le=1.0)
+    cost_per_ms: float = Field(default=0.0005, ge=0.0)  # 每毫秒延迟折算的收益（终选文档占比）
+    min_gain: float = Field(default=0.02, ge=0.0)  # 收益 - 成本低于该值的策略不启用
+    latency_budget_ms: Optional[float] = Field(default=None, gt=0)  # 预期延迟超出预算的策略不启用
+    explore_rate: float = Field(default=0.05, ge=0.0, le=1.0)  # 按启发式计划执行的请求比例
+    stats_path: Optional[str] = None  # 统计快照：启动时加载，运行中周期写回、进程退出时再写一次
+    stats_save_interval_s: Optional[float] = Field(default=60.0, gt=0)  # None 时只在退出时写回
+    classifier_path: Optional[str] = None  # 离线训练的 StrategyClassifier
+    log_path: Optional[str] = None  # 追加写入 (问句, 策略, 延迟, 收益) JSONL 训练日志
+    seed: Optional[int] = None
 
 
 class RewriteRouterConfig(BaseModel):
@@ -14,6 +29,9 @@ class RewriteRouterConfig(BaseModel):
     enable_self_query: bool = True
     max_queries: int = Field(default=6, ge=1, le=12)
     dedup_cosine_thr: float = Field(default=0.92, ge=0.0, le=1.0)
+    combined_prompt: bool = False  # 计划需要 ≥2 路 LLM 改写时合并为一次结构化请求
+    mode: Literal["heuristic", "adaptive"] = "heuristic"
+    adaptive: AdaptiveRouterConfig = AdaptiveRouterConfig()
 
 
 class NormalizerConfig(BaseModel):
@@ -22,6 +40,7 @@ class NormalizerConfig(BaseModel):
     enable_punct_trim: bool = True
     enable_date_normalize: bool = True
     alias_table_path: Optional[str] = None  # 术语/别名 YAML 路径
+    alias_reload_interval_s: float = Field(default=1.0, ge=0.0)  # 别名表变更检查间隔
 
 
 class PRFConfig(BaseModel):
@@ -29,21 +48,125 @@ class PRFConfig(BaseModel):
     topk_initial: int = Field(default=5, ge=1, le=100)
     expansion_terms: int = Field(default=6, ge=0, le=50)
     stopwords: List[str] = Field(default_factory=lambda: ["的", "了", "and", "or", "the"])
+    min_idf: float = Field(default=0.5, ge=0.0)  # 检索器提供 idf 时，低于该值的扩展词丢弃
+    doc_stats_cache_size: int = Field(default=10_000, ge=0)  # 文档词项统计缓存条目数
 
 
 class FusionConfig(BaseModel):
     """融合配置。"""
+    method: Literal["rrf", "combsum", "combmnz"] = "rrf"
     rrf_k: int = Field(default=60, ge=1)
+    # 候选来源权重（cqr / multiquery / decompose / prf / hyde），未列出的来源权重为 1
+    source_weights: Dict[str, float] = Field(default_factory=dict)
+    top_n: Optional[int] = Field(default=None, ge=1)  # 融合结果截断；None 保留全部
     mmr_lambda: float = Field(default=0.7, ge=0.0, le=1.0)
     mmr_topk: int = Field(default=8, ge=1, le=100)
 
 
+class EmbeddingConfig(BaseModel):
+    """嵌入后端与共享嵌入缓存配置（用于 MultiQuery 去重、MMR 与 HyDE 向量检索）。"""
+    backend: Literal["tfidf", "hashing", "local"] = "tfidf"  # tfidf：按请求拟合，不跨请求缓存
+    model_path: Optional[str] = None  # backend="local" 时的本地模型目录
+    device: Optional[str] = None
+    hashing_features: int = Field(default=4096, ge=16, le=1 << 20)
+    batch_size: int = Field(default=64, ge=1)
+    cache_max_entries: int = Field(default=50_000, ge=0)
+    cache_max_mb: int = Field(default=256, ge=0)
+    hyde_vector: bool = True  # 检索器支持向量检索时，HyDE 假想文档走向量路径
+
+
+class EarlyExitConfig(BaseModel):
+    """分段执行（首跳置信即提前结束）配置。"""
+    enabled: bool = False
+    min_top_score: float = Field(default=0.0, ge=0.0)  # 首位得分下限
+    gap_rank: int = Field(default=1, ge=1)  # 得分差距：首位 vs 第 gap_rank+1 位
+    min_score_gap: float = Field(default=0.25, ge=0.0, le=1.0)  # 相对差距 (s1 - s_k) / s1 下限
+    overlap_k: int = Field(default=5, ge=1)  # 与 PRF 扩展查询结果比较的前 k 位
+    min_overlap: float = Field(default=0.6, ge=0.0, le=1.0)  # 前 k 重合率下限（有 PRF 时）
+
+
+class CacheConfig(BaseModel):
+    """分层结果缓存配置（响应 / 改写 / 检索池）。"""
+    enabled: bool = False
+    max_entries: int = Field(default=10_000, ge=0)  # 响应层
+    ttl_s: Optional[float] = Field(default=300.0, gt=0)
+    rewrite_max_entries: int = Field(default=50_000, ge=0)
+    rewrite_ttl_s: Optional[float] = Field(default=3600.0, gt=0)
+    pool_max_entries: int = Field(default=200_000, ge=0)
+    pool_ttl_s: Optional[float] = Field(default=300.0, gt=0)
+    near_dup_thr: Optional[float] = Field(default=None, ge=0.0, le=1.0)  # None 关闭近重复命中
+    near_dup_max_entries: int = Field(default=1024, ge=0)
+
+
+class LLMCacheConfig(BaseModel):
+    """LLM 调用结果缓存配置（见 llm.caching.CachingLLMClient）。"""
+    enabled: bool = False
+    max_entries: int = Field(default=100_000, ge=0)
+    ttl_s: Optional[float] = Field(default=None, gt=0)  # None 不过期（提示词确定、模型固定时）
+    path: Optional[str] = None  # SQLite 文件路径；None 仅内存
+
+
+class ExecutorConfig(BaseModel):
+    """进程级执行器配置（检索并发上限、隔离舱与背压）。"""
+    max_workers: int = Field(default=32, ge=1, le=1024)  # 全局检索并发上限
+    max_queue: int = Field(default=256, ge=0)  # 超出并发上限后允许排队的检索数
+    per_backend_limit: int = Field(default=64, ge=1)  # 单后端在途（执行+排队）上限
+    overload_policy: Literal["shed", "reject"] = "shed"  # 饱和时：丢弃该候选 / 拒绝整个请求
+    stage_workers: int = Field(default=64, ge=1, le=1024)  # 阶段图共享线程数
+
+
+class TimeoutConfig(BaseModel):
+    """延迟预算配置：请求截止时间、单次检索超时与对冲请求。"""
+    request_budget_ms: Optional[int] = Field(default=None, ge=1)  # 整体预算；None 不限时
+    search_timeout_ms: Optional[int] = Field(default=None, ge=1)  # 单次检索超时
+    hedge_enabled: bool = False  # 超过延迟分位数仍未返回时发起一次重复请求
+    hedge_quantile: float = Field(default=0.95, gt=0.0, lt=1.0)
+    hedge_min_delay_ms: int = Field(default=5, ge=0)
+    hedge_min_samples: int = Field(default=20, ge=1)  # 样本不足时不对冲
+
+
+class TelemetryConfig(BaseModel):
+    """进程内埋点配置（见 telemetry.core）：阶段 / 检索调用 span、延迟直方图与计数器。"""
+    enabled: bool = False  # 关闭时所有埋点为空操作
+    max_spans: int = Field(default=2048, ge=0)  # 最近结束 span 的环形缓冲容量
+    latency_buckets_ms: List[float] = Field(
+        default_factory=lambda: [1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000])
+
+    @field_validator("latency_buckets_ms")
+    @classmethod
+    def _sorted_buckets(cls, v: List[float]) -> List[float]:
+        if not v or any(b <= a for a, b in zip(v, v[1:])):
+            raise ValueError("latency_buckets_ms must be non-empty and strictly increasing")
+        return v
+
+
+class ServerConfig(BaseModel):
+    """HTTP 服务配置（见 serving）；host / port / workers 只在启动时生效，重载配置时忽略。"""
+    host: str = "127.0.0.1"
+    port: int = Field(default=8080, ge=0, le=65535)
+    workers: int = Field(default=1, ge=1, le=256)  # >1 时预派生（fork）多个工作进程共享监听套接字
+    max_batch_items: int = Field(default=64, ge=1)  # 单个 JSON 批量请求的条数上限
+    max_body_bytes: int = Field(default=1 << 20, ge=1024)
+    warmup_queries: List[str] = Field(
+        default_factory=lambda: ["它什么时候发布？", "2023 版与 2024 版有什么差异？",
+                                 "2024 年 GPT-5 的接口限额"])
+    graceful_timeout_s: float = Field(default=10.0, gt=0)  # 停止时等待在途请求完成的上限
+
+
 class AppConfig(BaseModel):
     """应用总配置。"""
     normalizer: NormalizerConfig = NormalizerConfig()
     router: RewriteRouterConfig = RewriteRouterConfig()
     prf: PRFConfig = PRFConfig()
     fusion: FusionConfig = FusionConfig()
+    embedding: EmbeddingConfig = EmbeddingConfig()
+    cache: CacheConfig = CacheConfig()
+    early_exit: EarlyExitConfig = EarlyExitConfig()
+    llm_cache: LLMCacheConfig = LLMCacheConfig()
+    executor: ExecutorConfig = ExecutorConfig()
+    timeouts: TimeoutConfig = TimeoutConfig()
+    telemetry: TelemetryConfig = TelemetryConfig()
+    server: ServerConfig = ServerConfig()
     log_level: str = "INFO"
 
     @field_validator("log_level")
@@ -11,4 +11,12 @@ class ConfigError(Exception):
 
 
 class RetrievalError(Exception):
-    """检索相关错误。"""
\ No newline at end of file
+    """检索相关错误。"""
+
+
+class RetrievalOverloadError(RetrievalError):
+    """检索执行器饱和（全局或单后端并发已满）且策略为拒绝。"""
+
+
+class LLMError(RewriterError):
+    """LLM 调用失败（网络错误、超时或响应格式不符）。"""
@@ -1,68 +1,197 @@
 """Score fusion (RRF) and redundancy control (MMR)."""
 from __future__ import annotations
 
-from typing import List
+from typing import Any, Dict, List, Optional, Sequence
 from ..retrievers.base import SearchResult
+from ..utils.embedding import unit_rows
+from ..utils.lazy import lazy_module
 from ..utils.similarity import TfidfEmbedder
-from sklearn.metrics.pairwise import cosine_similarity
 import numpy as np
 
+sp = lazy_module("scipy.sparse")
 
-def rrf_fuse(pools: List[List[SearchResult]], k: int = 60) -> List[SearchResult]:
-    """Reciprocal Rank Fusion (RRF)."""
-    if not pools:
-        return []
-    score = {}
-    first_seen = {}
 
-    for results in pools:
-        for rank, r in enumerate(results, start=1):
-            if r.doc_id is None:
+FUSION_METHODS = ("rrf", "combsum", "combmnz")
+
+
+class FusionAccumulator:
+    """流式分数融合：检索池到达一个累加一个，最后按需取前 top_n。
+
+    中文说明：
+        - method="rrf"：每个池贡献 weight/(k+rank)；"combsum"：池内分数 min-max 归一化后
+          乘以 weight 累加；"combmnz"：CombSUM × 命中该文档的池数；
+        - 文档 ID 映射为连续下标，得分以 NumPy 数组累加（np.add.at），不为每个文档创建
+          中间对象；SearchResult 只为最终输出的文档创建；
+        - result(top_n) 先用 np.argpartition 部分选择再排序，排序键为 (-得分, doc_id)，
+          与完整排序后截断的结果（含并列）完全一致；
+        - 池为 None（超时未返回）时跳过，支持部分结果融合。
+    """
+
+    def __init__(self, method: str = "rrf", k: int = 60) -> None:
+        if method not in FUSION_METHODS:
+            raise ValueError(f"unknown fusion method: {method}")
+        self.method = method
+        self.k = k
+        self._slot: Dict[str, int] = {}
+        self._ids: List[str] = []
+        self._texts: List[str] = []
+        self._score = np.zeros(64, dtype=np.float64)
+        self._hits = np.zeros(64, dtype=np.int32)
+        self.num_pools = 0
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def _grow(self, n: int) -> None:
+        cap = self._score.size
+        if n <= cap:
+            return
+        while cap < n:
+            cap *= 2
+        self._score = np.concatenate([self._score, np.zeros(cap - self._score.size)])
+        self._hits = np.concatenate([self._hits, np.zeros(cap - self._hits.size, np.int32)])
+
+    def add(self, pool: Optional[Sequence[SearchResult]], weight: float = 1.0) -> None:
+        """累加一个检索池（按名次排列）；weight 为该候选来源的权重。"""
+        if pool is None:
+            return
+        self.num_pools += 1
+        if not pool:
+            return
+        slot_of, ids, texts = self._slot, self._ids, self._texts
+        get = slot_of.get
+        found = [get(r.doc_id, -1) for r in pool]
+        for j in [j for j, s in enumerate(found) if s < 0]:  # 新文档分配下标
+            d = pool[j].doc_id
+            if d is None:
                 continue
-            score.setdefault(r.doc_id, 0.0)
-            score[r.doc_id] += 1.0 / (k + rank)
-            if r.doc_id not in first_seen:
-                first_seen[r.doc_id] = r
+            s = get(d, -1)
+            if s < 0:
+                s = slot_of[d] = len(ids)
+                ids.append(d)
+                texts.append(pool[j].text)
+            found[j] = s
+        slots = np.array(found, dtype=np.int64)
+        self._grow(len(ids))
+        valid = slots >= 0
+        if self.method == "rrf":
+            ranks = np.arange(1, len(pool) + 1, dtype=np.float64)
+            contrib = weight / (self.k + ranks)
+        else:
+            raw = np.array([r.score for r in pool], dtype=np.float64)
+            lo, hi = raw[valid].min(initial=np.inf), raw[valid].max(initial=-np.inf)
+            contrib = weight * ((raw - lo) / (hi - lo) if hi > lo else np.ones_like(raw))
+        np.add.at(self._score, slots[valid], contrib[valid])
+        self._hits[np.unique(slots[valid])] += 1
+
+    def scores(self) -> np.ndarray:
+        """当前各文档（按首次出现顺序）的融合得分。"""
+        n = len(self._ids)
+        sc = self._score[:n]
+        return sc * self._hits[:n] if self.method == "combmnz" else sc.copy()
+
+    def result(self, top_n: Optional[int] = None) -> List[SearchResult]:
+        """按 (-得分, doc_id) 排序返回前 top_n 个（None 为全部）。"""
+        n = len(self._ids)
+        if n == 0 or (top_n is not None and top_n <= 0):
+            return []
+        sc = self.scores()
+        if top_n is not None and top_n < n:
+            # 部分选择：取第 top_n 名的得分为界，保留所有 ≥ 界值者（含并列）再精确排序
+            bound = np.partition(-sc, top_n - 1)[top_n - 1]
+            sel = np.flatnonzero(-sc <= bound)
+        else:
+            sel = np.arange(n)
+        ids = [self._ids[i] for i in sel]
+        order = np.lexsort((np.array(ids), -sc[sel]))
+        if top_n is not None:
+            order = order[:top_n]
+        picked = sel[order].tolist()
+        return [SearchResult(doc_id=self._ids[i], score=s, text=self._texts[i])
+                for i, s in zip(picked, sc[picked].tolist())]
 
-    fused = [SearchResult(doc_id=d, score=s, text=first_seen[d].text)
-             for d, s in score.items()]
-    fused.sort(key=lambda x: (-(x.score), x.doc_id))
-    return fused
 
+def fuse_pools(pools: Sequence[Optional[List[SearchResult]]], method: str = "rrf", k: int = 60,
+               weights: Optional[Sequence[float]] = None,
+               top_n: Optional[int] = None) -> List[SearchResult]:
+    """一次性融合多个检索池；weights 与 pools 一一对应（None 表示全部为 1）。"""
+    acc = FusionAccumulator(method=method, k=k)
+    for i, pool in enumerate(pools):
+        acc.add(pool, weight=weights[i] if weights is not None else 1.0)
+    return acc.result(top_n)
 
-def mmr_select(query: str, docs: List[str], topk: int = 8, lamb: float = 0.7) -> List[int]:
-    """Maximal Marginal Relevance 选择文档索引集合。"""
+
+def rrf_fuse(pools: Sequence[Optional[List[SearchResult]]], k: int = 60,
+             weights: Optional[Sequence[float]] = None,
+             top_n: Optional[int] = None) -> List[SearchResult]:
+    """Reciprocal Rank Fusion (RRF)。
+
+    中文说明：
+        - 未在截止时间内返回的检索池以 None 表示，直接跳过（部分结果融合）；
+        - weights 为各池的来源权重（加权 RRF），top_n 为输出截断（部分选择）。
+    """
+    return fuse_pools(pools, method="rrf", k=k, weights=weights, top_n=top_n)
+
+
+def _as_matrix(X: Any) -> Any:
+    """稀疏矩阵统一为 CSR，稠密矩阵统一为二维 ndarray；均为 float32 且行归一化。"""
+    if sp.issparse(X):
+        return unit_rows(sp.csr_matrix(X, dtype=np.float32))
+    return unit_rows(np.atleast_2d(np.asarray(X, dtype=np.float32)))
+
+
+def _dot_rows(D: Any, v: Any) -> np.ndarray:
+    """D 的每一行与单行向量 v 的点积（稀疏/稠密通用），返回一维 float64。"""
+    if sp.issparse(D):
+        return (D @ v.T).toarray().ravel().astype(np.float64)
+    return (D @ v.ravel()).astype(np.float64)
+
+
+def mmr_select(query: str, docs: List[str], topk: int = 8, lamb: float = 0.7,
+               embedder: Optional[Any] = None,
+               doc_vectors: Optional[Any] = None) -> List[int]:
+    """Maximal Marginal Relevance 选择文档索引集合。
+
+    中文说明：
+        - 默认在 query+docs 上拟合 TF-IDF；传入 embedder（已拟合的 TfidfEmbedder 或
+          utils.embedding 中的嵌入器）时只调用其 embed，传入 doc_vectors（如
+          DocVectorCache.matrix 的结果）时跳过文档向量化；
+        - 增量实现：维护“与已选集合的最大相似度”向量，每选中一篇只计算该篇与全部候选的
+          一行相似度并取逐元素最大值，不再构建 n×n 相似度矩阵，复杂度 O(k·nnz)；
+        - 选择结果（含并列时取下标最小者）与逐对计算的朴素实现一致。
+    """
     if topk <= 0 or not docs:
         return []
     topk = min(topk, len(docs))
 
-    emb = TfidfEmbedder()
-    X = emb.fit_transform([query] + docs)  # 0: query
-    qv = X[0]
-    D = X[1:]
+    if doc_vectors is not None and embedder is None:
+        raise ValueError("doc_vectors requires the embedder that produced them")
+    if embedder is None:
+        X = TfidfEmbedder().fit_transform([query] + docs)  # 0: query
+        qv, D = X[0], X[1:]
+    else:
+        qv = embedder.embed([query])
+        D = doc_vectors if doc_vectors is not None else embedder.embed(docs)
+    qv, D = _as_matrix(qv), _as_matrix(D)
+    if sp.issparse(D) != sp.issparse(qv):
+        qv = qv.toarray() if sp.issparse(qv) else sp.csr_matrix(qv)
 
-    # 相似度矩阵可能出现空向量，需安全处理
-    sim_qd = cosine_similarity(qv, D).ravel()
-    sim_dd = cosine_similarity(D, D)
-    np.nan_to_num(sim_qd, copy=False)
-    np.nan_to_num(sim_dd, copy=False)
+    sim_qd = _dot_rows(D, qv[0])
+    rel = lamb * sim_qd
+    max_sim = np.full(len(docs), -np.inf)  # 与已选集合的最大相似度
+    taken = np.zeros(len(docs), dtype=bool)
 
     selected: List[int] = []
-    candidates = list(range(len(docs)))
-
-    while candidates and len(selected) < topk:
+    while len(selected) < topk:
         if not selected:
-            i_rel = int(np.argmax(sim_qd[candidates]))
-            selected.append(candidates[i_rel])
-            candidates.pop(i_rel)
-            continue
-        # 与已选的最大相似度
-        max_sim_to_sel = np.array(
-            [max(sim_dd[i][selected]) if selected else 0.0 for i in candidates]
-        )
-        mmr_scores = lamb * sim_qd[candidates] - (1.0 - lamb) * max_sim_to_sel
-        picked = int(np.argmax(mmr_scores))
-        selected.append(candidates[picked])
-        candidates.pop(picked)
+            scores = sim_qd.copy()
+        else:
+            scores = rel - (1.0 - lamb) * max_sim
+        scores[taken] = -np.inf
+        picked = int(np.argmax(scores))
+        selected.append(picked)
+        taken[picked] = True
+        row = _dot_rows(D, D[picked])
+        np.maximum(max_sim, row, out=max_sim)
 
     return selected
@@ -24,3 +24,41 @@ class LLMClient(ABC):
                       max_tokens: int = 512) -> Any:
         """生成结构化 JSON。"""
         raise NotImplementedError
+
+    # ---- 批量接口：默认逐条调用，支持批量推理的厂商可覆盖 ----
+
+    def generate_batch(self, prompts: List[str], max_tokens: int = 256) -> List[str]:
+        """批量生成文本，结果与 prompts 一一对应。"""
+        return [self.generate(p, max_tokens=max_tokens) for p in prompts]
+
+    def generate_lines_batch(self, prompts: List[str], n_lines: int = 6,
+                             max_tokens: int = 512) -> List[List[str]]:
+        """批量生成多行候选。"""
+        return [self.generate_lines(p, n_lines=n_lines, max_tokens=max_tokens) for p in prompts]
+
+    def generate_json_batch(self, prompts: List[str], schema_hint: Optional[str] = None,
+                            max_tokens: int = 512) -> List[Any]:
+        """批量生成结构化 JSON。"""
+        return [self.generate_json(p, schema_hint=schema_hint, max_tokens=max_tokens)
+                for p in prompts]
+
+
+class AsyncLLMClient(ABC):
+    """异步 LLM 客户端抽象类：单个事件循环即可承载大量并发调用。"""
+
+    @abstractmethod
+    async def generate(self, prompt: str, max_tokens: int = 256) -> str:
+        """生成文本。"""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def generate_lines(self, prompt: str, n_lines: int = 6,
+                             max_tokens: int = 512) -> List[str]:
+        """生成多行，每行一个候选。"""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def generate_json(self, prompt: str, schema_hint: Optional[str] = None,
+                            max_tokens: int = 512) -> Any:
+        """生成结构化 JSON。"""
+        raise NotImplementedError
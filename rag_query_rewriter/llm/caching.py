@@ -0,0 +1,362 @@
+"""Memoizing LLM client wrapper with single-flight coalescing and SQLite persistence."""
+from __future__ import annotations
+
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+import asyncio
+import copy
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+from loguru import logger
+
+from ..config import LLMCacheConfig
+from ..utils.cache import TTLCache
+from .base import AsyncLLMClient, LLMClient
+
+
+def _identity(llm: Any) -> str:
+    """被包装客户端的身份（类名 + 可选 model / name），持久化缓存按其隔离。"""
+    parts = [type(llm).__name__]
+    for attr in ("model", "name"):
+        v = getattr(llm, attr, None)
+        if v is not None:
+            parts.append(f"{attr}={v}")
+    return "|".join(parts)
+
+
+class LLMCacheStore:
+    """LLM 结果存储：内存 TTL-LRU + 可选 SQLite 文件（写穿透，跨进程复用）。
+
+    中文说明：
+        - 值以 JSON 文本保存，读取时反序列化，调用方拿到的总是独立副本；
+        - 内存未命中时查 SQLite，命中后回填内存；过期条目在打开时与读取时清理；
+        - SQLite 连接在线程间共享，读写由锁串行化（LLM 调用本身远慢于本地读写）。
+    """
+
+    def __init__(self, max_entries: int = 100_000, ttl_s: Optional[float] = None,
+                 path: Optional[str] = None) -> None:
+        self.ttl_s = ttl_s
+        self.path = path
+        self._mem: TTLCache[str] = TTLCache(max_entries, ttl_s)
+        self._db: Optional[sqlite3.Connection] = None
+        self._db_lock = threading.Lock()
+        self.disk_hits = 0
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("CREATE TABLE IF NOT EXISTS llm_cache "
+                             "(key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL)")
+            if ttl_s is not None:
+                self._db.execute("DELETE FROM llm_cache WHERE created < ?", (time.time() - ttl_s,))
+            logger.info("LLM 缓存持久化: path={}", path)
+
+    def get(self, key: str) -> Tuple[bool, Any]:
+        """返回 (是否命中, 值)。"""
+        raw = self._mem.get(key)
+        if raw is None and self._db is not None:
+            with self._db_lock:
+                row = self._db.execute("SELECT value, created FROM llm_cache WHERE key = ?",
+                                       (key,)).fetchone()
+            if row is not None and (self.ttl_s is None or time.time() - row[1] <= self.ttl_s):
+                raw = row[0]
+                self.disk_hits += 1
+                self._mem.put(key, raw)
+        return (False, None) if raw is None else (True, json.loads(raw))
+
+    def put(self, key: str, value: Any) -> None:
+        try:
+            raw = json.dumps(value, ensure_ascii=False)
+        except (TypeError, ValueError):
+            return  # 不可序列化的结果不缓存
+        self.put_raw(key, raw)
+
+    def put_raw(self, key: str, raw: str) -> None:
+        """写入已序列化的 JSON 文本。"""
+        self._mem.put(key, raw)
+        if self._db is not None:
+            with self._db_lock:
+                self._db.execute("INSERT OR REPLACE INTO llm_cache VALUES (?, ?, ?)",
+                                 (key, raw, time.time()))
+
+    def clear(self) -> None:
+        self._mem.clear()
+        if self._db is not None:
+            with self._db_lock:
+                self._db.execute("DELETE FROM llm_cache")
+
+    def close(self) -> None:
+        if self._db is not None:
+            with self._db_lock:
+                self._db.close()
+            self._db = None
+
+    def stats(self) -> Dict[str, int]:
+        return {**self._mem.stats(), "disk_hits": self.disk_hits}
+
+
+class _Snapshot:
+    """上游结果的冻结副本：完成时复制一次，之后每个调用方各取一份，互不影响。
+
+    中文说明：可 JSON 序列化的值保存 JSON 文本（与缓存读取一致）；否则保存一份深拷贝。
+    """
+
+    __slots__ = ("raw", "value")
+
+    def __init__(self, value: Any) -> None:
+        self.value: Any = None
+        try:
+            self.raw: Optional[str] = json.dumps(value, ensure_ascii=False)
+        except (TypeError, ValueError):
+            self.raw = None
+            self.value = copy.deepcopy(value)
+
+    def copy(self) -> Any:
+        return json.loads(self.raw) if self.raw is not None else copy.deepcopy(self.value)
+
+
+class _Flight:
+    """一次进行中的上游调用；调用方（含发起者）等待 done 后各自取一份结果或异常。"""
+
+    __slots__ = ("done", "snapshot", "error")
+
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.snapshot: Optional[_Snapshot] = None
+        self.error: Optional[BaseException] = None
+
+    def result(self) -> Any:
+        self.done.wait()
+        if self.error is not None:
+            raise self.error
+        return self.snapshot.copy()  # type: ignore[union-attr]
+
+
+class CachingLLMClient(LLMClient):
+    """为任意 LLMClient 加上结果缓存与请求合并（single-flight）。
+
+    中文说明：
+        - 键为 (被包装客户端身份, 方法, prompt, 参数) 的哈希；同一键的并发调用只有一个
+          发往上游，其余等待其结果（上游异常同样传递给等待者，且不写入缓存）；
+        - 上游结果在完成时复制一次，每个调用方（含发起者）各得一份独立副本；
+        - 批量接口先查缓存，同批重复 prompt 合并，未命中部分作为一次批量调用下发；
+          上游返回条数不符时逐条重试；
+        - store 可在多个包装器间共享（如同步与异步客户端共用一个 SQLite 文件）。
+    """
+
+    def __init__(self, llm: LLMClient, store: Optional[LLMCacheStore] = None) -> None:
+        self.llm = llm
+        self.store = store if store is not None else LLMCacheStore()
+        self.model = getattr(llm, "model", None)
+        self.name = getattr(llm, "name", None)
+        self._ns = _identity(llm)
+        self._flights: Dict[str, _Flight] = {}
+        self._lock = threading.Lock()
+        self.upstream_calls = 0
+        self.coalesced = 0
+
+    @classmethod
+    def from_config(cls, llm: LLMClient, cfg: LLMCacheConfig) -> "CachingLLMClient":
+        return cls(llm, LLMCacheStore(cfg.max_entries, cfg.ttl_s, cfg.path))
+
+    def key(self, method: str, prompt: str, **params: Any) -> str:
+        raw = json.dumps([self._ns, method, prompt, params], sort_keys=True, ensure_ascii=False)
+        return hashlib.blake2b(raw.encode("utf-8"), digest_size=16).hexdigest()
+
+    def _call(self, key: str, fn: Callable[[], Any]) -> Any:
+        hit, value = self.store.get(key)
+        if hit:
+            return value
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+                self.upstream_calls += 1
+            else:
+                self.coalesced += 1
+        if leader:
+            try:
+                self._settle(key, flight, fn())
+            except BaseException as exc:
+                flight.error = exc
+                raise
+            finally:
+                with self._lock:
+                    self._flights.pop(key, None)
+                flight.done.set()
+        return flight.result()
+
+    def _settle(self, key: str, flight: _Flight, value: Any) -> None:
+        """冻结上游结果（在 done 置位前完成），可序列化时写入缓存。"""
+        flight.snapshot = _Snapshot(value)
+        if flight.snapshot.raw is not None:
+            self.store.put_raw(key, flight.snapshot.raw)
+
+    def _call_batch(self, keys: Sequence[str], prompts: Sequence[str],
+                    fn_batch: Callable[[List[str]], List[Any]]) -> List[Any]:
+        out: List[Any] = [None] * len(keys)
+        todo: Dict[str, List[int]] = {}
+        for i, k in enumerate(keys):
+            hit, value = self.store.get(k)
+            if hit:
+                out[i] = value
+            else:
+                todo.setdefault(k, []).append(i)
+        if not todo:
+            return out
+        # 仅由本批发起的键以一次批量调用下发；已在途的键等待其结果
+        owned: Dict[str, _Flight] = {}
+        waiting: Dict[str, _Flight] = {}
+        with self._lock:
+            for k in todo:
+                flight = self._flights.get(k)
+                if flight is None:
+                    owned[k] = self._flights[k] = _Flight()
+                else:
+                    waiting[k] = flight
+                    self.coalesced += 1
+            self.upstream_calls += bool(owned)
+        if owned:
+            ks = list(owned)
+            try:
+                batch = [prompts[todo[k][0]] for k in ks]
+                values = list(fn_batch(batch))
+                if len(values) != len(ks):
+                    # 条数不符时无法对齐，逐条重新请求
+                    logger.warning("LLM 批量调用返回 {} 条，期望 {} 条，改为逐条调用",
+                                   len(values), len(ks))
+                    values = [self._call_one(fn_batch, p) for p in batch]
+                for k, v in zip(ks, values):
+                    self._settle(k, owned[k], v)
+            except BaseException as exc:
+                for f in owned.values():
+                    f.error = exc
+                raise
+            finally:
+                with self._lock:
+                    for k in ks:
+                        self._flights.pop(k, None)
+                for f in owned.values():
+                    f.done.set()
+        for k, idx in todo.items():
+            flight = owned.get(k) or waiting[k]
+            for i in idx:
+                out[i] = flight.result()
+        return out
+
+    @staticmethod
+    def _call_one(fn_batch: Callable[[List[str]], List[Any]], prompt: str) -> Any:
+        values = list(fn_batch([prompt]))
+        if len(values) != 1:
+            raise ValueError(f"LLM batch call returned {len(values)} results for 1 prompt")
+        return values[0]
+
+    def generate(self, prompt: str, max_tokens: int = 256) -> str:
+        return self._call(self.key("generate", prompt, max_tokens=max_tokens),
+                          lambda: self.llm.generate(prompt, max_tokens=max_tokens))
+
+    def generate_lines(self, prompt: str, n_lines: int = 6,
+                       max_tokens: int = 512) -> List[str]:
+        return self._call(self.key("lines", prompt, n_lines=n_lines, max_tokens=max_tokens),
+                          lambda: self.llm.generate_lines(prompt, n_lines=n_lines,
+                                                          max_tokens=max_tokens))
+
+    def generate_json(self, prompt: str, schema_hint: Optional[str] = None,
+                      max_tokens: int = 512) -> Any:
+        return self._call(self.key("json", prompt, schema_hint=schema_hint, max_tokens=max_tokens),
+                          lambda: self.llm.generate_json(prompt, schema_hint=schema_hint,
+                                                         max_tokens=max_tokens))
+
+    def generate_batch(self, prompts: List[str], max_tokens: int = 256) -> List[str]:
+        keys = [self.key("generate", p, max_tokens=max_tokens) for p in prompts]
+        return self._call_batch(keys, prompts, lambda ps: self.llm.generate_batch(
+            ps, max_tokens=max_tokens))
+
+    def generate_lines_batch(self, prompts: List[str], n_lines: int = 6,
+                             max_tokens: int = 512) -> List[List[str]]:
+        keys = [self.key("lines", p, n_lines=n_lines, max_tokens=max_tokens) for p in prompts]
+        return self._call_batch(keys, prompts, lambda ps: self.llm.generate_lines_batch(
+            ps, n_lines=n_lines, max_tokens=max_tokens))
+
+    def generate_json_batch(self, prompts: List[str], schema_hint: Optional[str] = None,
+                            max_tokens: int = 512) -> List[Any]:
+        keys = [self.key("json", p, schema_hint=schema_hint, max_tokens=max_tokens)
+                for p in prompts]
+        return self._call_batch(keys, prompts, lambda ps: self.llm.generate_json_batch(
+            ps, schema_hint=schema_hint, max_tokens=max_tokens))
+
+    def stats(self) -> Dict[str, int]:
+        return {**self.store.stats(), "upstream_calls": self.upstream_calls,
+                "coalesced": self.coalesced}
+
+
+class AsyncCachingLLMClient(AsyncLLMClient):
+    """CachingLLMClient 的异步版本：同一事件循环内的并发相同调用合并为一次上游请求。"""
+
+    def __init__(self, llm: AsyncLLMClient, store: Optional[LLMCacheStore] = None) -> None:
+        self.llm = llm
+        self.store = store if store is not None else LLMCacheStore()
+        self.model = getattr(llm, "model", None)
+        self.name = getattr(llm, "name", None)
+        self._ns = _identity(llm)
+        self._flights: Dict[str, "asyncio.Task[_Snapshot]"] = {}
+        self.upstream_calls = 0
+        self.coalesced = 0
+
+    def key(self, method: str, prompt: str, **params: Any) -> str:
+        raw = json.dumps([self._ns, method, prompt, params], sort_keys=True, ensure_ascii=False)
+        return hashlib.blake2b(raw.encode("utf-8"), digest_size=16).hexdigest()
+
+    async def _call(self, key: str, fn: Callable[[], Any]) -> Any:
+        hit, value = self.store.get(key)
+        if hit:
+            return value
+        task = self._flights.get(key)
+        if task is None:
+            self.upstream_calls += 1
+            task = self._flights[key] = asyncio.ensure_future(self._fetch(key, fn))
+            # 无等待者时避免 "exception was never retrieved" 警告
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        else:
+            self.coalesced += 1
+        # 上游调用在独立任务中执行：任一调用方（含发起者）被取消不会波及其他等待者
+        snapshot = await asyncio.shield(task)
+        return snapshot.copy()
+
+    async def _fetch(self, key: str, fn: Callable[[], Any]) -> _Snapshot:
+        try:
+            snapshot = _Snapshot(await fn())
+        finally:
+            self._flights.pop(key, None)
+        if snapshot.raw is not None:
+            self.store.put_raw(key, snapshot.raw)
+        return snapshot
+
+    async def generate(self, prompt: str, max_tokens: int = 256) -> str:
+        return await self._call(self.key("generate", prompt, max_tokens=max_tokens),
+                                lambda: self.llm.generate(prompt, max_tokens=max_tokens))
+
+    async def generate_lines(self, prompt: str, n_lines: int = 6,
+                             max_tokens: int = 512) -> List[str]:
+        return await self._call(
+            self.key("lines", prompt, n_lines=n_lines, max_tokens=max_tokens),
+            lambda: self.llm.generate_lines(prompt, n_lines=n_lines, max_tokens=max_tokens))
+
+    async def generate_json(self, prompt: str, schema_hint: Optional[str] = None,
+                            max_tokens: int = 512) -> Any:
+        return await self._call(
+            self.key("json", prompt, schema_hint=schema_hint, max_tokens=max_tokens),
+            lambda: self.llm.generate_json(prompt, schema_hint=schema_hint,
+                                           max_tokens=max_tokens))
+
+    def stats(self) -> Dict[str, int]:
+        return {**self.store.stats(), "upstream_calls": self.upstream_calls,
+                "coalesced": self.coalesced}
+
+
+def cached_llm(llm: LLMClient, cfg: LLMCacheConfig) -> LLMClient:
+    """按配置包装 LLM 客户端；未启用时原样返回。"""
+    return CachingLLMClient.from_config(llm, cfg) if cfg.enabled else llm
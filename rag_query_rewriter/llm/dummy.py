@@ -2,11 +2,13 @@
 from __future__ import annotations
 
 from typing import List, Any
+import asyncio
 import json
 import regex as re
+from .base import AsyncLLMClient, LLMClient
 
 
-class DummyLLM:
+class DummyLLM(LLMClient):
     """离线开发用的简单 LLM 模拟器。"""
 
     def generate(self, prompt: str, max_tokens: int = 256) -> str:
@@ -30,9 +32,47 @@ class DummyLLM:
 
     def generate_json(self, prompt: str, schema_hint: str | None = None,
                       max_tokens: int = 512) -> Any:
+        if schema_hint and schema_hint.startswith("combined:"):
+            return self._combined(prompt, schema_hint[len("combined:"):].split(","))
         return {
             "keywords": ["发布", "时间", "版本"],
             "must_filters": {"year": ["2023", "2024"]},
             "should_filters": {},
             "not_filters": {},
         }
+
+    def _combined(self, prompt: str, fields: List[str]) -> Any:
+        """组合改写请求（见 rewrite.combined）：按所需字段拼出单策略接口的结果。"""
+        out: dict = {}
+        if "queries" in fields:
+            out["queries"] = self.generate_lines(prompt, n_lines=8)
+        if "hyde" in fields:
+            out["hyde"] = self.generate(prompt)
+        if "filters" in fields:
+            out["filters"] = self.generate_json(prompt)
+        return out
+
+
+class AsyncDummyLLM(AsyncLLMClient):
+    """DummyLLM 的异步版本；latency_s 用于模拟网络往返以观察并发重叠效果。"""
+
+    def __init__(self, latency_s: float = 0.0) -> None:
+        self._sync = DummyLLM()
+        self._latency_s = latency_s
+
+    async def _wait(self) -> None:
+        await asyncio.sleep(self._latency_s)
+
+    async def generate(self, prompt: str, max_tokens: int = 256) -> str:
+        await self._wait()
+        return self._sync.generate(prompt, max_tokens=max_tokens)
+
+    async def generate_lines(self, prompt: str, n_lines: int = 6,
+                             max_tokens: int = 512) -> List[str]:
+        await self._wait()
+        return self._sync.generate_lines(prompt, n_lines=n_lines, max_tokens=max_tokens)
+
+    async def generate_json(self, prompt: str, schema_hint: str | None = None,
+                            max_tokens: int = 512) -> Any:
+        await self._wait()
+        return self._sync.generate_json(prompt, schema_hint=schema_hint, max_tokens=max_tokens)
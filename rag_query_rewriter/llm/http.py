@@ -0,0 +1,57 @@
+"""Minimal JSON-over-HTTP LLM client (speaks the protocol of llm.stub_server)."""
+from __future__ import annotations
+
+from typing import Any, Dict, List, Optional
+import json
+import urllib.error
+import urllib.request
+
+from ..exceptions import LLMError
+from .base import LLMClient
+
+
+class HTTPLLMClient(LLMClient):
+    """通过 HTTP 调用 LLM 服务；每次方法调用对应一次网络往返。
+
+    中文说明：
+        - 协议：POST {base_url}/v1/{method}，请求体 {"prompt": ..., 其余参数}，
+          响应体 {"result": ...}；method 为 generate / generate_lines / generate_json；
+        - 网络错误、超时与非 2xx 响应统一抛出 LLMError，由上层的回退逻辑处理；
+        - 仅依赖标准库，用于对接本地桩服务（llm.stub_server）或兼容该协议的网关。
+    """
+
+    def __init__(self, base_url: str, model: Optional[str] = None,
+                 timeout_s: float = 30.0) -> None:
+        self.base_url = base_url.rstrip("/")
+        self.model = model
+        self.timeout_s = timeout_s
+
+    def _post(self, method: str, payload: Dict[str, Any]) -> Any:
+        if self.model is not None:
+            payload = {**payload, "model": self.model}
+        req = urllib.request.Request(
+            f"{self.base_url}/v1/{method}",
+            data=json.dumps(payload, ensure_ascii=False).encode("utf-8"),
+            headers={"Content-Type": "application/json"}, method="POST")
+        try:
+            with urllib.request.urlopen(req, timeout=self.timeout_s) as resp:
+                body = json.loads(resp.read().decode("utf-8"))
+        except (urllib.error.URLError, OSError, ValueError) as exc:
+            raise LLMError(f"LLM HTTP call failed: {method}: {exc}") from exc
+        if not isinstance(body, dict) or "result" not in body:
+            raise LLMError(f"malformed LLM response for {method}: {body!r:.200}")
+        return body["result"]
+
+    def generate(self, prompt: str, max_tokens: int = 256) -> str:
+        return str(self._post("generate", {"prompt": prompt, "max_tokens": max_tokens}))
+
+    def generate_lines(self, prompt: str, n_lines: int = 6,
+                       max_tokens: int = 512) -> List[str]:
+        out = self._post("generate_lines", {"prompt": prompt, "n_lines": n_lines,
+                                            "max_tokens": max_tokens})
+        return [str(x) for x in out] if isinstance(out, list) else str(out).splitlines()
+
+    def generate_json(self, prompt: str, schema_hint: Optional[str] = None,
+                      max_tokens: int = 512) -> Any:
+        return self._post("generate_json", {"prompt": prompt, "schema_hint": schema_hint,
+                                            "max_tokens": max_tokens})
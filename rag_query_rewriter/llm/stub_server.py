@@ -0,0 +1,148 @@
+"""Local LLM stub server with injectable latency, for measuring LLM round trips offline.
+
+    python -m rag_query_rewriter.llm.stub_server --port 8088 --latency-ms 80
+"""
+from __future__ import annotations
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Optional
+import argparse
+import json
+import random
+import threading
+import time
+
+from loguru import logger
+
+from .base import LLMClient
+from .dummy import DummyLLM
+
+_METHODS = ("generate", "generate_lines", "generate_json")
+
+
+class StubLLMServer:
+    """以 DummyLLM（或任意 LLMClient）应答 HTTPLLMClient 协议的本地服务。
+
+    中文说明：
+        - 每个请求先休眠 latency_ms（± jitter_ms 均匀抖动）再应答，模拟真实服务的往返；
+        - 按方法统计请求数，GET /stats 返回计数，POST /reset 清零，用于度量往返次数；
+        - port=0 时由系统分配端口，start() 后通过 url 属性获取地址。
+    """
+
+    def __init__(self, llm: Optional[LLMClient] = None, host: str = "127.0.0.1",
+                 port: int = 0, latency_ms: float = 0.0, jitter_ms: float = 0.0) -> None:
+        self.llm = llm if llm is not None else DummyLLM()
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self._counts: Dict[str, int] = {m: 0 for m in _METHODS}
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer((host, port), self._handler())
+        self._httpd.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {**self._counts, "total": sum(self._counts.values())}
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counts = {m: 0 for m in _METHODS}
+
+    def _answer(self, method: str, req: Dict[str, Any]) -> Any:
+        with self._lock:
+            self._counts[method] += 1
+        delay = self.latency_ms + random.uniform(-self.jitter_ms, self.jitter_ms)
+        if delay > 0:
+            time.sleep(delay / 1000)
+        prompt = str(req.get("prompt", ""))
+        if method == "generate":
+            return self.llm.generate(prompt, max_tokens=int(req.get("max_tokens", 256)))
+        if method == "generate_lines":
+            return self.llm.generate_lines(prompt, n_lines=int(req.get("n_lines", 6)),
+                                           max_tokens=int(req.get("max_tokens", 512)))
+        return self.llm.generate_json(prompt, schema_hint=req.get("schema_hint"),
+                                      max_tokens=int(req.get("max_tokens", 512)))
+
+    def _handler(self) -> type:
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _send(self, code: int, body: Any) -> None:
+                raw = json.dumps(body, ensure_ascii=False).encode("utf-8")
+                self.send_response(code)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(raw)))
+                self.end_headers()
+                self.wfile.write(raw)
+
+            def do_GET(self) -> None:  # noqa: N802
+                if self.path == "/stats":
+                    self._send(200, server.stats())
+                else:
+                    self._send(404, {"error": "not found"})
+
+            def do_POST(self) -> None:  # noqa: N802
+                if self.path == "/reset":
+                    server.reset()
+                    self._send(200, {"ok": True})
+                    return
+                method = self.path.rsplit("/", 1)[-1]
+                if not self.path.startswith("/v1/") or method not in _METHODS:
+                    self._send(404, {"error": "unknown method"})
+                    return
+                try:
+                    n = int(self.headers.get("Content-Length") or 0)
+                    req = json.loads(self.rfile.read(n).decode("utf-8") or "{}")
+                    self._send(200, {"result": server._answer(method, req)})
+                except Exception as exc:  # noqa: BLE001
+                    self._send(500, {"error": str(exc)})
+
+            def log_message(self, fmt: str, *args: Any) -> None:
+                logger.debug("stub-llm: " + fmt, *args)
+
+        return Handler
+
+    def start(self) -> "StubLLMServer":
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True,
+                                        name="stub-llm")
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self) -> "StubLLMServer":
+        return self.start()
+
+    def __exit__(self, *exc: Any) -> None:
+        self.stop()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Local LLM stub server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8088)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    args = parser.parse_args()
+    server = StubLLMServer(host=args.host, port=args.port, latency_ms=args.latency_ms,
+                           jitter_ms=args.jitter_ms)
+    logger.info("LLM 桩服务: {} latency={}ms", server.url, args.latency_ms)
+    try:
+        server._httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server._httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,248 @@
+"""Native asyncio Rewrite→Retrieve→Fuse pipeline (no thread per in-flight call)."""
+from __future__ import annotations
+
+from typing import Any, Awaitable, Dict, List, Optional, Tuple
+from loguru import logger
+import asyncio
+import time
+
+from ..config import AppConfig
+from ..llm.base import AsyncLLMClient
+from ..retrievers.base import AsyncRetriever, SearchResult
+from ..rewrite.multiquery import amultiquery_rewrite
+from ..rewrite.decompose import decompose_into_subqueries
+from ..rewrite.hyde import ahyde_generate
+from ..rewrite.self_query import aextract_filters
+from ..rewrite.prf import arm3_expand_query, get_doc_term_stats
+from ..rewrite.combined import acombined_rewrite, combined_outputs
+from ..utils.deadline import Deadline
+from ..utils.embedding import get_embedder
+from ..telemetry.core import DISABLED, Telemetry, get_telemetry
+from .orchestrator import (
+    _BRANCH_ORDER, _TOPK, _assemble, _fuse, _initial_values, _normalize, _put_rewrite,
+    _rewrite_prefix, _select_final,
+)
+from .response_cache import get_response_cache, response_fingerprint
+
+_MISSING = object()  # 截止时间内未产出
+
+
+async def _within(aw: Awaitable[Any], timeout_s: Optional[float]) -> Any:
+    """在 timeout_s 秒内等待 aw（None 不限时）；超时取消并返回 _MISSING。"""
+    try:
+        return await asyncio.wait_for(aw, timeout_s)
+    except asyncio.TimeoutError:
+        return _MISSING
+
+
+async def _ahyde(llm: AsyncLLMClient, cqr: str) -> List[str]:
+    return [await ahyde_generate(llm, cqr)]
+
+
+async def _asearch(retriever: AsyncRetriever, idx: int, q: str,
+                   filters: Optional[Dict[str, Any]], topk: int = _TOPK,
+                   tel: Telemetry = DISABLED, deadline: Optional[Deadline] = None,
+                   per_call_s: Optional[float] = None) -> Optional[List[SearchResult]]:
+    """单条检索：失败返回空结果，超出单次超时或请求截止时间返回 None（部分融合）。"""
+    timeout = deadline.cap(per_call_s) if deadline is not None else per_call_s
+    try:
+        with tel.span("retrieve.call", kind="retrieval", n_queries=1,
+                      backend=getattr(retriever, "name", type(retriever).__name__)):
+            return await asyncio.wait_for(retriever.search(q, topk, filters), timeout)
+    except asyncio.TimeoutError:
+        logger.warning("检索超时放弃: idx={} timeout={}s", idx, timeout)
+        return None
+    except Exception as exc:  # noqa: BLE001
+        logger.warning("检索失败: idx={} exc={}", idx, exc)
+        return []
+
+
+async def _aretrieve_batch(retriever: AsyncRetriever, queries: List[str],
+                           filters: Optional[Dict[str, Any]], topk: int = _TOPK,
+                           tel: Telemetry = DISABLED, deadline: Optional[Deadline] = None,
+                           per_call_s: Optional[float] = None
+                           ) -> List[Optional[List[SearchResult]]]:
+    """并发检索批次（协程并发，失败的候选返回空结果，超时的候选为 None）。"""
+    return list(await asyncio.gather(
+        *(_asearch(retriever, i, q, filters, topk, tel, deadline, per_call_s)
+          for i, q in enumerate(queries))
+    ))
+
+
+async def _acqr_and_prf(retriever: AsyncRetriever, cqr: str, cfg: AppConfig,
+                        filters: Optional[Dict[str, Any]], deadline: Deadline,
+                        per_call_s: Optional[float]
+                        ) -> Tuple[Optional[List[SearchResult]], str, Optional[List[SearchResult]]]:
+    """CQR 检索兼作 PRF 首跳：返回 (CQR 池, 扩展查询, 扩展查询的池)；首跳缺失时不扩展。"""
+    tel = get_telemetry(cfg)
+    first = (await _aretrieve_batch(retriever, [cqr], filters,
+                                    topk=max(_TOPK, cfg.prf.topk_initial), tel=tel,
+                                    deadline=deadline, per_call_s=per_call_s))[0]
+    with tel.span("prf", kind="stage"):
+        expanded = await arm3_expand_query(retriever, cqr, cfg.prf.topk_initial,
+                                           cfg.prf.expansion_terms, cfg.prf.stopwords,
+                                           first_hop=first or [], min_idf=cfg.prf.min_idf,
+                                           stats=get_doc_term_stats(cfg.prf))
+    second = (await _aretrieve_batch(retriever, [expanded], filters, tel=tel,
+                                     deadline=deadline, per_call_s=per_call_s))[0]
+    return first[:_TOPK] if first else first, expanded, second
+
+
+async def arewrite_and_retrieve(q: str, ctx: str, cfg: AppConfig,
+                                llm: AsyncLLMClient,
+                                retriever: AsyncRetriever) -> Dict[str, Any]:
+    """rewrite_and_retrieve 的异步版本，返回结构一致。
+
+    中文说明：
+        - MultiQuery / HyDE / Self-Query 三路 LLM 调用并发执行；CQR 检索兼作 PRF 首跳，
+          与其余候选的检索并发；
+        - 候选检索以协程并发，不为每个在途调用占用线程；
+        - 规范化 / CQR / RRF / MMR 为 CPU 轻量步骤，直接在事件循环中执行；
+        - 异步检索器没有向量检索接口，HyDE 假想文档仍以文本检索；
+        - 与同步版本共用改写前缀与缓存辅助函数：cfg.timeouts.request_budget_ms 为请求截止时间，
+          截止前未产出的 LLM 改写分支不计入候选（记入 metrics.stages_abandoned）；
+          search_timeout_ms 为单次检索超时，超时的检索池以 None 参与部分融合
+          （记入 metrics.retrieval_missed）；cfg.cache.enabled 时启用响应层与改写层缓存；
+          metrics.stage_ms 记录 normalize / cqr / route / rewrite / retrieve / fuse / mmr 耗时；
+        - 与同步版本的差异：不支持 early_exit 分段执行、对冲请求与检索池缓存层，检索不经
+          共享执行器（无隔离舱 / 背压，metrics 中没有 retrieval_shed / retrieval_hedged /
+          executor_queue_depth），也不向自适应路由记录收益；
+        - 埋点与同步版本一致（请求 span 下为 normalize / cqr / route / rewrite / retrieve /
+          fuse / mmr 阶段 span），协程间经 contextvars 自动传递父 span。
+    """
+    tel = get_telemetry(cfg)
+    with tel.span("rewrite_and_retrieve", kind="request", mode="async") as span:
+        out = await _arewrite_and_retrieve(q, ctx, cfg, llm, retriever, tel)
+        span.set("cache", out["metrics"]["cache"].get("response", "disabled"))
+    tel.record_request(out["metrics"], mode="async")
+    return out
+
+
+async def _arewrite_and_retrieve(q: str, ctx: str, cfg: AppConfig, llm: AsyncLLMClient,
+                                 retriever: AsyncRetriever, tel: Telemetry) -> Dict[str, Any]:
+    """arewrite_and_retrieve 的主体。"""
+    t0 = time.perf_counter()
+    deadline = Deadline(cfg.timeouts.request_budget_ms)
+    per_call = cfg.timeouts.search_timeout_ms / 1000.0 if cfg.timeouts.search_timeout_ms else None
+    stage_ms: Dict[str, float] = {}
+    logger.info("原始问题: {}", q)
+
+    with tel.span("normalize", kind="stage"):
+        q_norm = _normalize(q, cfg)
+    stage_ms["normalize"] = (time.perf_counter() - t0) * 1000
+
+    cache = get_response_cache(cfg)
+    cache_info: Dict[str, Any] = {"response": "disabled"}
+    resp_fp = ""
+    if cache is not None:
+        resp_fp = response_fingerprint(cfg, llm, retriever)
+        out, status = cache.get_response(resp_fp, q_norm, ctx)
+        if out is not None:
+            logger.info("响应缓存命中: {}", status)
+            out["metrics"]["elapsed_ms"] = int((time.perf_counter() - t0) * 1000)
+            out["metrics"]["cache"] = {"response": status}
+            return out
+
+    cqr, plan, cached, rewrite_fp = _rewrite_prefix(q_norm, ctx, cfg, llm, cache, tel, stage_ms)
+    if cache is not None:
+        cache_info = {"response": status, "rewrite": "miss" if cached is None else "hit"}
+
+    # D. 候选生成：未命中缓存的 LLM 改写并发执行，截止时间内未产出的分支放弃
+    values = _initial_values(cqr, plan, cached)
+    t_r = time.perf_counter()
+    with tel.span("rewrite", kind="stage"):
+        outputs = [k for k in combined_outputs(plan) if k not in values]
+        if cfg.router.combined_prompt and len(outputs) >= 2:
+            # 组合提示词：多路 LLM 改写合并为一次请求
+            combo = await _within(acombined_rewrite(
+                llm, cqr, outputs, max_queries=cfg.router.max_queries,
+                dedup_thr=cfg.router.dedup_cosine_thr, embedder=get_embedder(cfg.embedding)),
+                deadline.remaining_s())
+            if combo is not _MISSING:
+                values.update((k, combo[k]) for k in outputs)
+        else:
+            jobs: Dict[str, Awaitable[Any]] = {}
+            if "multiquery" in outputs:
+                jobs["multiquery"] = amultiquery_rewrite(
+                    llm, cqr, max_queries=cfg.router.max_queries,
+                    dedup_thr=cfg.router.dedup_cosine_thr, embedder=get_embedder(cfg.embedding))
+            if "hyde" in outputs:
+                jobs["hyde"] = _ahyde(llm, cqr)
+            if "filters" in outputs:
+                jobs["filters"] = aextract_filters(llm, cqr)
+            done = await asyncio.gather(*(_within(aw, deadline.remaining_s())
+                                          for aw in jobs.values()))
+            values.update((k, v) for k, v in zip(jobs, done) if v is not _MISSING)
+        if plan.use_decompose and "decompose" not in values:
+            values["decompose"] = decompose_into_subqueries(cqr)
+    t_rw = time.perf_counter()
+    stage_ms["rewrite"] = (t_rw - t_r) * 1000
+    abandoned = ["self_query" if k == "filters" else k for k in outputs if k not in values]
+
+    # E. 检索：CQR 池兼作 PRF 首跳（PRF 不再单独检索），其余候选同时并发检索；
+    # Self-Query 未产出时与同步版本一致，全部检索放弃，候选以 None 池参与融合
+    others = [b for b in ("multiquery", "decompose", "hyde") if b in values]
+    flat = [c for b in others for c in values[b]]
+    filters = values.get("filters") or None
+    got: Dict[str, Tuple[List[str], List[Optional[List[SearchResult]]]]] = {}
+    with tel.span("retrieve", kind="stage"):
+        if "filters" not in values:
+            rest: List[Optional[List[SearchResult]]] = [None] * len(flat)
+            got["cqr"] = ([cqr], [None])
+            abandoned.extend(f"retrieve:{b}" for b in ["cqr", *others])
+            if plan.use_prf:
+                abandoned.append("prf")
+        elif plan.use_prf:
+            (cqr_pool, prf, prf_pool), rest = await asyncio.gather(
+                _acqr_and_prf(retriever, cqr, cfg, filters, deadline, per_call),
+                _aretrieve_batch(retriever, flat, filters, tel=tel,
+                                 deadline=deadline, per_call_s=per_call))
+            got["cqr"], got["prf"] = ([cqr], [cqr_pool]), ([prf], [prf_pool])
+        else:
+            pools = await _aretrieve_batch(retriever, [cqr, *flat], filters, tel=tel,
+                                           deadline=deadline, per_call_s=per_call)
+            got["cqr"], rest = ([cqr], pools[:1]), pools[1:]
+        i = 0
+        for b in others:
+            got[b] = (values[b], rest[i:i + len(values[b])])
+            i += len(values[b])
+    if abandoned:
+        logger.warning("超出请求预算，放弃阶段: {}", abandoned)
+    candidates: List[str] = []
+    sources: List[str] = []
+    pools = []
+    for b in _BRANCH_ORDER:
+        if b in got:
+            candidates.extend(got[b][0])
+            sources.extend([b] * len(got[b][0]))
+            pools.extend(got[b][1])
+    sq_filters = values.get("filters") or {}
+    logger.info("候选查询条数: {}", len(candidates))
+    t_retr_e = time.perf_counter()
+    stage_ms["retrieve"] = (t_retr_e - t_rw) * 1000
+
+    with tel.span("fuse", kind="stage"):
+        fused = _fuse(pools, sources, cfg)
+    t_g = time.perf_counter()
+    stage_ms["fuse"] = (t_g - t_retr_e) * 1000
+    with tel.span("mmr", kind="stage"):
+        final_docs = _select_final(cqr, fused, cfg)
+    t1 = time.perf_counter()
+    stage_ms["mmr"] = (t1 - t_g) * 1000
+    missed = sum(p is None for p in pools)
+
+    if cache is not None:
+        _put_rewrite(cache, rewrite_fp, q_norm, ctx, cqr, plan, cached, values)
+
+    out = _assemble(q_norm, cqr, plan, sq_filters, candidates, fused, final_docs, {
+        "elapsed_ms": int((t1 - t0) * 1000),
+        "rewrite_ms": int((t_rw - t0) * 1000),
+        "retrieval_ms": int((t_retr_e - t_rw) * 1000),
+        "stage_ms": {k: round(v, 3) for k, v in stage_ms.items()},
+        "retrieval_missed": missed,
+        "stages_abandoned": abandoned,
+        "cache": cache_info,
+    })
+    if cache is not None and not (abandoned or missed):
+        cache.put_response(resp_fp, q_norm, ctx, out)
+    return out
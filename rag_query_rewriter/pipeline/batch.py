@@ -0,0 +1,239 @@
+"""Batched Rewrite→Retrieve→Fuse pipeline for throughput-oriented offline runs."""
+from __future__ import annotations
+
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+from itertools import islice
+from loguru import logger
+import time
+
+from ..config import AppConfig
+from ..llm.base import LLMClient
+from ..retrievers.base import Retriever, SearchResult
+from ..rewrite.cqr import cqr_rewrite
+from ..rewrite.multiquery import (
+    N_LINES, build_multiquery_prompt, fallback_lines, finalize_multiquery, multiquery_candidates,
+)
+from ..rewrite.decompose import decompose_into_subqueries
+from ..rewrite.hyde import MAX_TOKENS as HYDE_MAX_TOKENS, build_hyde_prompt
+from ..rewrite.self_query import build_self_query_prompt, coerce_filters
+from ..utils.embedding import get_embedder
+from ..telemetry.core import Telemetry, get_telemetry
+from ..utils.similarity import DocVectorCache, TfidfEmbedder
+from .orchestrator import (
+    _TOPK, _assemble, _fuse, _hyde_retriever, _normalize, _plan, _prf_expand, _retrieve_batch,
+    _select_final,
+)
+from .response_cache import filters_key
+
+
+def _batch_call(fn_batch, fn_single, prompts: List[str], what: str) -> List[Any]:
+    """批量调用 LLM；整批失败时逐条重试，单条失败记为 None。"""
+    if not prompts:
+        return []
+    try:
+        out = fn_batch(prompts)
+        if len(out) == len(prompts):
+            return list(out)
+        logger.warning("LLM 批量 {} 返回条数不符: {} != {}", what, len(out), len(prompts))
+    except Exception as exc:  # noqa: BLE001
+        logger.warning("LLM 批量 {} 失败，逐条重试：{}", what, exc)
+    results: List[Any] = []
+    for p in prompts:
+        try:
+            results.append(fn_single(p))
+        except Exception as exc:  # noqa: BLE001
+            logger.warning("LLM {} 失败：{}", what, exc)
+            results.append(None)
+    return results
+
+
+def _run_batch(items: List[Tuple[str, str]], cfg: AppConfig,
+               llm: LLMClient, retriever: Retriever, tel: Telemetry) -> List[Dict[str, Any]]:
+    """处理一个批次，返回与输入同序的结果（各步骤在批次 span 下记录阶段 span）。"""
+    t0 = time.perf_counter()
+    n = len(items)
+
+    # A-C. 规范化 / CQR / 路由（逐条，代价低）
+    with tel.span("prepare", kind="stage"):
+        norms = [_normalize(q, cfg) for q, _ in items]
+        cqrs = [cqr_rewrite(qn, history_brief=ctx) for qn, (_, ctx) in zip(norms, items)]
+        plans = [_plan(c, cfg) for c in cqrs]
+
+    # D1. 批量 LLM 调用（每种策略一次批量请求）
+    mq_idx = [i for i in range(n) if plans[i].use_multiquery]
+    hy_idx = [i for i in range(n) if plans[i].use_hyde]
+    sq_idx = [i for i in range(n) if plans[i].use_self_query]
+
+    with tel.span("llm_batch", kind="stage"):
+        mq_lines = _batch_call(
+            lambda ps: llm.generate_lines_batch(ps, n_lines=N_LINES),
+            lambda p: llm.generate_lines(p, n_lines=N_LINES),
+            [build_multiquery_prompt(cqrs[i]) for i in mq_idx], "multiquery",
+        )
+        hyde_docs = _batch_call(
+            lambda ps: llm.generate_batch(ps, max_tokens=HYDE_MAX_TOKENS),
+            lambda p: llm.generate(p, max_tokens=HYDE_MAX_TOKENS),
+            [build_hyde_prompt(cqrs[i]) for i in hy_idx], "hyde",
+        )
+        sq_raw = _batch_call(
+            llm.generate_json_batch, llm.generate_json,
+            [build_self_query_prompt(cqrs[i]) for i in sq_idx], "self_query",
+        )
+
+    # D2. MultiQuery 去重：使用共享嵌入器，未配置时整批只拟合一次 TF-IDF
+    shared = get_embedder(cfg.embedding)
+    mq_out: Dict[int, List[str]] = {}
+    if mq_idx:
+        lines_by_q = {i: (lines if lines is not None else fallback_lines(cqrs[i]))
+                      for i, lines in zip(mq_idx, mq_lines)}
+        vocab_texts = [t for i in mq_idx for t in multiquery_candidates(cqrs[i], lines_by_q[i])
+                       if t.strip()]
+        embedder: Any = shared
+        if vocab_texts and shared is None:
+            embedder = TfidfEmbedder()
+            embedder.fit_transform(list(dict.fromkeys(vocab_texts)))
+        for i in mq_idx:
+            mq_out[i] = finalize_multiquery(cqrs[i], lines_by_q[i], cfg.router.max_queries,
+                                            cfg.router.dedup_cosine_thr, embedder=embedder)
+
+    hyde_by_q = {i: d for i, d in zip(hy_idx, hyde_docs) if d}
+    filters_by_q = {i: coerce_filters(d) for i, d in zip(sq_idx, sq_raw)}
+    fkeys = [filters_key(filters_by_q.get(i) or {}) for i in range(n)]
+
+    # D3. PRF 首跳：需要 PRF 的 CQR 按 filters 分组先行检索（深度取 PRF 首跳与终选的较大者），
+    #     结果既是 RM3 的反馈集，也（截断后）作为 CQR 自身的检索池
+    t_retr_s = time.perf_counter()
+    pool_cache: Dict[Tuple[str, str, str], Optional[List[SearchResult]]] = {}
+    first_hops: Dict[Tuple[str, str], Optional[List[SearchResult]]] = {}
+    prf_groups: Dict[str, Tuple[Optional[Dict[str, Any]], List[str]]] = {}
+    for i in range(n):
+        if plans[i].use_prf:
+            prf_groups.setdefault(fkeys[i], (filters_by_q.get(i) or None, []))[1].append(cqrs[i])
+    depth = max(_TOPK, cfg.prf.topk_initial)
+    with tel.span("retrieve:first_hop", kind="stage"):
+        for fk, (f, texts) in prf_groups.items():
+            uniq = list(dict.fromkeys(texts))
+            for text, pool in zip(uniq, _retrieve_batch(retriever, uniq, filters=f, cfg=cfg,
+                                                        topk=depth)):
+                first_hops[(fk, text)] = pool
+                pool_cache[("text", fk, text)] = pool[:_TOPK] if pool is not None else None
+
+    # D4. 候选汇总（相同 (filters, CQR) 只扩展一次）
+    prf_cache: Dict[Tuple[str, str], str] = {}
+    candidates_all: List[List[str]] = []
+    sources_all: List[List[str]] = []  # 与候选一一对应的来源分支（用于加权融合）
+    for i in range(n):
+        cqr, plan = cqrs[i], plans[i]
+        cands, srcs = [cqr], ["cqr"]
+        if plan.use_multiquery:
+            cands.extend(mq_out[i])
+            srcs.extend(["multiquery"] * len(mq_out[i]))
+        if plan.use_decompose:
+            subs = decompose_into_subqueries(cqr)
+            cands.extend(subs)
+            srcs.extend(["decompose"] * len(subs))
+        if plan.use_prf:
+            key = (fkeys[i], cqr)
+            if key not in prf_cache:
+                prf_cache[key] = _prf_expand(retriever, cqr, first_hops[key], cfg)
+            cands.append(prf_cache[key])
+            srcs.append("prf")
+        if i in hyde_by_q:
+            cands.append(hyde_by_q[i])
+            srcs.append("hyde")
+        candidates_all.append(cands)
+        sources_all.append(srcs)
+
+    # E. 检索：跨查询对 (检索路径, filters, 候选文本) 去重后按 filters 分组并行检索
+    #    （首跳已取得的 CQR 池直接复用）；HyDE 假想文档在检索器支持时走向量路径
+    hyde_retriever = _hyde_retriever(retriever, cfg)
+    hyde_route = "vector" if hyde_retriever is not retriever else "text"
+
+    def route(i: int, j: int) -> str:
+        return hyde_route if sources_all[i][j] == "hyde" else "text"
+
+    groups: Dict[Tuple[str, str], Tuple[Optional[Dict[str, Any]], List[str]]] = {}
+    for i, cands in enumerate(candidates_all):
+        f = filters_by_q.get(i) or None
+        for j, c in enumerate(cands):
+            if (route(i, j), fkeys[i], c) not in pool_cache:
+                groups.setdefault((route(i, j), fkeys[i]), (f, []))[1].append(c)
+    with tel.span("retrieve", kind="stage"):
+        for (rt, fk), (f, texts) in groups.items():
+            uniq = list(dict.fromkeys(texts))
+            r = hyde_retriever if rt == "vector" else retriever
+            for text, pool in zip(uniq, _retrieve_batch(r, uniq, filters=f, cfg=cfg)):
+                pool_cache[(rt, fk, text)] = pool
+    t_retr_e = time.perf_counter()
+    total_cands = sum(len(c) for c in candidates_all)
+    logger.info("批量检索完成：queries={} candidates={} unique={} cost={}ms",
+                n, total_cands, len(pool_cache), int((t_retr_e - t_retr_s) * 1000))
+
+    # F. 融合（逐条，按来源加权）
+    with tel.span("fuse", kind="stage"):
+        fused_all: List[List[SearchResult]] = []
+        for i in range(n):
+            pools = [pool_cache[(route(i, j), fkeys[i], c)]
+                     for j, c in enumerate(candidates_all[i])]
+            fused_all.append(_fuse(pools, sources_all[i], cfg))
+
+    # G. MMR：共享嵌入器自带缓存；否则整批只拟合一次 TF-IDF，批内重复文档只向量化一次
+    doc_cache: Optional[DocVectorCache] = None
+    mmr_texts = list(dict.fromkeys(
+        [c for c in cqrs if c.strip()]
+        + [r.text for fused in fused_all for r in fused if r.text and r.text.strip()]))
+    if mmr_texts and shared is None:
+        doc_cache = DocVectorCache(TfidfEmbedder().fit(mmr_texts))
+    with tel.span("mmr", kind="stage"):
+        outs: List[Dict[str, Any]] = []
+        for i in range(n):
+            final_docs = _select_final(cqrs[i], fused_all[i], cfg, doc_cache=doc_cache)
+            outs.append(_assemble(norms[i], cqrs[i], plans[i], filters_by_q.get(i) or {},
+                                  candidates_all[i], fused_all[i], final_docs, {}))
+
+    t1 = time.perf_counter()
+    batch_ms = int((t1 - t0) * 1000)
+    for out in outs:
+        out["metrics"].update({
+            "elapsed_ms": batch_ms // max(1, n),  # 批内均摊耗时
+            "retrieval_ms": int((t_retr_e - t_retr_s) * 1000),
+            "batch_elapsed_ms": batch_ms,
+            "batch_size": n,
+            "batch_unique_retrievals": len(pool_cache),
+        })
+    return outs
+
+
+def iter_rewrite_and_retrieve_many(items: Iterable[Tuple[str, str]], cfg: AppConfig,
+                                   llm: LLMClient, retriever: Retriever,
+                                   batch_size: int = 256) -> Iterator[Dict[str, Any]]:
+    """流式批处理：按 batch_size 切块消费 (query, ctx) 迭代器，按输入顺序逐条产出结果。"""
+    if batch_size <= 0:
+        raise ValueError("batch_size must be positive")
+    it = iter(items)
+    while True:
+        chunk = list(islice(it, batch_size))
+        if not chunk:
+            return
+        tel = get_telemetry(cfg)
+        with tel.span("rewrite_and_retrieve_many", kind="request", mode="batch",
+                      batch_size=len(chunk)):
+            outs = _run_batch(chunk, cfg, llm, retriever, tel)
+        for out in outs:
+            tel.record_request(out["metrics"], mode="batch")
+        yield from outs
+
+
+def rewrite_and_retrieve_many(items: Iterable[Tuple[str, str]], cfg: AppConfig,
+                              llm: LLMClient, retriever: Retriever,
+                              batch_size: int = 256) -> List[Dict[str, Any]]:
+    """批量端到端：改写→检索→融合→去冗选择，结果与输入同序。
+
+    中文说明：
+        - LLM 调用按策略合并为批量请求（generate_*_batch）；
+        - MultiQuery 去重与 MMR 终选各自整批共享一次 TF-IDF 拟合；
+        - 相同 (候选, filters) 的检索在批内只执行一次；PRF 复用 CQR 的首跳检索池；
+        - 每条结果的 metrics 额外包含批次耗时、批大小与去重后的检索次数。
+    """
+    return list(iter_rewrite_and_retrieve_many(items, cfg, llm, retriever,
+                                               batch_size=batch_size))
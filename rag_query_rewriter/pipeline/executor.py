@@ -0,0 +1,223 @@
+"""Process-wide executors: bounded retrieval pool with bulkheads and backpressure."""
+from __future__ import annotations
+
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable, Deque, Dict, Optional
+import os
+import threading
+
+from loguru import logger
+from ..config import ExecutorConfig, TimeoutConfig
+from ..exceptions import RetrievalOverloadError
+
+
+class RetrievalExecutor:
+    """长生命周期的检索执行器。
+
+    中文说明：
+        - 全局并发上限 max_workers，额外最多 max_queue 个任务排队；
+        - 每个后端（retriever 名称）在途任务数不超过 per_backend_limit，慢后端不会挤占全部线程；
+        - 饱和时按 overload_policy 处理："shed" 返回 None（调用方按空结果处理），
+          "reject" 抛出 RetrievalOverloadError；
+        - stats() 提供排队深度、在途数及累计计数。
+    """
+
+    def __init__(self, max_workers: int = 32, max_queue: int = 256,
+                 per_backend_limit: int = 64, overload_policy: str = "shed") -> None:
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.per_backend_limit = per_backend_limit
+        self.overload_policy = overload_policy
+        self._pool = ThreadPoolExecutor(max_workers=max_workers,
+                                        thread_name_prefix="rqw-retrieval")
+        self._lock = threading.Lock()
+        self._in_flight = 0  # 已接收未完成（执行中 + 排队）
+        self._running = 0
+        self._per_backend: Dict[str, int] = {}
+        self._counters = {"submitted": 0, "completed": 0, "shed": 0, "rejected": 0,
+                          "max_queue_depth": 0}
+
+    @classmethod
+    def from_config(cls, cfg: ExecutorConfig) -> "RetrievalExecutor":
+        return cls(max_workers=cfg.max_workers, max_queue=cfg.max_queue,
+                   per_backend_limit=cfg.per_backend_limit,
+                   overload_policy=cfg.overload_policy)
+
+    def submit(self, backend: str, fn: Callable[..., Any], *args: Any) -> Optional[Future]:
+        """提交检索任务；饱和时按策略返回 None 或抛出 RetrievalOverloadError。"""
+        with self._lock:
+            n_backend = self._per_backend.get(backend, 0)
+            if (self._in_flight >= self.max_workers + self.max_queue
+                    or n_backend >= self.per_backend_limit):
+                return self._overload(backend)
+            self._in_flight += 1
+            self._per_backend[backend] = n_backend + 1
+            self._counters["submitted"] += 1
+            depth = self._in_flight - self._running
+            if depth > self._counters["max_queue_depth"]:
+                self._counters["max_queue_depth"] = depth
+        try:
+            fut = self._pool.submit(self._run, backend, fn, *args)
+        except RuntimeError:
+            self._release(backend, started=False)
+            raise
+        fut.add_done_callback(partial(self._on_done, backend))
+        return fut
+
+    def _on_done(self, backend: str, fut: Future) -> None:
+        if fut.cancelled():  # 排队中被撤回：_run 不会执行，在此归还名额
+            self._release(backend, started=False)
+
+    def _overload(self, backend: str) -> None:
+        if self.overload_policy == "reject":
+            self._counters["rejected"] += 1
+            raise RetrievalOverloadError(
+                f"retrieval executor saturated (backend={backend}, in_flight={self._in_flight})")
+        self._counters["shed"] += 1
+        logger.warning("检索执行器饱和，丢弃任务: backend={} in_flight={}",
+                       backend, self._in_flight)
+        return None
+
+    def _run(self, backend: str, fn: Callable[..., Any], *args: Any) -> Any:
+        with self._lock:
+            self._running += 1
+        try:
+            return fn(*args)
+        finally:
+            self._release(backend, started=True)
+
+    def _release(self, backend: str, started: bool) -> None:
+        with self._lock:
+            self._in_flight -= 1
+            if started:
+                self._running -= 1
+                self._counters["completed"] += 1
+            left = self._per_backend.get(backend, 1) - 1
+            if left > 0:
+                self._per_backend[backend] = left
+            else:
+                self._per_backend.pop(backend, None)
+
+    def stats(self) -> Dict[str, Any]:
+        """当前排队深度、在途数、分后端在途数与累计计数快照。"""
+        with self._lock:
+            return {
+                "queue_depth": self._in_flight - self._running,
+                "running": self._running,
+                "in_flight": self._in_flight,
+                "per_backend": dict(self._per_backend),
+                **self._counters,
+            }
+
+    def shutdown(self, wait: bool = True) -> None:
+        self._pool.shutdown(wait=wait)
+
+
+_lock = threading.Lock()
+_retrieval: Optional[RetrievalExecutor] = None
+_stages: Optional[ThreadPoolExecutor] = None
+
+
+def get_retrieval_executor(cfg: Optional[ExecutorConfig] = None) -> RetrievalExecutor:
+    """进程级检索执行器；首次调用时按 cfg 创建，之后复用（可用 set_retrieval_executor 替换）。"""
+    global _retrieval
+    if _retrieval is None:
+        with _lock:
+            if _retrieval is None:
+                _retrieval = RetrievalExecutor.from_config(cfg or ExecutorConfig())
+    return _retrieval
+
+
+def set_retrieval_executor(executor: Optional[RetrievalExecutor]) -> None:
+    """替换进程级检索执行器（传 None 则下次按配置重建）；旧执行器在已提交任务完成后关闭。"""
+    global _retrieval
+    with _lock:
+        old, _retrieval = _retrieval, executor
+    if old is not None and old is not executor:
+        old.shutdown(wait=False)
+
+
+def get_stage_executor(cfg: Optional[ExecutorConfig] = None) -> ThreadPoolExecutor:
+    """进程级阶段图线程池（与检索池分离，阶段等待检索时不会相互占满）。"""
+    global _stages
+    if _stages is None:
+        with _lock:
+            if _stages is None:
+                workers = (cfg or ExecutorConfig()).stage_workers
+                _stages = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="rqw-stage")
+    return _stages
+
+
+def _reset_after_fork() -> None:
+    """fork 出的子进程不继承父进程的工作线程：丢弃继承来的线程池与锁，首次使用时按配置重建。"""
+    global _lock, _retrieval, _stages
+    _lock = threading.Lock()
+    _retrieval = _stages = None
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def backend_name(retriever: Any) -> str:
+    """隔离舱键：优先使用 retriever.name，否则使用类名。"""
+    return str(getattr(retriever, "name", None) or type(retriever).__name__)
+
+
+class RequestCounters:
+    """单次请求内的线程安全计数器（被丢弃/超时/对冲的检索数等）。"""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._counts: Dict[str, int] = {}
+
+    def add(self, key: str, n: int = 1) -> None:
+        if n:
+            with self._lock:
+                self._counts[key] = self._counts.get(key, 0) + n
+
+    def as_dict(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._counts)
+
+
+class LatencyTracker:
+    """单后端检索耗时滑动窗口，用于推导对冲请求的触发延迟。"""
+
+    def __init__(self, window: int = 512) -> None:
+        self._lock = threading.Lock()
+        self._samples: Deque[float] = deque(maxlen=window)
+
+    def record(self, seconds: float) -> None:
+        with self._lock:
+            self._samples.append(seconds)
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def quantile(self, q: float) -> Optional[float]:
+        with self._lock:
+            data = sorted(self._samples)
+        if not data:
+            return None
+        return data[min(len(data) - 1, int(q * len(data)))]
+
+    def hedge_delay_s(self, cfg: TimeoutConfig) -> Optional[float]:
+        """对冲触发延迟：max(分位数耗时, 最小延迟)；样本不足时返回 None（不对冲）。"""
+        if not cfg.hedge_enabled or len(self) < cfg.hedge_min_samples:
+            return None
+        return max(self.quantile(cfg.hedge_quantile) or 0.0, cfg.hedge_min_delay_ms / 1000.0)
+
+
+_trackers: Dict[str, LatencyTracker] = {}
+
+
+def latency_tracker(backend: str) -> LatencyTracker:
+    """进程级分后端耗时统计。"""
+    tracker = _trackers.get(backend)
+    if tracker is None:
+        with _lock:
+            tracker = _trackers.setdefault(backend, LatencyTracker())
+    return tracker
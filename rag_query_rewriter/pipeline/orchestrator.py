@@ -1,71 +1,218 @@
 """Rewrite→Retrieve→Fuse pipeline orchestrator (parallel, safer, logged)."""
 from __future__ import annotations
 
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Tuple
 from loguru import logger
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import FIRST_COMPLETED, Future, wait
 import time
 
-from ..config import AppConfig
-from ..utils.text_norm import normalize_text, load_alias_table
+from ..config import AppConfig, EarlyExitConfig, TimeoutConfig
 from ..llm.base import LLMClient
-from ..retrievers.base import Retriever, SearchResult
+from ..retrievers.base import Retriever, SearchResult, supports_search_many
 from ..rewrite.cqr import cqr_rewrite
+from ..rewrite.fast import normalize_query
 from ..rewrite.multiquery import multiquery_rewrite
 from ..rewrite.decompose import decompose_into_subqueries
 from ..rewrite.hyde import hyde_generate
 from ..rewrite.self_query import extract_filters
-from ..rewrite.prf import rm3_expand_query
-from ..rewrite.router import choose_strategy
-from ..fusion.fuser import rrf_fuse, mmr_select
+from ..rewrite.combined import combined_outputs, combined_rewrite
+from ..rewrite.prf import get_doc_term_stats, rm3_expand_query
+from ..rewrite.router import StrategyPlan, choose_strategy
+from ..rewrite.adaptive import get_adaptive_router, strategy_gains
+from ..fusion.fuser import fuse_pools, mmr_select
+from .dag import Stage, StageGraph, StageTiming
+from .executor import (
+    LatencyTracker, RequestCounters, backend_name, get_retrieval_executor, get_stage_executor,
+    latency_tracker,
+)
+from ..utils.deadline import Deadline
+from ..telemetry.core import Telemetry, get_telemetry
+from .response_cache import (
+    ResponseCache, filters_key, get_response_cache, response_fingerprint, rewrite_fingerprint,
+)
+from ..utils.similarity import DocVectorCache
+from ..utils.embedding import get_embedder
+from ..retrievers.dense import VectorQueryRetriever, supports_vector_search
+
+_TOPK = 10  # 每个候选的检索深度
+_REWRITE_STAGES = ("multiquery", "decompose", "hyde", "filters")  # 与索引无关、可跨请求缓存的阶段产出
+_BRANCH_ORDER = ("cqr", "multiquery", "decompose", "prf", "hyde")  # 候选拼接 / 融合顺序
+
+
+def _timed(fn, tracker: LatencyTracker, tel: Optional[Telemetry] = None, backend: str = ""):
+    """包装检索调用：成功时记录执行耗时（不含排队）。
+
+    启用埋点时每次调用记录一个 kind="retrieval" 的 span，父 span 为提交方（检索阶段）的当前 span。
+    """
+    def run(*args: Any) -> Any:
+        s = time.perf_counter()
+        out = fn(*args)
+        tracker.record(time.perf_counter() - s)
+        return out
+    if tel is None or not tel.enabled:
+        return run
+    parent = tel.current_span()
+
+    def traced(*args: Any) -> Any:
+        n = len(args[0]) if isinstance(args[0], list) else 1
+        with tel.span("retrieve.call", kind="retrieval", parent=parent, backend=backend,
+                      n_queries=n):
+            return run(*args)
+    return traced
 
 
 def _retrieve_batch(retriever: Retriever, queries: List[str],
-                    filters: Dict[str, Any] | None) -> List[List[SearchResult]]:
-    """并行检索批次。"""
-    results: List[List[SearchResult]] = [None] * len(queries)  # type: ignore
-    with ThreadPoolExecutor(max_workers=min(8, max(2, len(queries)))) as ex:
-        futs = {ex.submit(retriever.search, q, 10, filters): i for i, q in enumerate(queries)}
-        for fut in as_completed(futs):
-            i = futs[fut]
-            try:
-                results[i] = fut.result()
-            except Exception as exc:  # noqa: BLE001
-                logger.warning("检索失败: idx={} exc={}", i, exc)
-                results[i] = []
+                    filters: Dict[str, Any] | None, cfg: Optional[AppConfig] = None,
+                    counters: Optional[RequestCounters] = None,
+                    deadline: Optional[Deadline] = None,
+                    cache: Optional[ResponseCache] = None,
+                    topk: int = _TOPK) -> List[Optional[List[SearchResult]]]:
+    """并行检索批次（提交到进程级检索执行器）。
+
+    中文说明：
+        - 后端提供原生 search_many 时整批作为一次调用提交，否则每条候选一次 search；
+          HyDE 向量路径传入 VectorQueryRetriever，与被包装的检索器共享隔离舱；
+        - 被丢弃或失败的候选返回空列表；超过单次超时或请求截止时间的候选返回 None
+          （放弃等待，由融合阶段做部分结果融合）；
+        - 开启对冲时，超过该后端耗时分位数仍未返回的调用会再发起一次，先返回者生效；
+        - 传入 cache 时先查检索池缓存，只检索未命中的候选，并只回填真正完成的检索。
+    """
+    if cache is None:
+        return _retrieve_uncached(retriever, queries, filters, cfg, counters, deadline, topk)[0]
+    ns, fkey = cache.retrieval_ns(retriever), filters_key(filters)
+    results = cache.get_pools(ns, fkey, queries, topk)
+    todo = [i for i, p in enumerate(results) if p is None]
+    if counters is not None:
+        counters.add("pool_hits", len(queries) - len(todo))
+        counters.add("pool_misses", len(todo))
+    if todo:
+        fresh, completed = _retrieve_uncached(retriever, [queries[i] for i in todo], filters,
+                                              cfg, counters, deadline, topk)
+        for j, i in enumerate(todo):
+            results[i] = fresh[j]
+            if j in completed:
+                cache.put_pool(ns, fkey, queries[i], topk, fresh[j])
     return results
 
 
-def rewrite_and_retrieve(q: str, ctx: str, cfg: AppConfig,
-                         llm: LLMClient, retriever: Retriever) -> Dict[str, Any]:
-    """端到端：改写→检索→融合→去冗选择。
+def _cancel(futures: List[Future]) -> None:
+    """撤回仍在排队的检索（归还隔离舱名额）；已在执行的无法中断，完成后结果被丢弃。"""
+    for fut in futures:
+        fut.cancel()
 
-    返回结构：
-        - normalized, cqr, strategy, self_query_filters
-        - candidates（所有查询候选）
-        - fused_docs（RRF 后）
-        - final_docs（MMR 终选）
-        - metrics（耗时、候选/文档计数）
-    """
-    t0 = time.perf_counter()
-    logger.info("原始问题: {}", q)
 
-    # A. 规范化
-    alias_table = load_alias_table(cfg.normalizer.alias_table_path)
-    q_norm = normalize_text(
-        q,
-        alias_table=alias_table,
-        case_fold=cfg.normalizer.enable_case_fold,
-        punct_trim=cfg.normalizer.enable_punct_trim,
-        date_normalize=cfg.normalizer.enable_date_normalize,
-    )
-    logger.info("规范化后: {}", q_norm)
+def _retrieve_uncached(retriever: Retriever, queries: List[str],
+                       filters: Dict[str, Any] | None, cfg: Optional[AppConfig],
+                       counters: Optional[RequestCounters], deadline: Optional[Deadline],
+                       topk: int = _TOPK) -> Tuple[List[Optional[List[SearchResult]]], set]:
+    """_retrieve_batch 的执行部分；返回 (结果, 真正完成检索的候选下标集合)。"""
+    if not queries:
+        return [], set()
+    ex = get_retrieval_executor(cfg.executor if cfg is not None else None)
+    tcfg = cfg.timeouts if cfg is not None else TimeoutConfig()
+    backend = backend_name(retriever)
+    tel = get_telemetry(cfg)
 
-    # B. CQR
-    cqr = cqr_rewrite(q_norm, history_brief=ctx)
-    logger.info("CQR 改写: {}", cqr)
+    # 调用单元：(覆盖的候选下标, 调用参数)
+    if supports_search_many(retriever):
+        tracker = latency_tracker(f"{backend}:many")
+        call = _timed(retriever.search_many, tracker, tel, backend)
+        units = [(list(range(len(queries))), (list(queries), topk, filters))]
+    else:
+        tracker = latency_tracker(backend)
+        call = _timed(lambda *a: [retriever.search(*a)], tracker, tel, backend)
+        units = [([i], (q, topk, filters)) for i, q in enumerate(queries)]
+    hedge_delay = tracker.hedge_delay_s(tcfg)
+    per_call = tcfg.search_timeout_ms / 1000.0 if tcfg.search_timeout_ms else None
 
-    # C. 路由
+    results: List[Optional[List[SearchResult]]] = [[] for _ in queries]
+    completed: set = set()
+    owner: Dict[Future, int] = {}
+    futs: Dict[int, List[Future]] = {}
+    started: Dict[int, float] = {}
+    hedge_tried: set = set()
+    shed = missed = hedged = 0
+    for u, (idx, args) in enumerate(units):
+        fut = ex.submit(backend, call, *args)
+        if fut is None:
+            shed += len(idx)
+            continue
+        owner[fut] = u
+        futs[u] = [fut]
+        started[u] = time.monotonic()
+
+    open_units = set(futs)
+    while open_units:
+        now = time.monotonic()
+        wake: List[float] = []
+        for u in sorted(open_units):
+            expire = started[u] + per_call if per_call is not None else None
+            if (expire is not None and now >= expire) or (deadline and deadline.expired()):
+                for i in units[u][0]:
+                    results[i] = None
+                missed += len(units[u][0])
+                open_units.discard(u)
+                _cancel(futs[u])
+                continue
+            if expire is not None:
+                wake.append(expire)
+            if hedge_delay is not None and u not in hedge_tried:
+                if now >= started[u] + hedge_delay:
+                    hedge_tried.add(u)
+                    fut = ex.submit(backend, call, *units[u][1])
+                    if fut is not None:
+                        hedged += 1
+                        owner[fut] = u
+                        futs[u].append(fut)
+                else:
+                    wake.append(started[u] + hedge_delay)
+        if not open_units:
+            break
+        timeout = max(0.0, min(wake) - now) if wake else None
+        timeout = deadline.cap(timeout) if deadline is not None else timeout
+        waiting = [f for u in open_units for f in futs[u]]
+        done, _ = wait(waiting, timeout=timeout, return_when=FIRST_COMPLETED)
+        for fut in done:
+            u = owner[fut]
+            if u not in open_units:
+                continue
+            exc = fut.exception()
+            if exc is None:
+                for i, pool in zip(units[u][0], fut.result()):
+                    results[i] = pool
+                    completed.add(i)
+                open_units.discard(u)
+                _cancel(futs[u])  # 对冲中落败的一方
+            elif all(f.done() for f in futs[u]):
+                logger.warning("检索失败: idx={} exc={}", units[u][0], exc)
+                open_units.discard(u)
+
+    if missed:
+        logger.warning("检索超时放弃: backend={} missed={}/{}", backend, missed, len(queries))
+    if counters is not None:
+        counters.add("shed", shed)
+        counters.add("missed", missed)
+        counters.add("hedged", hedged)
+    return results, completed
+
+
+def _stage_tracer(cfg: AppConfig):
+    """阶段图使用的 tracer（埋点关闭时为 None，阶段图不创建 span）。"""
+    tel = get_telemetry(cfg)
+    return tel.tracer if tel.enabled else None
+
+
+def _normalize(q: str, cfg: AppConfig) -> str:
+    """A. 规范化（别名匹配器来自进程级注册中心）。"""
+    ncfg = cfg.normalizer
+    return normalize_query(q, ncfg.alias_table_path, case_fold=ncfg.enable_case_fold,
+                           punct_trim=ncfg.enable_punct_trim,
+                           date_normalize=ncfg.enable_date_normalize,
+                           alias_reload_interval_s=ncfg.alias_reload_interval_s)
+
+
+def _plan(cqr: str, cfg: AppConfig) -> StrategyPlan:
+    """C. 策略路由；cfg.router.mode="adaptive" 时由自适应路由裁剪启发式计划。"""
     plan = choose_strategy(
         cqr,
         enable_multiquery=cfg.router.enable_multiquery,
@@ -74,51 +221,49 @@ def rewrite_and_retrieve(q: str, ctx: str, cfg: AppConfig,
         enable_prf=cfg.router.enable_prf,
         enable_self_query=cfg.router.enable_self_query,
     )
-    logger.info("策略计划: {}", plan)
-
-    # D. 候选生成
-    candidates: List[str] = [cqr]
-    if plan.use_multiquery:
-        candidates.extend(
-            multiquery_rewrite(llm, cqr, max_queries=cfg.router.max_queries,
-                               dedup_thr=cfg.router.dedup_cosine_thr)
-        )
-    if plan.use_decompose:
-        candidates.extend(decompose_into_subqueries(cqr))
-    if plan.use_prf:
-        candidates.append(rm3_expand_query(
-            retriever, cqr, cfg.prf.topk_initial, cfg.prf.expansion_terms, cfg.prf.stopwords
-        ))
+    router = get_adaptive_router(cfg)
+    return router.plan(cqr, plan) if router is not None else plan
 
-    hyde_doc = None
-    if plan.use_hyde:
-        hyde_doc = hyde_generate(llm, cqr)
-        # 在实际系统中：对 hyde_doc 做向量检索；这里简化为把其文本也作为查询候选
-        candidates.append(hyde_doc)
 
-    sq_filters = extract_filters(llm, cqr) if plan.use_self_query else {}
-    logger.info("候选查询条数: {}", len(candidates))
+def _fuse(pools: List[Optional[List[SearchResult]]], sources: List[str],
+          cfg: AppConfig) -> List[SearchResult]:
+    """F. 融合：按 cfg.fusion 选择 RRF / CombSUM / CombMNZ，各池按候选来源加权。"""
+    w = cfg.fusion.source_weights
+    return fuse_pools(pools, method=cfg.fusion.method, k=cfg.fusion.rrf_k,
+                      weights=[w.get(s, 1.0) for s in sources], top_n=cfg.fusion.top_n)
 
-    t_retr_s = time.perf_counter()
-    pools = _retrieve_batch(retriever, candidates, filters=sq_filters or None)
-    t_retr_e = time.perf_counter()
-    logger.info("检索完成：{}ms", int((t_retr_e - t_retr_s) * 1000))
 
-    # F. RRF 融合
-    fused = rrf_fuse(pools, k=cfg.fusion.rrf_k)
-    logger.info("RRF 融合候选: {}", len(fused))
+def _select_final(cqr: str, fused: List[SearchResult], cfg: AppConfig,
+                  doc_cache: Optional[DocVectorCache] = None) -> List[SearchResult]:
+    """G. MMR 去冗 + 终选。
 
-    # G. MMR 去冗 + 终选
+    中文说明：
+        - 传入 doc_cache 时复用其词表与已缓存的文档向量；
+        - 否则配置了共享嵌入器（cfg.embedding.backend != "tfidf"）时使用其带缓存的向量，
+          都没有时按请求拟合 TF-IDF。
+    """
+    docs = [r.text for r in fused]
+    doc_vectors = None
+    embedder: Any = get_embedder(cfg.embedding)
+    if doc_cache is not None:
+        embedder = doc_cache.embedder
+        if fused:
+            doc_vectors = doc_cache.matrix([r.doc_id for r in fused], docs)
     final_idx = mmr_select(
         query=cqr,
-        docs=[r.text for r in fused],
+        docs=docs,
         topk=cfg.fusion.mmr_topk,
         lamb=cfg.fusion.mmr_lambda,
+        embedder=embedder,
+        doc_vectors=doc_vectors,
     )
-    final_docs = [fused[i] for i in final_idx]
+    return [fused[i] for i in final_idx]
 
-    t1 = time.perf_counter()
 
+def _assemble(q_norm: str, cqr: str, plan: StrategyPlan, sq_filters: Dict[str, Any],
+              candidates: List[str], fused: List[SearchResult],
+              final_docs: List[SearchResult], metrics: Dict[str, Any]) -> Dict[str, Any]:
+    """组装统一的返回结构（计数类指标在此补齐）。"""
     return {
         "normalized": q_norm,
         "cqr": cqr,
@@ -128,10 +273,426 @@ def rewrite_and_retrieve(q: str, ctx: str, cfg: AppConfig,
         "fused_docs": [r.to_dict() for r in fused],
         "final_docs": [r.to_dict() for r in final_docs],
         "metrics": {
-            "elapsed_ms": int((t1 - t0) * 1000),
-            "retrieval_ms": int((t_retr_e - t_retr_s) * 1000),
+            **metrics,
             "num_candidates": len(candidates),
             "num_fused": len(fused),
             "num_final": len(final_docs),
         },
     }
+
+
+def _retrieve_stage(retriever: Retriever, src: str, cfg: AppConfig,
+                    counters: RequestCounters, deadline: Deadline,
+                    cache: Optional[ResponseCache] = None, topk: int = _TOPK):
+    """构造分支检索阶段函数：输入 filters 与分支候选列表。"""
+    def run(filters: Dict[str, Any], **kw: Any) -> List[Optional[List[SearchResult]]]:
+        return _retrieve_batch(retriever, kw[src], filters or None, cfg=cfg,
+                               counters=counters, deadline=deadline, cache=cache, topk=topk)
+    return run
+
+
+def _hyde_retriever(retriever: Retriever, cfg: AppConfig) -> Retriever:
+    """HyDE 假想文档的检索入口：支持向量检索时走嵌入 + 向量检索。"""
+    if cfg.embedding.hyde_vector and supports_vector_search(retriever):
+        return VectorQueryRetriever(retriever)
+    return retriever
+
+
+def _pick_stage(key: str, name: Optional[str] = None) -> Stage:
+    """组合提示词模式下的分支阶段：从 llm_combined 的产出中取出 key。"""
+    return Stage(name or key, lambda llm_combined: llm_combined[key],
+                 inputs=("llm_combined",), output=key)
+
+
+def _build_graph(plan: StrategyPlan, cfg: AppConfig, llm: LLMClient, retriever: Retriever,
+                 counters: RequestCounters, deadline: Deadline,
+                 cache: Optional[ResponseCache] = None,
+                 cached: Optional[Dict[str, Any]] = None,
+                 retrieve: bool = True) -> Tuple[StageGraph, List[str]]:
+    """按策略计划构建阶段图；返回 (图, 启用的候选分支，顺序即候选拼接顺序)。
+
+    中文说明：
+        - cached 为已知的阶段产出（改写缓存命中的 _REWRITE_STAGES，或分段执行中前一段的
+          产出），对应阶段不再构建，其产出作为图的已知输入（调用方需放入 initial）；
+        - cache 传给各检索阶段，用于检索池层的查找与回填；
+        - PRF 以 CQR 的检索池作为首跳（不再单独检索），启用 PRF 时 CQR 按
+          max(默认深度, prf.topk_initial) 检索，融合时截回默认深度；
+        - retrieve=False 时只构建改写阶段（计划中不能含 PRF，其首跳依赖检索）。
+    """
+    cached = cached or {}
+    stages: List[Stage] = []
+    branches = ["cqr"]
+    # 组合提示词：未命中缓存的 LLM 改写 ≥2 路时合并为一次请求，各分支阶段只做拆分
+    llm_outputs = [k for k in combined_outputs(plan) if k not in cached]
+    combined = cfg.router.combined_prompt and len(llm_outputs) >= 2
+    if combined:
+        stages.append(Stage("llm_combined", lambda cqr: combined_rewrite(
+            llm, cqr, llm_outputs, max_queries=cfg.router.max_queries,
+            dedup_thr=cfg.router.dedup_cosine_thr, embedder=get_embedder(cfg.embedding)),
+            inputs=("cqr",)))
+    if plan.use_multiquery:
+        stages.append(_pick_stage("multiquery") if combined else Stage(
+            "multiquery", lambda cqr: multiquery_rewrite(
+                llm, cqr, max_queries=cfg.router.max_queries,
+                dedup_thr=cfg.router.dedup_cosine_thr, embedder=get_embedder(cfg.embedding)),
+            inputs=("cqr",)))
+        branches.append("multiquery")
+    if plan.use_decompose:
+        stages.append(Stage("decompose", lambda cqr: decompose_into_subqueries(cqr),
+                            inputs=("cqr",)))
+        branches.append("decompose")
+    if plan.use_prf:
+        stages.append(Stage("prf", lambda cqr, **kw: [_prf_expand(
+            retriever, cqr, kw["retrieve:cqr"][0], cfg)], inputs=("cqr", "retrieve:cqr")))
+        branches.append("prf")
+    if plan.use_hyde:
+        # 检索器支持向量检索时对 hyde_doc 做向量检索，否则把其文本作为关键词候选
+        stages.append(_pick_stage("hyde") if combined else Stage(
+            "hyde", lambda cqr: [hyde_generate(llm, cqr)], inputs=("cqr",)))
+        branches.append("hyde")
+    if plan.use_self_query:
+        stages.append(_pick_stage("filters", "self_query") if combined else Stage(
+            "self_query", lambda cqr: extract_filters(llm, cqr), inputs=("cqr",),
+            output="filters"))
+    provided = ["cqr_candidates", "cqr"]
+    if not plan.use_self_query:
+        provided.append("filters")
+
+    # 每个分支产出后立即检索（只需等待 filters），不必等待其他分支
+    for b in branches if retrieve else ():
+        src = "cqr_candidates" if b == "cqr" else b
+        r = _hyde_retriever(retriever, cfg) if b == "hyde" else retriever
+        depth = max(_TOPK, cfg.prf.topk_initial) if b == "cqr" and plan.use_prf else _TOPK
+        stages.append(Stage(f"retrieve:{b}",
+                            _retrieve_stage(r, src, cfg, counters, deadline, cache, depth),
+                            inputs=("filters", src)))
+    # 产出已知的阶段不再执行，其产出改为已知输入
+    hit = [st.output_key for st in stages if st.output_key in cached]
+    stages = [st for st in stages if st.output_key not in hit]
+    provided.extend(hit)
+    return StageGraph(stages, provided=provided), branches
+
+
+def _prf_expand(retriever: Retriever, cqr: str, first_hop: Optional[List[SearchResult]],
+                cfg: AppConfig) -> str:
+    """D. PRF：以 CQR 检索池为首跳做 RM3 扩展（首跳缺失时不扩展）。"""
+    return rm3_expand_query(retriever, cqr, cfg.prf.topk_initial, cfg.prf.expansion_terms,
+                            cfg.prf.stopwords, first_hop=first_hop or [],
+                            min_idf=cfg.prf.min_idf, stats=get_doc_term_stats(cfg.prf))
+
+
+def _first_hop_confidence(cqr_pool: Optional[List[SearchResult]],
+                          prf_pool: Optional[List[SearchResult]],
+                          ec: EarlyExitConfig) -> Dict[str, Any]:
+    """首跳置信信号：首位得分、相对得分差距，以及与 PRF 扩展查询结果的前 k 重合率。
+
+    中文说明：
+        - score_gap = (s1 - s_{gap_rank+1}) / s1，结果不足时缺位得分按 0 计；
+        - overlap 仅在有 PRF 池时计算：扩展查询几乎不改变前 k 位，说明首跳已稳定；
+        - 三项均达到阈值（overlap 缺失时忽略）才判定为置信。
+    """
+    scores = [r.score for r in cqr_pool or []]
+    top = scores[0] if scores else 0.0
+    nxt = scores[ec.gap_rank] if len(scores) > ec.gap_rank else 0.0
+    gap = (top - nxt) / top if top > 0 else 0.0
+    overlap: Optional[float] = None
+    if prf_pool is not None and scores:
+        a = {r.doc_id for r in cqr_pool[:ec.overlap_k]}
+        b = {r.doc_id for r in prf_pool[:ec.overlap_k]}
+        overlap = len(a & b) / len(a)
+    confident = bool(scores) and top >= ec.min_top_score and gap >= ec.min_score_gap \
+        and (overlap is None or overlap >= ec.min_overlap)
+    return {"confident": confident, "top_score": round(top, 6), "score_gap": round(gap, 6),
+            "overlap": overlap}
+
+
+def _run_staged(plan: StrategyPlan, cfg: AppConfig, llm: LLMClient, retriever: Retriever,
+                counters: RequestCounters, deadline: Deadline, cache: Optional[ResponseCache],
+                initial: Dict[str, Any]
+                ) -> Tuple[Dict[str, Any], Dict[str, StageTiming], List[str], List[Stage],
+                           Dict[str, Any]]:
+    """分段执行：首段只做 CQR 首跳检索（+ Self-Query、基于首跳的 PRF），置信时跳过其余扩展。
+
+    中文说明：
+        - 首段 PRF 复用 CQR 检索池作为首跳，不再重复检索；
+        - 不置信时第二段执行 MultiQuery / Decompose / HyDE 及其检索，复用首段的 filters 与
+          CQR 检索池；这些分支在首跳之后才开始，不置信请求的关键路径因此变长；
+        - 返回 (产出, 计时（第二段按首段耗时平移）, 分支, 所有阶段, 置信信号)。
+    """
+    ex = get_stage_executor(cfg.executor)
+    first = StrategyPlan(use_prf=plan.use_prf, use_self_query=plan.use_self_query)
+    graph, branches = _build_graph(first, cfg, llm, retriever, counters, deadline, cache,
+                                   cached=initial)
+    t0 = time.perf_counter()
+    values, timings = graph.run(initial, ex, deadline=deadline, tracer=_stage_tracer(cfg))
+    offset = (time.perf_counter() - t0) * 1000
+    stages = list(graph.stages)
+    signal = _first_hop_confidence(values.get("retrieve:cqr", [None])[0],
+                                   (values.get("retrieve:prf") or [None])[0] if plan.use_prf
+                                   else None, cfg.early_exit)
+    rest = StrategyPlan(use_multiquery=plan.use_multiquery, use_decompose=plan.use_decompose,
+                        use_hyde=plan.use_hyde)
+    if signal["confident"] or not any(rest.__dict__.values()) \
+            or not all(st.output_key in values for st in stages):
+        return values, timings, branches, stages, signal
+    known = {k: values[k] for k in ("filters", "retrieve:cqr")}
+    graph2, more = _build_graph(rest, cfg, llm, retriever, counters, deadline, cache,
+                                cached={**initial, **known})
+    values2, timings2 = graph2.run({**initial, **known}, ex, deadline=deadline,
+                                   tracer=_stage_tracer(cfg))
+    values.update(values2)
+    for name, tm in timings2.items():
+        timings[name] = StageTiming(tm.start_ms + offset, tm.end_ms + offset)
+    order = [b for b in _BRANCH_ORDER if b in branches or b in more]
+    return values, timings, order, stages + list(graph2.stages), signal
+
+
+def _rewrite_prefix(q_norm: str, ctx: str, cfg: AppConfig, llm: LLMClient,
+                    cache: Optional[ResponseCache], tel: Telemetry, stage_ms: Dict[str, float]
+                    ) -> Tuple[str, StrategyPlan, Optional[Dict[str, Any]], str]:
+    """B+C. CQR 与路由；改写层缓存命中时直接复用。
+
+    返回 (cqr, plan, 缓存中的改写阶段产出（未命中为 None）, 改写层指纹)；
+    rewrite_and_retrieve 与 rewrite_query 共用。
+    """
+    rewrite_fp, cached = "", None
+    if cache is not None:
+        rewrite_fp = rewrite_fingerprint(cfg, llm)
+        cached = cache.get_rewrite(rewrite_fp, q_norm, ctx)
+    if cached is not None:
+        cqr, plan = cached.pop("cqr"), StrategyPlan(**cached.pop("plan"))
+        logger.info("改写缓存命中: cqr={} plan={}", cqr, plan)
+        return cqr, plan, cached, rewrite_fp
+    # B. CQR
+    t_b = time.perf_counter()
+    with tel.span("cqr", kind="stage"):
+        cqr = cqr_rewrite(q_norm, history_brief=ctx)
+    t_c = time.perf_counter()
+    stage_ms["cqr"] = (t_c - t_b) * 1000
+    logger.info("CQR 改写: {}", cqr)
+    # C. 路由
+    with tel.span("route", kind="stage"):
+        plan = _plan(cqr, cfg)
+    stage_ms["route"] = (time.perf_counter() - t_c) * 1000
+    logger.info("策略计划: {}", plan)
+    return cqr, plan, cached, rewrite_fp
+
+
+def _initial_values(cqr: str, plan: StrategyPlan,
+                    cached: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """阶段图的初始输入：CQR 候选与缓存命中的改写产出。"""
+    initial: Dict[str, Any] = {"cqr": cqr, "cqr_candidates": [cqr], **(cached or {})}
+    if not plan.use_self_query:
+        initial["filters"] = {}  # 否则由 self_query 阶段产出，检索阶段需等待其完成
+    return initial
+
+
+def _put_rewrite(cache: Optional[ResponseCache], rewrite_fp: str, q_norm: str, ctx: str,
+                 cqr: str, plan: StrategyPlan, cached: Optional[Dict[str, Any]],
+                 values: Dict[str, Any]) -> None:
+    """改写层回填：仅在未命中缓存、且计划启用的改写阶段全部产出时写入。
+
+    中文说明：首跳置信提前结束（未执行 MultiQuery / HyDE / Decompose）或被截止时间放弃的
+    请求不写入，避免不完整的条目被之后不置信的请求复用。
+    """
+    expected = [k for k in _REWRITE_STAGES
+                if getattr(plan, "use_self_query" if k == "filters" else f"use_{k}")]
+    if cache is None or cached is not None or not all(k in values for k in expected):
+        return
+    produced = {k: values[k] for k in expected}
+    cache.put_rewrite(rewrite_fp, q_norm, ctx, {"cqr": cqr, "plan": dict(plan.__dict__), **produced})
+
+
+def rewrite_and_retrieve(q: str, ctx: str, cfg: AppConfig,
+                         llm: LLMClient, retriever: Retriever) -> Dict[str, Any]:
+    """端到端：改写→检索→融合→去冗选择。
+
+    中文说明：
+        - 候选生成与检索以阶段 DAG 执行：MultiQuery / Decompose / PRF / HyDE / Self-Query
+          在 CQR 之后并发，各分支产出后即开始检索，关键路径≈最慢分支而非各分支之和；
+        - 阶段与检索分别运行在进程级共享线程池上（见 pipeline.executor），不再按请求建池；
+        - cfg.timeouts.request_budget_ms 作为请求截止时间贯穿阶段图与检索，超时的检索池
+          以部分结果融合；
+        - metrics.stage_ms 记录各阶段耗时，retrieval_shed / retrieval_missed / retrieval_hedged
+          分别为背压丢弃、超时放弃与对冲的检索数；
+        - cfg.cache.enabled 时启用分层缓存（见 pipeline.response_cache）：响应层命中直接返回，
+          改写层命中跳过 CQR / 路由与 LLM 改写阶段，检索池层只检索未命中的候选；
+          metrics.cache 记录各层命中情况。部分结果（有丢弃/超时/放弃）不写入响应层。
+        - cfg.router.combined_prompt 时，计划中的 MultiQuery / HyDE / Self-Query 合并为一次
+          结构化 LLM 请求（llm_combined 阶段），各分支阶段只做拆分，解析失败的字段逐策略回退。
+        - cfg.early_exit.enabled 时分段执行：先做 CQR 首跳（PRF 复用其结果），首跳置信
+          （得分差距 / 与 PRF 结果重合率达到阈值）时跳过其余扩展，metrics.early_exit 记录信号。
+        - cfg.telemetry.enabled 时记录请求 → 阶段 → 检索调用三层嵌套 span，并累加延迟直方图与
+          候选 / 缓存 / 丢弃计数（见 telemetry.core，导出见 telemetry.export）。
+
+    返回结构：
+        - normalized, cqr, strategy, self_query_filters
+        - candidates（所有查询候选）
+        - fused_docs（RRF 后）
+        - final_docs（MMR 终选）
+        - metrics（耗时、候选/文档计数、分阶段耗时）
+    """
+    tel = get_telemetry(cfg)
+    with tel.span("rewrite_and_retrieve", kind="request", mode="sync") as span:
+        out = _rewrite_and_retrieve(q, ctx, cfg, llm, retriever, tel)
+        span.set("cache", out["metrics"]["cache"].get("response", "disabled"))
+    tel.record_request(out["metrics"], mode="sync")
+    return out
+
+
+def _rewrite_and_retrieve(q: str, ctx: str, cfg: AppConfig, llm: LLMClient,
+                          retriever: Retriever, tel: Telemetry) -> Dict[str, Any]:
+    """rewrite_and_retrieve 的主体（埋点 span 嵌套在请求 span 之下）。"""
+    t0 = time.perf_counter()
+    deadline = Deadline(cfg.timeouts.request_budget_ms)
+    stage_ms: Dict[str, float] = {}
+    logger.info("原始问题: {}", q)
+
+    # A. 规范化
+    with tel.span("normalize", kind="stage"):
+        q_norm = _normalize(q, cfg)
+    stage_ms["normalize"] = (time.perf_counter() - t0) * 1000
+    logger.info("规范化后: {}", q_norm)
+
+    cache = get_response_cache(cfg)
+    cache_info: Dict[str, Any] = {"response": "disabled"}
+    resp_fp = ""
+    if cache is not None:
+        resp_fp = response_fingerprint(cfg, llm, retriever)
+        out, status = cache.get_response(resp_fp, q_norm, ctx)
+        if out is not None:
+            logger.info("响应缓存命中: {}", status)
+            out["metrics"]["elapsed_ms"] = int((time.perf_counter() - t0) * 1000)
+            out["metrics"]["cache"] = {"response": status}
+            return out
+
+    # B+C. CQR 与路由（改写缓存命中时复用 CQR、策略计划与 LLM 改写产出）
+    cqr, plan, cached, rewrite_fp = _rewrite_prefix(q_norm, ctx, cfg, llm, cache, tel, stage_ms)
+    if cache is not None:
+        cache_info = {"response": status, "rewrite": "miss" if cached is None else "hit"}
+
+    # D+E. 候选生成与检索（阶段图并发执行；开启 early_exit 时分段执行）
+    counters = RequestCounters()
+    initial = _initial_values(cqr, plan, cached)
+    early: Optional[Dict[str, Any]] = None
+    if cfg.early_exit.enabled:
+        values, timings, branches, stages, early = _run_staged(
+            plan, cfg, llm, retriever, counters, deadline, cache, initial)
+        logger.info("首跳置信信号: {}", early)
+    else:
+        graph, branches = _build_graph(plan, cfg, llm, retriever, counters, deadline,
+                                       cache=cache, cached=cached)
+        values, timings = graph.run(initial, get_stage_executor(cfg.executor),
+                                    deadline=deadline, tracer=_stage_tracer(cfg))
+        stages = graph.stages
+    for name, tm in timings.items():
+        stage_ms[name] = tm.duration_ms
+    abandoned = [st.name for st in stages if st.output_key not in values]
+    if abandoned:
+        logger.warning("超出请求预算，放弃阶段: {}", abandoned)
+
+    # 截止时间内未产出的分支不计入候选；已产出但未完成检索的候选以 None 池参与部分融合
+    candidates: List[str] = []
+    sources: List[str] = []
+    pools: List[Optional[List[SearchResult]]] = []
+    for b in branches:
+        src = "cqr_candidates" if b == "cqr" else b
+        if src not in values:
+            continue
+        candidates.extend(values[src])
+        sources.extend([b] * len(values[src]))
+        pools.extend(p[:_TOPK] if p else p  # CQR 池可能因 PRF 首跳而更深
+                     for p in values.get(f"retrieve:{b}") or [None] * len(values[src]))
+    sq_filters = values.get("filters") or {}
+    retr = [tm for name, tm in timings.items() if name.startswith("retrieve:")]
+    retrieval_ms = (max(t.end_ms for t in retr) - min(t.start_ms for t in retr)) if retr else 0.0
+    logger.info("候选查询条数: {} 检索完成：{}ms", len(candidates), int(retrieval_ms))
+
+    # F. 融合（默认 RRF）
+    t_f = time.perf_counter()
+    with tel.span("fuse", kind="stage"):
+        fused = _fuse(pools, sources, cfg)
+    t_g = time.perf_counter()
+    stage_ms["fuse"] = (t_g - t_f) * 1000
+    logger.info("{} 融合候选: {}", cfg.fusion.method.upper(), len(fused))
+
+    # G. MMR 去冗 + 终选
+    with tel.span("mmr", kind="stage"):
+        final_docs = _select_final(cqr, fused, cfg)
+    t1 = time.perf_counter()
+    stage_ms["mmr"] = (t1 - t_g) * 1000
+    counts = counters.as_dict()
+    missed = sum(p is None for p in pools)
+
+    router = get_adaptive_router(cfg)
+    gains: Dict[str, float] = {}
+    if router is not None:
+        # 分支延迟取其检索完成时刻（相对阶段图起点，分支在 CQR 之后同时开始）
+        gains = strategy_gains(sources, pools, (r.doc_id for r in final_docs))
+        router.record(cqr, {b: timings[f"retrieve:{b}"].end_ms for b in branches
+                            if b != "cqr" and f"retrieve:{b}" in timings}, gains)
+
+    if cache is not None:
+        cache_info["pool_hits"] = counts.get("pool_hits", 0)
+        cache_info["pool_misses"] = counts.get("pool_misses", 0)
+        _put_rewrite(cache, rewrite_fp, q_norm, ctx, cqr, plan, cached, values)
+
+    out = _assemble(q_norm, cqr, plan, sq_filters, candidates, fused, final_docs, {
+        "elapsed_ms": int((t1 - t0) * 1000),
+        "retrieval_ms": int(retrieval_ms),
+        "stage_ms": {k: round(v, 3) for k, v in stage_ms.items()},
+        "retrieval_shed": counts.get("shed", 0),
+        "retrieval_missed": missed,
+        "retrieval_hedged": counts.get("hedged", 0),
+        "stages_abandoned": abandoned,
+        "executor_queue_depth": get_retrieval_executor(cfg.executor).stats()["queue_depth"],
+        "cache": cache_info,
+        **({"strategy_gain": gains} if router is not None else {}),
+        **({"early_exit": early} if early is not None else {}),
+    })
+    if cache is not None and not (abandoned or missed or counts.get("shed", 0)):
+        cache.put_response(resp_fp, q_norm, ctx, out)
+    return out
+
+
+def rewrite_query(q: str, ctx: str, cfg: AppConfig, llm: LLMClient) -> Dict[str, Any]:
+    """只改写不检索：规范化→CQR→路由→LLM 改写分支，返回各分支候选。
+
+    中文说明：
+        - PRF 的扩展依赖首跳检索，此处不执行（strategy 中仍如实给出路由结果）；
+        - 与 rewrite_and_retrieve 共用改写层缓存（cfg.cache.enabled 时），两者的命中可互相复用；
+        - 返回 normalized, cqr, strategy, self_query_filters, candidates（按分支分组）, metrics。
+    """
+    tel = get_telemetry(cfg)
+    with tel.span("rewrite_query", kind="request", mode="rewrite"):
+        t0 = time.perf_counter()
+        stage_ms: Dict[str, float] = {}
+        with tel.span("normalize", kind="stage"):
+            q_norm = _normalize(q, cfg)
+        stage_ms["normalize"] = (time.perf_counter() - t0) * 1000
+        cache = get_response_cache(cfg)
+        cqr, plan, cached, rewrite_fp = _rewrite_prefix(q_norm, ctx, cfg, llm, cache, tel,
+                                                        stage_ms)
+        deadline = Deadline(cfg.timeouts.request_budget_ms)
+        llm_plan = StrategyPlan(**{**plan.__dict__, "use_prf": False})
+        graph, branches = _build_graph(llm_plan, cfg, llm, None, RequestCounters(), deadline,
+                                       cached=cached, retrieve=False)
+        values, timings = graph.run(_initial_values(cqr, plan, cached),
+                                    get_stage_executor(cfg.executor),
+                                    deadline=deadline, tracer=_stage_tracer(cfg))
+        stage_ms.update((k, t.duration_ms) for k, t in timings.items())
+        _put_rewrite(cache, rewrite_fp, q_norm, ctx, cqr, plan, cached, values)
+    return {
+        "normalized": q_norm,
+        "cqr": cqr,
+        "strategy": plan.__dict__,
+        "self_query_filters": values.get("filters") or {},
+        "candidates": {b: values["cqr_candidates" if b == "cqr" else b] for b in branches
+                       if ("cqr_candidates" if b == "cqr" else b) in values},
+        "metrics": {
+            "elapsed_ms": int((time.perf_counter() - t0) * 1000),
+            "stage_ms": {k: round(v, 3) for k, v in stage_ms.items()},
+            "cache": {"rewrite": ("miss" if cached is None else "hit") if cache is not None
+                      else "disabled"},
+        },
+    }
@@ -0,0 +1,239 @@
+"""Layered result cache: full responses, rewrite outputs and retrieval pools."""
+from __future__ import annotations
+
+from typing import Any, Dict, Hashable, List, Optional, Sequence, Tuple
+import copy
+import hashlib
+import json
+import threading
+import uuid
+import weakref
+
+import numpy as np
+
+from ..config import AppConfig, CacheConfig
+from ..retrievers.base import SearchResult
+from ..retrievers.dense import VectorQueryRetriever
+from ..utils.cache import TTLCache
+from ..utils.embedding import HashingEmbedder, get_embedder
+from .executor import backend_name
+
+# 参与指纹的配置段：改写层只依赖规范化/路由/嵌入；完整响应还依赖 PRF、融合与分段执行
+_REWRITE_SECTIONS = ("normalizer", "router", "embedding")
+_RESPONSE_SECTIONS = ("normalizer", "router", "prf", "fusion", "embedding", "early_exit")
+
+
+def filters_key(filters: Optional[Dict[str, Any]]) -> str:
+    """filters 的规范化字符串键（键排序，None 与空字典等价）。"""
+    return json.dumps(filters or {}, sort_keys=True, ensure_ascii=False, default=str)
+
+
+def _digest(obj: Any) -> str:
+    raw = json.dumps(obj, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.blake2b(raw.encode("utf-8"), digest_size=12).hexdigest()
+
+
+def component_id(obj: Any) -> str:
+    """LLM / 检索器的身份：类名 + 可选的 model / name / index_version 属性。"""
+    parts = [type(obj).__name__]
+    for attr in ("model", "name", "index_version"):
+        v = getattr(obj, attr, None)
+        if v is not None:
+            parts.append(f"{attr}={v}")
+    return "|".join(parts)
+
+
+_tokens: "weakref.WeakKeyDictionary[Any, str]" = weakref.WeakKeyDictionary()
+_pinned: Dict[int, Tuple[Any, str]] = {}  # 不可弱引用 / 不可哈希的实例：持有强引用，id 不会被复用
+_token_lock = threading.Lock()
+
+
+def instance_token(obj: Any) -> str:
+    """实例的稳定标识：首次调用时生成随机 token，按实例登记在进程级表中。
+
+    中文说明：
+        - 不能用 id()——对象回收后地址会被新实例复用，新检索器（不同语料）
+          会读到旧实例的缓存响应与检索池；
+        - 不在实例上写属性（兼容 __slots__）；表为弱引用，实例回收后条目随之消失；
+        - 不支持弱引用或不可哈希的实例退化为按 id 登记并持有强引用。
+    """
+    with _token_lock:
+        try:
+            token = _tokens.get(obj)
+            if token is None:
+                token = _tokens[obj] = uuid.uuid4().hex
+            return token
+        except TypeError:
+            entry = _pinned.get(id(obj))
+            if entry is None:
+                entry = _pinned[id(obj)] = (obj, uuid.uuid4().hex)
+            return entry[1]
+
+
+def rewrite_fingerprint(cfg: AppConfig, llm: Any) -> str:
+    """改写层指纹：规范化 / 路由 / 嵌入配置 + LLM 身份。"""
+    return config_fingerprint(cfg, _REWRITE_SECTIONS, llm)
+
+
+def response_fingerprint(cfg: AppConfig, llm: Any, retriever: Any) -> str:
+    """响应层指纹：另含 PRF / 融合 / 分段执行配置与检索器命名空间。"""
+    return config_fingerprint(cfg, _RESPONSE_SECTIONS, llm, ResponseCache.retrieval_ns(retriever))
+
+
+def config_fingerprint(cfg: AppConfig, sections: Sequence[str], *components: Any) -> str:
+    """配置段 + 组件身份的指纹；执行器、超时、日志与缓存自身的配置不参与。
+
+    中文说明：字符串组件按原样参与（如 ResponseCache.retrieval_ns 的结果）。
+    """
+    return _digest({"cfg": {s: getattr(cfg, s).model_dump() for s in sections},
+                    "components": [c if isinstance(c, str) else component_id(c)
+                                   for c in components]})
+
+
+class _NearDupIndex:
+    """近重复查询索引：固定容量的向量环形缓冲区，按命名空间过滤后做一次矩阵-向量乘。"""
+
+    def __init__(self, capacity: int) -> None:
+        self.capacity = capacity
+        self._vecs: Optional[np.ndarray] = None
+        self._keys: List[Optional[Hashable]] = [None] * capacity
+        self._ns: List[Optional[str]] = [None] * capacity
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def add(self, ns: str, key: Hashable, vec: np.ndarray) -> None:
+        if self.capacity <= 0:
+            return
+        with self._lock:
+            if self._vecs is None or self._vecs.shape[1] != vec.shape[0]:
+                self._vecs = np.zeros((self.capacity, vec.shape[0]), dtype=np.float32)
+            i = self._next
+            self._vecs[i], self._keys[i], self._ns[i] = vec, key, ns
+            self._next = (i + 1) % self.capacity
+
+    def search(self, ns: str, vec: np.ndarray, thr: float) -> Optional[Hashable]:
+        with self._lock:
+            if self._vecs is None or self._vecs.shape[1] != vec.shape[0]:
+                return None
+            mask = np.array([n == ns for n in self._ns])
+            if not mask.any():
+                return None
+            sims = np.where(mask, self._vecs @ vec, -np.inf)
+            best = int(np.argmax(sims))
+            return self._keys[best] if sims[best] >= thr else None
+
+    def clear(self) -> None:
+        with self._lock:
+            self._vecs = None
+            self._keys = [None] * self.capacity
+            self._ns = [None] * self.capacity
+
+
+class ResponseCache:
+    """rewrite_and_retrieve 的分层缓存。
+
+    中文说明：
+        - 响应层：键为 (配置指纹, 规范化问句, 上下文)，命中时跳过整条流水线；开启
+          near_dup_thr 时，同一指纹与上下文下余弦相似度 ≥ 阈值的历史问句也视为命中；
+        - 改写层：缓存 CQR、策略计划与 MultiQuery / Decompose / HyDE / Self-Query 的输出，
+          与检索无关，索引更新后仍然有效；
+        - 检索池层：键为 (检索器命名空间, filters, 候选文本, topk)，只缓存真正完成的检索；
+        - invalidate_retrieval() 在索引更新后清空检索池层与响应层，改写层保留；
+          检索器的 index_version 属性参与命名空间，切换索引版本自动失效。
+    """
+
+    def __init__(self, cfg: CacheConfig, embedder: Optional[Any] = None) -> None:
+        self.cfg = cfg
+        self.responses: TTLCache[Dict[str, Any]] = TTLCache(cfg.max_entries, cfg.ttl_s)
+        self.rewrites: TTLCache[Dict[str, Any]] = TTLCache(cfg.rewrite_max_entries,
+                                                           cfg.rewrite_ttl_s)
+        self.pools: TTLCache[List[SearchResult]] = TTLCache(cfg.pool_max_entries, cfg.pool_ttl_s)
+        self._embedder = embedder
+        self._near = _NearDupIndex(cfg.near_dup_max_entries if cfg.near_dup_thr else 0)
+
+    # ---- 响应层 ----
+    def _query_vec(self, q_norm: str) -> np.ndarray:
+        if self._embedder is None:
+            self._embedder = HashingEmbedder()
+        return np.asarray(self._embedder.embed([q_norm]), dtype=np.float32)[0]
+
+    def get_response(self, fp: str, q_norm: str, ctx: str
+                     ) -> Tuple[Optional[Dict[str, Any]], str]:
+        """返回 (缓存响应的副本, "hit" / "near_hit" / "miss")。"""
+        out = self.responses.get((fp, q_norm, ctx))
+        if out is not None:
+            return copy.deepcopy(out), "hit"
+        thr = self.cfg.near_dup_thr
+        if thr is not None and q_norm.strip():
+            key = self._near.search(f"{fp}|{ctx}", self._query_vec(q_norm), thr)
+            out = self.responses.get(key, count=False) if key is not None else None
+            if out is not None:
+                return copy.deepcopy(out), "near_hit"
+        return None, "miss"
+
+    def put_response(self, fp: str, q_norm: str, ctx: str, out: Dict[str, Any]) -> None:
+        key = (fp, q_norm, ctx)
+        self.responses.put(key, copy.deepcopy(out))
+        if self.cfg.near_dup_thr is not None and q_norm.strip():
+            self._near.add(f"{fp}|{ctx}", key, self._query_vec(q_norm))
+
+    # ---- 改写层 ----
+    def get_rewrite(self, fp: str, q_norm: str, ctx: str) -> Optional[Dict[str, Any]]:
+        out = self.rewrites.get((fp, q_norm, ctx))
+        return copy.deepcopy(out) if out is not None else None
+
+    def put_rewrite(self, fp: str, q_norm: str, ctx: str, value: Dict[str, Any]) -> None:
+        self.rewrites.put((fp, q_norm, ctx), copy.deepcopy(value))
+
+    # ---- 检索池层 ----
+    @staticmethod
+    def retrieval_ns(retriever: Any) -> str:
+        """检索器命名空间：后端 + 身份 + 实例标识（不同语料的同名检索器互不共享检索池）。
+
+        中文说明：HyDE 每次请求新建的 VectorQueryRetriever 沿用被包装检索器的命名空间加 "|vector"，
+        跨请求仍能命中。
+        """
+        if isinstance(retriever, VectorQueryRetriever):
+            return ResponseCache.retrieval_ns(retriever.inner) + "|vector"
+        return f"{backend_name(retriever)}|{component_id(retriever)}@{instance_token(retriever)}"
+
+    def get_pools(self, ns: str, fkey: str, queries: Sequence[str],
+                  topk: int) -> List[Optional[List[SearchResult]]]:
+        return [self.pools.get((ns, fkey, q, topk)) for q in queries]
+
+    def put_pool(self, ns: str, fkey: str, query: str, topk: int,
+                 pool: List[SearchResult]) -> None:
+        self.pools.put((ns, fkey, query, topk), pool)
+
+    # ---- 失效与统计 ----
+    def invalidate_retrieval(self) -> None:
+        """索引更新后调用：清空检索池层与响应层（改写层不受影响）。"""
+        self.pools.clear()
+        self.responses.clear()
+        self._near.clear()
+
+    def clear(self) -> None:
+        self.invalidate_retrieval()
+        self.rewrites.clear()
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        return {"response": self.responses.stats(), "rewrite": self.rewrites.stats(),
+                "pool": self.pools.stats()}
+
+
+_lock = threading.Lock()
+_caches: Dict[str, ResponseCache] = {}
+
+
+def get_response_cache(cfg: AppConfig) -> Optional[ResponseCache]:
+    """进程级响应缓存（按 CacheConfig 区分实例）；未启用时返回 None。"""
+    if not cfg.cache.enabled:
+        return None
+    key = cfg.cache.model_dump_json()
+    cache = _caches.get(key)
+    if cache is None:
+        with _lock:
+            cache = _caches.get(key)
+            if cache is None:
+                cache = _caches[key] = ResponseCache(cfg.cache, embedder=get_embedder(cfg.embedding))
+    return cache
@@ -25,3 +25,27 @@ class Retriever(ABC):
                filters: Optional[Dict[str, Any]] = None) -> List[SearchResult]:
         """执行检索并返回结果列表。"""
         raise NotImplementedError
+
+    def search_many(self, queries: List[str], topk: int = 10,
+                    filters: Optional[Dict[str, Any]] = None) -> List[List[SearchResult]]:
+        """批量检索（同一 filters），结果与 queries 一一对应。
+
+        默认逐条调用 search；支持批量/向量化打分的后端应覆盖此方法。
+        """
+        return [self.search(q, topk=topk, filters=filters) for q in queries]
+
+
+def supports_search_many(retriever: Retriever) -> bool:
+    """后端是否提供原生（覆盖默认实现的）search_many。"""
+    impl = getattr(type(retriever), "search_many", None)
+    return impl is not None and impl is not Retriever.search_many
+
+
+class AsyncRetriever(ABC):
+    """异步检索接口：适配原生 asyncio 客户端（HTTP/gRPC 检索服务等）。"""
+
+    @abstractmethod
+    async def search(self, query: str, topk: int = 10,
+                     filters: Optional[Dict[str, Any]] = None) -> List[SearchResult]:
+        """执行检索并返回结果列表。"""
+        raise NotImplementedError
@@ -0,0 +1,102 @@
+"""Hybrid retriever: sparse and dense backends queried concurrently and fused."""
+from __future__ import annotations
+
+from concurrent.futures import Future
+from typing import Any, Dict, List, Literal, Optional, Sequence
+
+import numpy as np
+from loguru import logger
+
+from .base import Retriever, SearchResult
+from .dense import supports_vector_search
+from ..fusion.fuser import fuse_pools
+from ..pipeline.executor import RetrievalExecutor, backend_name, get_retrieval_executor
+
+
+class HybridRetriever(Retriever):
+    """稀疏（BM25）+ 稠密（向量 / ANN）混合检索：两路并发检索，按排名融合。
+
+    中文说明：
+        - search_many 两路都提交到进程级检索执行器（各自的后端隔离舱），耗时≈较慢一路；
+          某一路仍在排队（执行器忙）时撤回并在调用线程执行，嵌套在检索任务中调用也不会
+          因等待同一线程池而饿死；被丢弃（shed）的一路同样在调用线程执行；
+        - 提交第二路时被拒绝（overload_policy="reject"）则撤回已提交的一路并抛出异常；
+        - 每路取 depth（缺省为 topk 的 depth_factor 倍）条结果，经 fuse_pools（RRF / CombSUM /
+          CombMNZ，weights 为稀疏/稠密权重）融合后截断到 topk；
+        - 一路失败时退化为另一路结果（记警告），两路都失败时抛出稀疏路的异常；
+        - 稠密路支持向量检索时对外提供 embedder / search_vectors，HyDE 假想文档只走稠密路；
+          稀疏路提供 idf 时对外暴露，PRF 的 IDF 加权据此工作。
+    """
+
+    def __init__(self, sparse: Retriever, dense: Retriever,
+                 method: Literal["rrf", "combsum", "combmnz"] = "rrf", k: int = 60,
+                 weights: Sequence[float] = (1.0, 1.0), depth_factor: int = 2,
+                 name: str = "hybrid", executor: Optional[RetrievalExecutor] = None) -> None:
+        if len(weights) != 2:
+            raise ValueError("weights must be (sparse, dense)")
+        if depth_factor < 1:
+            raise ValueError("depth_factor must be >= 1")
+        self.sparse, self.dense = sparse, dense
+        self.method, self.k = method, k
+        self.weights = [float(w) for w in weights]
+        self.depth_factor = depth_factor
+        self.name = name
+        idf = getattr(sparse, "idf", None)
+        if callable(idf):
+            self.idf = idf
+        self._retrieval = executor  # None 时使用进程级检索执行器
+
+    @property
+    def embedder(self) -> Any:
+        return self.dense.embedder if supports_vector_search(self.dense) else None
+
+    def search_vectors(self, vectors: np.ndarray, topk: int = 10,
+                       filters: Optional[Dict[str, Any]] = None) -> List[List[SearchResult]]:
+        """向量查询只走稠密路（HyDE 假想文档的向量路径）。"""
+        if not supports_vector_search(self.dense):
+            raise TypeError(f"{type(self.dense).__name__} does not support vector search")
+        return self.dense.search_vectors(vectors, topk, filters)  # type: ignore[attr-defined]
+
+    def _executor(self) -> RetrievalExecutor:
+        return self._retrieval or get_retrieval_executor()
+
+    def search(self, query: str, topk: int = 10,
+               filters: Optional[Dict[str, Any]] = None) -> List[SearchResult]:
+        return self.search_many([query], topk, filters)[0]
+
+    def search_many(self, queries: List[str], topk: int = 10,
+                    filters: Optional[Dict[str, Any]] = None) -> List[List[SearchResult]]:
+        if not queries:
+            return []
+        depth = topk * self.depth_factor
+        ex = self._executor()
+        legs = (self.sparse, self.dense)
+        futs: List[Optional[Future]] = []
+        try:
+            for r in legs:
+                futs.append(ex.submit(backend_name(r), r.search_many, list(queries), depth, filters))
+        except BaseException:
+            for fut in futs:
+                if fut is not None:
+                    fut.cancel()
+            raise
+        pools: List[Optional[List[List[SearchResult]]]] = [None, None]
+        errors: List[Optional[Exception]] = [None, None]
+        for i in (1, 0):  # 先处理稠密路：若未能在池中执行则由调用线程执行，稀疏路同时在池中运行
+            fut = futs[i]
+            try:
+                if fut is None or fut.cancel():  # 被丢弃或仍在排队
+                    pools[i] = legs[i].search_many(list(queries), depth, filters)
+                else:
+                    pools[i] = fut.result()
+            except Exception as exc:  # noqa: BLE001
+                errors[i] = exc
+        if pools[0] is None and pools[1] is None:
+            raise errors[0]  # type: ignore[misc]
+        for i, label in ((0, "稀疏"), (1, "稠密")):
+            if errors[i] is not None:
+                logger.warning("混合检索{}路失败，仅使用另一路结果：{}", label, errors[i])
+        return [fuse_pools([pools[0][i] if pools[0] is not None else None,
+                            pools[1][i] if pools[1] is not None else None],
+                           method=self.method, k=self.k, weights=self.weights, top_n=topk)
+                for i in range(len(queries))]
@@ -0,0 +1,203 @@
+"""Memory-mapped persistent BM25 index: instant start, pages shared across processes."""
+from __future__ import annotations
+
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+import json
+import mmap
+import os
+import shutil
+import tempfile
+
+import numpy as np
+from loguru import logger
+
+from .bm25 import BM25Arrays, BM25Builder, BM25Retriever, iter_jsonl_docs
+from ..exceptions import ConfigError
+
+FORMAT = "rqw-bm25-mmap"
+VERSION = 1
+
+# 索引目录布局：
+#   manifest.json                    格式/版本、文档数、k1/b、元数据字段
+#   term_ptr.npy / post_docs.npy / post_tf.npy / post_w.npy / doc_len.npy   CSR 倒排与文档长度
+#   terms.bin + terms.off.npy        排序词表（UTF-8 拼接 + 偏移）
+#   doc_ids.bin + doc_ids.off.npy    文档 ID
+#   texts.bin + texts.off.npy        文档正文
+#   meta.<field>.npy + meta.<field>.json   元数据编码列 + 取值表
+
+
+def _write_strings(out_dir: str, name: str, items: Sequence[str]) -> None:
+    off = np.zeros(len(items) + 1, dtype=np.int64)
+    with open(os.path.join(out_dir, f"{name}.bin"), "wb") as f:
+        pos = 0
+        for i, s in enumerate(items):
+            b = s.encode("utf-8")
+            f.write(b)
+            pos += len(b)
+            off[i + 1] = pos
+    np.save(os.path.join(out_dir, f"{name}.off.npy"), off)
+
+
+@contextmanager
+def _staged_dir(out_dir: str) -> Iterator[str]:
+    """在 out_dir 的同级临时目录中写索引，正常退出后整体换入 out_dir。
+
+    中文说明：
+        - 写入中途失败（异常 / 进程被杀）只会留下临时目录，out_dir 中的旧索引保持完整；
+        - 换入为两次 rename：旧目录先移开再换入新目录，读者要么打开旧索引、要么打开新索引，
+          其间极短窗口内 out_dir 不存在（打开报 ConfigError），不会读到半写的文件；
+        - 已映射旧索引的进程不受影响（文件删除后映射仍有效）；
+        - out_dir 已存在且非空、却不是索引目录（无 manifest.json）时拒绝覆盖。
+    """
+    out_dir = os.path.abspath(out_dir)
+    if os.path.isdir(out_dir) and os.listdir(out_dir) \
+            and not os.path.exists(os.path.join(out_dir, "manifest.json")):
+        raise ConfigError(f"refusing to replace non-index directory: {out_dir}")
+    parent, base = os.path.split(out_dir)
+    os.makedirs(parent, exist_ok=True)
+    tmp = tempfile.mkdtemp(prefix=f".{base}.", suffix=".tmp", dir=parent)
+    old = f"{tmp}.old"
+    try:
+        os.chmod(tmp, 0o755)
+        yield tmp
+        if os.path.exists(out_dir):
+            os.replace(out_dir, old)
+        os.replace(tmp, out_dir)
+    except BaseException:
+        if os.path.exists(old) and not os.path.exists(out_dir):
+            os.replace(old, out_dir)  # 换入失败：放回旧索引
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+    shutil.rmtree(old, ignore_errors=True)
+
+
+def write_index(arrays: BM25Arrays, out_dir: str) -> None:
+    """把内存中的 BM25Arrays 写成 mmap 索引目录（先写同级临时目录，写完再换入）。"""
+    with _staged_dir(out_dir) as tmp:
+        for name in ("term_ptr", "post_docs", "post_tf", "post_w", "doc_len"):
+            np.save(os.path.join(tmp, f"{name}.npy"), getattr(arrays, name))
+        _write_strings(tmp, "terms", arrays.terms)
+        _write_strings(tmp, "doc_ids", arrays.doc_ids)
+        _write_strings(tmp, "texts", arrays.texts)
+        for field, (values, codes) in arrays.meta.items():
+            np.save(os.path.join(tmp, f"meta.{field}.npy"), codes)
+            with open(os.path.join(tmp, f"meta.{field}.json"), "w", encoding="utf-8") as f:
+                json.dump(values, f, ensure_ascii=False)
+        manifest = {"format": FORMAT, "version": VERSION, "num_docs": arrays.num_docs,
+                    "num_terms": len(arrays.terms), "k1": arrays.k1, "b": arrays.b,
+                    "meta_fields": sorted(arrays.meta)}
+        with open(os.path.join(tmp, "manifest.json"), "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+
+
+def build_mmap_index(corpus_path: str, out_dir: str, id_field: str = "id",
+                     text_field: str = "text", meta_fields: Optional[Sequence[str]] = None,
+                     k1: float = 1.2, b: float = 0.75) -> Dict[str, Any]:
+    """从 JSONL 语料离线构建 mmap 索引，返回 manifest。"""
+    builder = BM25Builder(k1=k1, b=b)
+    for doc_id, text, meta in iter_jsonl_docs(corpus_path, id_field, text_field, meta_fields):
+        builder.add(doc_id, text, meta)
+    arrays = builder.build()
+    write_index(arrays, out_dir)
+    logger.info("mmap 索引已写入: dir={} docs={} terms={}",
+                out_dir, arrays.num_docs, len(arrays.terms))
+    return read_manifest(out_dir)
+
+
+def read_manifest(index_dir: str) -> Dict[str, Any]:
+    path = os.path.join(index_dir, "manifest.json")
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, json.JSONDecodeError) as exc:
+        raise ConfigError(f"invalid mmap index at {index_dir}: {exc}") from exc
+    if manifest.get("format") != FORMAT or manifest.get("version") != VERSION:
+        raise ConfigError(f"unsupported index format: {manifest.get('format')} "
+                          f"v{manifest.get('version')}")
+    return manifest
+
+
+class StringTable(Sequence[str]):
+    """mmap 上的只读字符串数组：偏移表为 memmap，按需解码单条。"""
+
+    def __init__(self, index_dir: str, name: str) -> None:
+        self._off = np.load(os.path.join(index_dir, f"{name}.off.npy"), mmap_mode="r")
+        path = os.path.join(index_dir, f"{name}.bin")
+        if os.path.getsize(path) == 0:
+            self._buf: Any = b""
+        else:
+            with open(path, "rb") as f:
+                self._buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __len__(self) -> int:
+        return len(self._off) - 1
+
+    def raw(self, i: int) -> bytes:
+        return self._buf[int(self._off[i]):int(self._off[i + 1])]
+
+    def __getitem__(self, i: Any) -> Any:
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        return self.raw(i).decode("utf-8")
+
+
+def _open_arrays(index_dir: str, manifest: Dict[str, Any]) -> Tuple[BM25Arrays, StringTable]:
+    def load(name: str) -> np.ndarray:
+        return np.load(os.path.join(index_dir, f"{name}.npy"), mmap_mode="r")
+
+    meta: Dict[str, Tuple[List[str], np.ndarray]] = {}
+    for field in manifest.get("meta_fields", []):
+        with open(os.path.join(index_dir, f"meta.{field}.json"), "r", encoding="utf-8") as f:
+            values = json.load(f)
+        meta[field] = (values, load(f"meta.{field}"))
+    terms = StringTable(index_dir, "terms")
+    arrays = BM25Arrays(
+        terms=terms,  # type: ignore[arg-type]
+        term_ptr=load("term_ptr"), post_docs=load("post_docs"), post_tf=load("post_tf"),
+        post_w=load("post_w"), doc_len=load("doc_len"),
+        doc_ids=StringTable(index_dir, "doc_ids"),  # type: ignore[arg-type]
+        texts=StringTable(index_dir, "texts"),  # type: ignore[arg-type]
+        meta=meta, k1=float(manifest["k1"]), b=float(manifest["b"]),
+    )
+    return arrays, terms
+
+
+class MmapBM25Retriever(BM25Retriever):
+    """基于 mmap 索引目录的 BM25 检索器。
+
+    中文说明：
+        - 打开索引只读取 manifest 与元数据取值表，倒排/文本均为零拷贝映射，启动近乎瞬时；
+        - 多个工作进程映射同一目录时共享操作系统页缓存，不各自重建 Python 字典；
+        - 词表查找在排序词表上做二分（带 LRU 缓存），打分逻辑与 BM25Retriever 相同。
+    """
+
+    def __init__(self, index_dir: str, name: str = "bm25-mmap",
+                 term_cache_size: int = 65536) -> None:
+        self.index_dir = index_dir
+        self.manifest = read_manifest(index_dir)
+        arrays, self._terms = _open_arrays(index_dir, self.manifest)
+        self._term_lookup = lru_cache(maxsize=term_cache_size)(self._bisect_term)
+        super().__init__(arrays, name=name)
+
+    def _init_term_index(self) -> None:
+        """mmap 索引不构建内存词典。"""
+
+    def _bisect_term(self, term: str) -> Optional[int]:
+        key = term.encode("utf-8")
+        lo, hi = 0, len(self._terms)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._terms.raw(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < len(self._terms) and self._terms.raw(lo) == key:
+            return lo
+        return None
+
+    def _term_index(self, term: str) -> Optional[int]:
+        return self._term_lookup(term)
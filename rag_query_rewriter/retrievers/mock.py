@@ -2,7 +2,9 @@
 from __future__ import annotations
 
 from typing import List, Dict, Any, Optional
-from .base import Retriever, SearchResult
+import asyncio
+import numpy as np
+from .base import AsyncRetriever, Retriever, SearchResult
 
 
 class MockRetriever(Retriever):
@@ -17,6 +19,11 @@ class MockRetriever(Retriever):
             "d4": {"text": "常见问题与解答（FAQ）。", "year": "2023", "type": "faq"},
             "d5": {"text": "对比文档：2023 与 2024 差异分析。", "year": "2024", "type": "compare"},
         }
+        # 向量化打分用的列式视图
+        self._ids = list(self._docs)
+        self._texts = np.array([o["text"] for o in self._docs.values()])
+        self._bonus = np.array([0.1 if o["type"] == "release" else 0.0
+                                for o in self._docs.values()])
 
     def _passes_filters(self, meta: Dict[str, Any], filters: Dict[str, Any]) -> bool:
         if not filters:
@@ -32,17 +39,50 @@ class MockRetriever(Retriever):
                 return False
         return True
 
+    def _filter_mask(self, filters: Optional[Dict[str, Any]]) -> np.ndarray:
+        return np.array([self._passes_filters({"year": o["year"], "type": o["type"]}, filters or {})
+                         for o in self._docs.values()])
+
     def search(self, query: str, topk: int = 10,
                filters: Optional[Dict[str, Any]] = None) -> List[SearchResult]:
-        score = []
-        for doc_id, obj in self._docs.items():
-            if not self._passes_filters({"year": obj["year"], "type": obj["type"]}, filters or {}):
-                continue
-            txt = obj["text"]
-            # 简单计分：词覆盖 + 轻微加权
-            uniq = set(query.split())
-            sc = sum(txt.count(w) for w in uniq) + (0.1 if obj["type"] == "release" else 0.0)
-            if sc > 0:
-                score.append((doc_id, sc, txt))
-        score.sort(key=lambda x: x[1], reverse=True)
-        return [SearchResult(d, float(s), t) for d, s, t in score[:topk]]
+        return self._score_many([query], topk, filters)[0]
+
+    def search_many(self, queries: List[str], topk: int = 10,
+                    filters: Optional[Dict[str, Any]] = None) -> List[List[SearchResult]]:
+        """一次矩阵运算为所有查询打分：S = Q(查询×词) @ C(词×文档) + 类型加权。"""
+        return self._score_many(queries, topk, filters)
+
+    def _score_many(self, queries: List[str], topk: int,
+                    filters: Optional[Dict[str, Any]]) -> List[List[SearchResult]]:
+        if not queries:
+            return []
+        token_sets = [set(q.split()) for q in queries]
+        vocab = sorted(set().union(*token_sets))
+        col = {w: j for j, w in enumerate(vocab)}
+        # 简单计分：词覆盖 + 轻微加权
+        Q = np.zeros((len(queries), len(vocab)))
+        for i, toks in enumerate(token_sets):
+            Q[i, [col[w] for w in toks]] = 1.0
+        C = (np.stack([np.char.count(self._texts, w) for w in vocab]).astype(float)
+             if vocab else np.zeros((0, len(self._ids))))
+        S = Q @ C + self._bonus
+        S[:, ~self._filter_mask(filters)] = 0.0
+        out: List[List[SearchResult]] = []
+        for row in S:
+            order = [j for j in np.argsort(-row, kind="stable") if row[j] > 0]
+            out.append([SearchResult(self._ids[j], float(row[j]), str(self._texts[j]))
+                        for j in order[:topk]])
+        return out
+
+
+class AsyncMockRetriever(AsyncRetriever):
+    """MockRetriever 的异步版本；latency_s 模拟检索服务往返耗时。"""
+
+    def __init__(self, latency_s: float = 0.0) -> None:
+        self._sync = MockRetriever()
+        self._latency_s = latency_s
+
+    async def search(self, query: str, topk: int = 10,
+                     filters: Optional[Dict[str, Any]] = None) -> List[SearchResult]:
+        await asyncio.sleep(self._latency_s)
+        return self._sync.search(query, topk=topk, filters=filters)
@@ -0,0 +1,288 @@
+"""Cost-aware adaptive strategy router learning per-query-type latency and recall gain."""
+from __future__ import annotations
+
+from dataclasses import replace
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+import atexit
+import json
+import math
+import os
+import random
+import threading
+import time
+
+import numpy as np
+import regex as re
+from loguru import logger
+
+from ..config import AdaptiveRouterConfig, AppConfig
+from .router import StrategyPlan
+
+# 参与自适应的策略（Self-Query 产出过滤条件而非候选，仍按启发式决定）
+STRATEGIES = ("multiquery", "decompose", "prf", "hyde")
+_COMPARE = ("对比", "差异", "分别", "vs", "和", "与")
+_TIME = re.compile(r"\b(19|20)\d{2}\b|年|月|day|week|month")
+
+
+def query_features(q: str) -> Dict[str, float]:
+    """问句特征（与启发式路由使用的信号一致，外加字符构成）。"""
+    n = len(q)
+    cjk = sum(1 for ch in q if "一" <= ch <= "鿿")
+    return {
+        "len": float(n),
+        "short": float(n < 16),
+        "long": float(n > 36),
+        "compare": float(any(x in q for x in _COMPARE)),
+        "time": float(bool(_TIME.search(q))),
+        "cjk_ratio": cjk / n if n else 0.0,
+        "question": float(any(x in q for x in ("?", "？", "吗", "什么", "如何", "怎么"))),
+    }
+
+
+def query_type(q: str) -> str:
+    """统计分桶：长度段 + 对比 / 时间标记，如 "short|time"。"""
+    f = query_features(q)
+    parts = ["short" if f["short"] else "long" if f["long"] else "mid"]
+    parts += [k for k in ("compare", "time") if f[k]]
+    return "|".join(parts)
+
+
+def strategy_gains(sources: Sequence[str], pools: Sequence[Optional[Sequence[Any]]],
+                   final_ids: Iterable[str]) -> Dict[str, float]:
+    """各策略对终选文档的边际贡献：只被该策略（而非 CQR 原句）召回的终选文档占比。"""
+    found: Dict[str, Set[str]] = {}
+    for src, pool in zip(sources, pools):
+        if pool:
+            found.setdefault(src, set()).update(r.doc_id for r in pool)
+    final = list(final_ids)
+    if not final:
+        return {s: 0.0 for s in found if s != "cqr"}
+    base = found.get("cqr", set())
+    return {s: sum(d in ids and d not in base for d in final) / len(final)
+            for s, ids in found.items() if s != "cqr"}
+
+
+class StrategyStats:
+    """按 (问句类型, 策略) 汇总的指数滑动平均：延迟（毫秒）与边际贡献。"""
+
+    def __init__(self, alpha: float = 0.1) -> None:
+        self.alpha = alpha
+        self._lock = threading.Lock()
+        self._s: Dict[Tuple[str, str], Dict[str, float]] = {}
+
+    def record(self, qtype: str, strategy: str, latency_ms: float, gain: float) -> None:
+        with self._lock:
+            st = self._s.get((qtype, strategy))
+            if st is None:
+                self._s[(qtype, strategy)] = {"n": 1, "latency_ms": latency_ms, "gain": gain}
+                return
+            a = self.alpha
+            st["n"] += 1
+            st["latency_ms"] += a * (latency_ms - st["latency_ms"])
+            st["gain"] += a * (gain - st["gain"])
+
+    def get(self, qtype: str, strategy: str) -> Optional[Dict[str, float]]:
+        with self._lock:
+            st = self._s.get((qtype, strategy))
+            return dict(st) if st is not None else None
+
+    def snapshot(self) -> Dict[str, Dict[str, Dict[str, float]]]:
+        with self._lock:
+            out: Dict[str, Dict[str, Dict[str, float]]] = {}
+            for (qt, s), st in self._s.items():
+                out.setdefault(qt, {})[s] = dict(st)
+            return out
+
+    def save(self, path: str) -> None:
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"  # 多个工作进程可能写同一路径
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.snapshot(), f, ensure_ascii=False, indent=1)
+        os.replace(tmp, path)
+
+    def load(self, path: str) -> None:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        with self._lock:
+            for qt, per in data.items():
+                for s, st in per.items():
+                    self._s[(qt, s)] = {k: float(st[k]) for k in ("n", "latency_ms", "gain")}
+
+
+class StrategyClassifier:
+    """离线训练的逐策略逻辑回归：由问句特征预测“该策略有正边际贡献”的概率。
+
+    中文说明：
+        - 训练样本为路由日志中的 (问句, 策略, gain)，gain > 0 记为正例；
+        - 模型只保存特征名、系数与截距（JSON），加载时不依赖 scikit-learn。
+    """
+
+    def __init__(self, models: Optional[Dict[str, Dict[str, Any]]] = None) -> None:
+        self.models = models or {}
+
+    @classmethod
+    def fit(cls, records: Iterable[Dict[str, Any]], C: float = 1.0) -> "StrategyClassifier":
+        from sklearn.linear_model import LogisticRegression
+
+        rows: Dict[str, Tuple[List[List[float]], List[int]]] = {}
+        names: List[str] = []
+        for rec in records:
+            feats = query_features(rec["q"])
+            names = names or sorted(feats)
+            X, y = rows.setdefault(rec["strategy"], ([], []))
+            X.append([feats[k] for k in names])
+            y.append(int(rec["gain"] > 0))
+        models: Dict[str, Dict[str, Any]] = {}
+        for s, (X, y) in rows.items():
+            if len(set(y)) < 2:
+                # 单一类别：退化为常数概率
+                p = min(max(float(np.mean(y)), 1e-3), 1 - 1e-3)
+                models[s] = {"features": names, "coef": [0.0] * len(names),
+                             "intercept": math.log(p / (1 - p))}
+                continue
+            clf = LogisticRegression(C=C, max_iter=1000).fit(np.asarray(X), np.asarray(y))
+            models[s] = {"features": names, "coef": clf.coef_[0].tolist(),
+                         "intercept": float(clf.intercept_[0])}
+        return cls(models)
+
+    def predict(self, q: str) -> Dict[str, float]:
+        feats = query_features(q)
+        out = {}
+        for s, m in self.models.items():
+            z = m["intercept"] + sum(c * feats.get(k, 0.0) for k, c in zip(m["features"], m["coef"]))
+            out[s] = 1.0 / (1.0 + math.exp(-z))
+        return out
+
+    def save(self, path: str) -> None:
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.models, f, ensure_ascii=False, indent=1)
+
+    @classmethod
+    def load(cls, path: str) -> "StrategyClassifier":
+        with open(path, "r", encoding="utf-8") as f:
+            return cls(json.load(f))
+
+
+class AdaptiveRouter:
+    """成本感知的自适应路由：在启发式计划基础上，只保留“收益足以覆盖成本”的策略。
+
+    中文说明：
+        - 启发式计划（choose_strategy）给出候选策略；某 (问句类型, 策略) 样本数不足
+          min_samples 时沿用启发式决定（冷启动 / 持续采样）；
+        - 样本充足时，期望收益 = 边际贡献的滑动平均（有分类器时乘以其预测概率），
+          期望成本 = cost_per_ms × 延迟滑动平均；收益 - 成本 ≥ min_gain 才启用；
+          设置 latency_budget_ms 时，预期延迟超出预算的策略一律不启用；
+        - explore_rate 的请求原样执行启发式计划，保证被关闭的策略仍能积累统计；
+        - record() 由管线在请求结束后调用；设置 log_path 时同时追加 JSONL 记录，
+          供 StrategyClassifier.fit 离线训练；
+        - 设置 stats_path 时，record() 每隔 stats_save_interval_s 把统计写回该文件，
+          进程退出时（save_adaptive_stats）再写一次；多个工作进程共用同一文件时后写者覆盖。
+    """
+
+    def __init__(self, cfg: AdaptiveRouterConfig, stats: Optional[StrategyStats] = None,
+                 classifier: Optional[StrategyClassifier] = None, seed: Optional[int] = None) -> None:
+        self.cfg = cfg
+        self.stats = stats if stats is not None else StrategyStats(cfg.ewma_alpha)
+        self.classifier = classifier
+        self._rng = random.Random(seed)
+        self._log_lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._last_save = time.monotonic()
+
+    def expected(self, q: str, strategy: str) -> Optional[Tuple[float, float]]:
+        """返回 (期望收益, 期望延迟毫秒)；样本不足时返回 None。"""
+        st = self.stats.get(query_type(q), strategy)
+        if st is None or st["n"] < self.cfg.min_samples:
+            return None
+        gain = st["gain"]
+        if self.classifier is not None:
+            gain *= self.classifier.predict(q).get(strategy, 1.0)
+        return gain, st["latency_ms"]
+
+    def plan(self, q: str, base: StrategyPlan) -> StrategyPlan:
+        if self._rng.random() < self.cfg.explore_rate:
+            return base
+        changes: Dict[str, bool] = {}
+        for s in STRATEGIES:
+            if not getattr(base, f"use_{s}"):
+                continue
+            exp = self.expected(q, s)
+            if exp is None:
+                continue
+            gain, latency = exp
+            budget = self.cfg.latency_budget_ms
+            if (budget is not None and latency > budget) \
+                    or gain - self.cfg.cost_per_ms * latency < self.cfg.min_gain:
+                changes[f"use_{s}"] = False
+        if changes:
+            logger.debug("自适应路由关闭策略: {}", sorted(changes))
+        return replace(base, **changes) if changes else base
+
+    def record(self, q: str, latency_ms: Dict[str, float], gains: Dict[str, float]) -> None:
+        qtype = query_type(q)
+        rows = []
+        for s in STRATEGIES:
+            if s in latency_ms:
+                g = gains.get(s, 0.0)
+                self.stats.record(qtype, s, latency_ms[s], g)
+                rows.append({"q": q, "qtype": qtype, "strategy": s,
+                             "latency_ms": round(latency_ms[s], 3), "gain": g})
+        if self.cfg.log_path and rows:
+            with self._log_lock, open(self.cfg.log_path, "a", encoding="utf-8") as f:
+                for r in rows:
+                    f.write(json.dumps(r, ensure_ascii=False) + "\n")
+        interval = self.cfg.stats_save_interval_s
+        if interval is not None and time.monotonic() - self._last_save >= interval:
+            self.save_stats(block=False)
+
+    def save_stats(self, block: bool = True) -> bool:
+        """把统计写回 stats_path（未配置时不做任何事）；block=False 时已有写回在进行则跳过。"""
+        if not self.cfg.stats_path or not self._save_lock.acquire(blocking=block):
+            return False
+        try:
+            self._last_save = time.monotonic()
+            self.stats.save(self.cfg.stats_path)
+            return True
+        except OSError as exc:
+            logger.warning("自适应路由统计写回失败: path={} exc={}", self.cfg.stats_path, exc)
+            return False
+        finally:
+            self._save_lock.release()
+
+
+_lock = threading.Lock()
+_routers: Dict[str, AdaptiveRouter] = {}
+
+
+def get_adaptive_router(cfg: AppConfig) -> Optional[AdaptiveRouter]:
+    """进程级自适应路由（按配置区分实例）；mode 不是 "adaptive" 时返回 None。
+
+    首次创建时加载 stats_path / classifier_path（文件存在时）；统计的写回见 AdaptiveRouter。
+    """
+    acfg = cfg.router.adaptive
+    if cfg.router.mode != "adaptive":
+        return None
+    key = acfg.model_dump_json()
+    router = _routers.get(key)
+    if router is None:
+        with _lock:
+            router = _routers.get(key)
+            if router is None:
+                stats = StrategyStats(acfg.ewma_alpha)
+                if acfg.stats_path and os.path.exists(acfg.stats_path):
+                    stats.load(acfg.stats_path)
+                clf = None
+                if acfg.classifier_path and os.path.exists(acfg.classifier_path):
+                    clf = StrategyClassifier.load(acfg.classifier_path)
+                router = _routers[key] = AdaptiveRouter(acfg, stats, clf, seed=acfg.seed)
+    return router
+
+
+def save_adaptive_stats() -> None:
+    """把进程内所有自适应路由的统计写回各自的 stats_path（进程退出时自动调用）。"""
+    with _lock:
+        routers = list(_routers.values())
+    for router in routers:
+        router.save_stats()
+
+
+atexit.register(save_adaptive_stats)
@@ -0,0 +1,164 @@
+"""Combined rewrite prompt: MultiQuery, HyDE and Self-Query in one LLM round trip."""
+from __future__ import annotations
+
+from typing import Any, Dict, List, Optional, Sequence
+import asyncio
+import json
+
+import regex as re
+from loguru import logger
+
+from ..llm.base import AsyncLLMClient, LLMClient
+from .hyde import ahyde_generate, hyde_generate
+from .multiquery import (
+    N_LINES, amultiquery_rewrite, finalize_multiquery, multiquery_rewrite,
+)
+from .router import StrategyPlan
+from .self_query import aextract_filters, extract_filters
+
+# 阶段输出键 → 组合响应中的字段
+FIELDS = {"multiquery": "queries", "hyde": "hyde", "filters": "filters"}
+SCHEMA_PREFIX = "combined:"
+MAX_TOKENS = 1024
+_FILTER_KEYS = ("keywords", "must_filters", "should_filters", "not_filters")
+_JSON_OBJ = re.compile(r"\{(?:[^{}]|(?R))*\}")
+
+
+def combined_outputs(plan: StrategyPlan) -> List[str]:
+    """计划中需要 LLM 产出的阶段输出键（顺序固定）。"""
+    wanted = [("multiquery", plan.use_multiquery), ("hyde", plan.use_hyde),
+              ("filters", plan.use_self_query)]
+    return [k for k, on in wanted if on]
+
+
+def schema_hint(outputs: Sequence[str]) -> str:
+    """组合请求的 schema_hint：列出需要的字段（DummyLLM / 桩服务据此构造响应）。"""
+    return SCHEMA_PREFIX + ",".join(FIELDS[k] for k in outputs)
+
+
+def build_combined_prompt(q: str, outputs: Sequence[str]) -> str:
+    """构造组合提示词：一次请求返回计划所需的全部改写产物。"""
+    parts = [f"针对问题“{q}”，一次性输出一个 JSON 对象，只包含以下字段："]
+    if "multiquery" in outputs:
+        parts.append(f'"queries"：{N_LINES} 条语义等价但措辞多样的检索查询（字符串数组）；')
+    if "hyde" in outputs:
+        parts.append('"hyde"：一段与技术文档风格一致的假想摘要（150~220字），覆盖背景、时间与'
+                     "主体信息，不要编造具体数值与专有名词；")
+    if "filters" in outputs:
+        parts.append('"filters"：结构化过滤条件 '
+                     '{"keywords":[],"must_filters":{},"should_filters":{},"not_filters":{}}；')
+    parts.append("不要输出 JSON 以外的任何内容。")
+    return "\n".join(parts)
+
+
+def _as_object(data: Any) -> Optional[Dict[str, Any]]:
+    """LLM 输出 → 字典；兼容 JSON 字符串、Markdown 代码块与前后多余文字。"""
+    if isinstance(data, dict):
+        return data
+    if not isinstance(data, str):
+        return None
+    for cand in [data.strip(), *(m.group(0) for m in _JSON_OBJ.finditer(data))]:
+        try:
+            obj = json.loads(cand)
+        except ValueError:
+            continue
+        if isinstance(obj, dict):
+            return obj
+    return None
+
+
+def parse_combined(data: Any, outputs: Sequence[str]) -> Dict[str, Any]:
+    """解析组合响应，只返回校验通过的字段；缺失或类型不符的字段由调用方单独回退。
+
+    中文说明：
+        - queries：非空字符串数组（也接受换行分隔的字符串）；
+        - hyde：非空字符串；
+        - filters：对象，且只保留 keywords / must / should / not 四个键。
+    """
+    obj = _as_object(data)
+    if obj is None:
+        return {}
+    parsed: Dict[str, Any] = {}
+    if "multiquery" in outputs:
+        qs = obj.get("queries")
+        if isinstance(qs, str):
+            qs = qs.splitlines()
+        if isinstance(qs, list):
+            lines = [str(x).strip() for x in qs if isinstance(x, (str, int, float))]
+            if any(lines):
+                parsed["multiquery"] = [x for x in lines if x]
+    if "hyde" in outputs:
+        doc = obj.get("hyde")
+        if isinstance(doc, str) and doc.strip():
+            parsed["hyde"] = doc.strip()
+    if "filters" in outputs:
+        f = obj.get("filters")
+        if isinstance(f, dict):
+            parsed["filters"] = {k: f[k] for k in _FILTER_KEYS if k in f}
+    return parsed
+
+
+def _finalize(cqr: str, outputs: Sequence[str], parsed: Dict[str, Any], max_queries: int,
+              dedup_thr: float, embedder: Optional[Any]) -> Dict[str, Any]:
+    out: Dict[str, Any] = {}
+    if "multiquery" in parsed:
+        out["multiquery"] = finalize_multiquery(cqr, parsed["multiquery"][:N_LINES], max_queries,
+                                                dedup_thr, embedder=embedder)
+    if "hyde" in parsed:
+        out["hyde"] = [parsed["hyde"]]
+    if "filters" in parsed:
+        out["filters"] = parsed["filters"]
+    missing = [k for k in outputs if k not in out]
+    if missing:
+        logger.warning("组合改写响应缺少字段，逐策略回退: {}", missing)
+    return out
+
+
+def combined_rewrite(llm: LLMClient, cqr: str, outputs: Sequence[str], max_queries: int,
+                     dedup_thr: float, embedder: Optional[Any] = None) -> Dict[str, Any]:
+    """一次 LLM 往返产出 outputs 中的全部阶段输出（键同阶段图：multiquery / hyde / filters）。
+
+    中文说明：
+        - 返回值与逐策略调用一致：multiquery 为去重裁剪后的查询列表，hyde 为单元素列表，
+          filters 为过滤条件字典；
+        - 整体调用失败或某字段解析失败时，对应策略回退为单独调用（仍保证结果完整）。
+    """
+    try:
+        data = llm.generate_json(build_combined_prompt(cqr, outputs),
+                                 schema_hint=schema_hint(outputs), max_tokens=MAX_TOKENS)
+    except Exception as exc:  # noqa: BLE001
+        logger.warning("组合改写调用失败，逐策略回退：{}", exc)
+        data = None
+    out = _finalize(cqr, outputs, parse_combined(data, outputs), max_queries, dedup_thr, embedder)
+    if "multiquery" in outputs and "multiquery" not in out:
+        out["multiquery"] = multiquery_rewrite(llm, cqr, max_queries, dedup_thr, embedder=embedder)
+    if "hyde" in outputs and "hyde" not in out:
+        out["hyde"] = [hyde_generate(llm, cqr)]
+    if "filters" in outputs and "filters" not in out:
+        out["filters"] = extract_filters(llm, cqr)
+    return out
+
+
+async def acombined_rewrite(llm: AsyncLLMClient, cqr: str, outputs: Sequence[str],
+                            max_queries: int, dedup_thr: float,
+                            embedder: Optional[Any] = None) -> Dict[str, Any]:
+    """combined_rewrite 的异步版本（回退调用并发执行）。"""
+    try:
+        data = await llm.generate_json(build_combined_prompt(cqr, outputs),
+                                       schema_hint=schema_hint(outputs), max_tokens=MAX_TOKENS)
+    except Exception as exc:  # noqa: BLE001
+        logger.warning("组合改写调用失败，逐策略回退：{}", exc)
+        data = None
+    out = _finalize(cqr, outputs, parse_combined(data, outputs), max_queries, dedup_thr, embedder)
+    todo = {}
+    if "multiquery" in outputs and "multiquery" not in out:
+        todo["multiquery"] = amultiquery_rewrite(llm, cqr, max_queries, dedup_thr,
+                                                 embedder=embedder)
+    if "hyde" in outputs and "hyde" not in out:
+        todo["hyde"] = ahyde_generate(llm, cqr)
+    if "filters" in outputs and "filters" not in out:
+        todo["filters"] = aextract_filters(llm, cqr)
+    for k, v in zip(todo, await asyncio.gather(*todo.values())):
+        out[k] = [v] if k == "hyde" else v
+    return out
+
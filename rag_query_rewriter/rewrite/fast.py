@@ -0,0 +1,35 @@
+"""Import-light normalize + CQR path (no pydantic config, NumPy, retrievers or LLM clients)."""
+from __future__ import annotations
+
+from typing import Any, Dict, Optional
+
+from ..utils.alias_registry import get_alias_matcher
+from ..utils.text_norm import normalize_text
+from .cqr import cqr_rewrite
+
+
+def normalize_query(q: str, alias_path: Optional[str] = None, *, case_fold: bool = True,
+                    punct_trim: bool = True, date_normalize: bool = True,
+                    alias_reload_interval_s: float = 1.0) -> str:
+    """A. 规范化；参数与 NormalizerConfig 的字段一一对应（orchestrator 按配置调用同一函数）。"""
+    return normalize_text(
+        q,
+        alias_table=get_alias_matcher(alias_path, check_interval_s=alias_reload_interval_s),
+        case_fold=case_fold,
+        punct_trim=punct_trim,
+        date_normalize=date_normalize,
+    )
+
+
+def normalize_and_cqr(q: str, ctx: str = "", alias_path: Optional[str] = None,
+                      **normalize_opts: Any) -> Dict[str, str]:
+    """只做规范化 + CQR 的快速路径，结果与完整管线的 normalized / cqr 字段一致。
+
+    中文说明：
+        - 仅依赖 regex、loguru 与别名注册中心，导入耗时约为完整管线的三分之一（见
+          benchmarks/startup.py），适合短生命周期进程（rqw cqr）与只需自包含改写的调用方；
+        - 别名表（PyYAML）与日期解析（dateparser）仍在首次用到时才导入；
+        - normalize_opts 同 normalize_query 的关键字参数。
+    """
+    q_norm = normalize_query(q, alias_path, **normalize_opts)
+    return {"query": q, "normalized": q_norm, "cqr": cqr_rewrite(q_norm, history_brief=ctx)}
@@ -1,13 +1,24 @@
 """HyDE: Query->Hypothetical Document->Embedding Retrieval."""
 from __future__ import annotations
 
-from ..llm.base import LLMClient
+from ..llm.base import AsyncLLMClient, LLMClient
 
+MAX_TOKENS = 220
 
-def hyde_generate(llm: LLMClient, q: str) -> str:
-    """生成“假想文档”摘要用于向量检索。"""
-    prompt = (
+
+def build_hyde_prompt(q: str) -> str:
+    """构造 HyDE 提示词。"""
+    return (
         f"针对问题“{q}”，撰写一段与技术文档风格一致的假想摘要（150~220字），"
         "应覆盖背景、时间与主体信息，不要编造具体数值与专有名词，仅输出正文。"
     )
-    return llm.generate(prompt, max_tokens=220)
+
+
+def hyde_generate(llm: LLMClient, q: str) -> str:
+    """生成“假想文档”摘要用于向量检索。"""
+    return llm.generate(build_hyde_prompt(q), max_tokens=MAX_TOKENS)
+
+
+async def ahyde_generate(llm: AsyncLLMClient, q: str) -> str:
+    """hyde_generate 的异步版本。"""
+    return await llm.generate(build_hyde_prompt(q), max_tokens=MAX_TOKENS)
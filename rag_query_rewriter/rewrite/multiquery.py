@@ -1,9 +1,9 @@
 """MultiQuery rewriting with LLM and dedup."""
 from __future__ import annotations
 
-from typing import List
+from typing import Any, List, Optional
 from loguru import logger
-from ..llm.base import LLMClient
+from ..llm.base import AsyncLLMClient, LLMClient
 from ..utils.similarity import dedup_texts_by_cosine
 
 
@@ -18,20 +18,52 @@ _FALLBACKS = [
     "{q} 发行说明",
 ]
 
+N_LINES = 8
+
+
+def build_multiquery_prompt(q: str) -> str:
+    """构造 MultiQuery 提示词。"""
+    return f'基于问题“{q}”，请给出 8 条语义等价但措辞多样的检索查询；每行一条，不要编号。'
+
+
+def fallback_lines(q: str) -> List[str]:
+    """LLM 不可用时的模板化回退候选。"""
+    return [t.format(q=q) for t in _FALLBACKS]
+
+
+def multiquery_candidates(q: str, lines: List[str]) -> List[str]:
+    """原问句 + 非空 LLM 候选（去重前）。"""
+    return [q] + [c for c in lines if c and c.strip()]
+
+
+def finalize_multiquery(q: str, lines: List[str], max_queries: int, dedup_thr: float,
+                        embedder: Optional[Any] = None) -> List[str]:
+    """对 LLM 输出做去重与裁剪；传入 embedder（已拟合的 TF-IDF 或共享嵌入器）时不再重新拟合。"""
+    candidates = multiquery_candidates(q, lines)
+    deduped = dedup_texts_by_cosine(candidates, thr=dedup_thr, embedder=embedder)
+    kept = deduped[:max_queries]
+    logger.debug("MultiQuery 生成={} 去重后={}", len(candidates), len(kept))
+    return kept
+
 
 def multiquery_rewrite(llm: LLMClient, q: str, max_queries: int,
-                       dedup_thr: float) -> List[str]:
+                       dedup_thr: float, embedder: Optional[Any] = None) -> List[str]:
     """基于 LLM 生成多样化等价查询，并做去重与裁剪。"""
-    prompt = f'基于问题“{q}”，请给出 8 条语义等价但措辞多样的检索查询；每行一条，不要编号。'
     lines = []
     try:
-        lines = llm.generate_lines(prompt, n_lines=8)
+        lines = llm.generate_lines(build_multiquery_prompt(q), n_lines=N_LINES)
     except Exception as exc:  # noqa: BLE001
         logger.warning("LLM multiquery 失败，使用回退：{}", exc)
-        lines = [t.format(q=q) for t in _FALLBACKS]
+        lines = fallback_lines(q)
+    return finalize_multiquery(q, lines, max_queries, dedup_thr, embedder=embedder)
 
-    candidates = [q] + [c for c in lines if c and c.strip()]
-    deduped = dedup_texts_by_cosine(candidates, thr=dedup_thr)
-    kept = deduped[:max_queries]
-    logger.debug("MultiQuery 生成={} 去重后={}", len(candidates), len(kept))
-    return kept
+
+async def amultiquery_rewrite(llm: AsyncLLMClient, q: str, max_queries: int,
+                              dedup_thr: float, embedder: Optional[Any] = None) -> List[str]:
+    """multiquery_rewrite 的异步版本。"""
+    try:
+        lines = await llm.generate_lines(build_multiquery_prompt(q), n_lines=N_LINES)
+    except Exception as exc:  # noqa: BLE001
+        logger.warning("LLM multiquery 失败，使用回退：{}", exc)
+        lines = fallback_lines(q)
+    return finalize_multiquery(q, lines, max_queries, dedup_thr, embedder=embedder)
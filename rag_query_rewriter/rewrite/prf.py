@@ -1,21 +1,131 @@
-"""PRF (Pseudo Relevance Feedback) / RM3-like expansion."""
+"""PRF (Pseudo Relevance Feedback) / RM3 expansion over a shared first-hop pool."""
 from __future__ import annotations
 
-from typing import List
-import regex as re
 from collections import Counter
-from ..retrievers.base import Retriever
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+import threading
 
+from ..config import PRFConfig
+from ..retrievers.base import AsyncRetriever, Retriever, SearchResult
+from ..utils.cache import TTLCache
+from ..utils.tokenize import tokenize
 
-def rm3_expand_query(ret: Retriever, q: str, topk_initial: int,
-                     expansion_terms: int, stopwords: List[str]) -> str:
-    """RM3 风格的简化扩展：从首跳 top-k 文档中抽取高频关键词进行扩展。"""
+
+class DocTermStats:
+    """文档级词项统计缓存：(doc_id, 文本哈希) → (词频, 文档长度)，LRU 淘汰。
+
+    中文说明：
+        - 分词与 BM25 一致（英文词 + 汉字单字/双字），同一文档在多次 PRF 间只分词一次；
+        - 键含文本哈希，索引更新后同 id 的新文本不会命中旧统计。
+    """
+
+    def __init__(self, capacity: int = 10_000) -> None:
+        self._cache: TTLCache[Tuple[Dict[str, int], int]] = TTLCache(capacity)
+
+    def get(self, doc_id: str, text: str) -> Tuple[Dict[str, int], int]:
+        key = (doc_id, hash(text))
+        st = self._cache.get(key)
+        if st is None:
+            toks = tokenize(text)
+            st = (dict(Counter(toks)), len(toks))
+            self._cache.put(key, st)
+        return st
+
+    def stats(self) -> Dict[str, int]:
+        return self._cache.stats()
+
+
+def _idf_fn(ret: object) -> Optional[Callable[[str], float]]:
+    """检索器提供语料级 idf(term) 时返回之（BM25 / mmap BM25），否则 None。"""
+    fn = getattr(ret, "idf", None)
+    return fn if callable(fn) else None
+
+
+def rm3_terms(q: str, res: Sequence[SearchResult], expansion_terms: int,
+              stopwords: Sequence[str], idf: Optional[Callable[[str], float]] = None,
+              min_idf: float = 0.0, stats: Optional[DocTermStats] = None
+              ) -> List[Tuple[str, float]]:
+    """RM3 扩展词及权重：P(w|R) = Σ_d P(w|d)·P(d|q)，再乘以语料 IDF。
+
+    中文说明：
+        - P(d|q) 取首跳得分归一化（非正得分按 0 计，全为 0 时均匀）；P(w|d) = tf / |d|；
+        - 候选词只取长度 ≥2 的词（汉字取双字），排除查询已有词、纯数字与配置停用词；
+        - 提供 idf 时以 IDF 代替固定停用表：IDF < min_idf 的高频词直接丢弃，其余按 IDF 加权。
+    """
+    if expansion_terms <= 0 or not res:
+        return []
+    stats = stats if stats is not None else _default_stats()
+    sw = {w.lower() for w in stopwords}
+    q_terms = set(tokenize(q))
+    scores = [max(r.score, 0.0) for r in res]
+    total = sum(scores)
+    p_d = [s / total for s in scores] if total > 0 else [1.0 / len(res)] * len(res)
+    weights: Dict[str, float] = {}
+    for r, p in zip(res, p_d):
+        tf, dl = stats.get(r.doc_id, r.text)
+        if not dl or p <= 0:
+            continue
+        for t, c in tf.items():
+            if len(t) < 2 or t in q_terms or t in sw or t.isdigit():
+                continue
+            weights[t] = weights.get(t, 0.0) + p * c / dl
+    if idf is not None:
+        scored = {}
+        for t, w in weights.items():
+            v = idf(t)
+            if v >= min_idf:
+                scored[t] = w * v
+        weights = scored
+    ranked = sorted(weights.items(), key=lambda kv: (-kv[1], kv[0]))
+    return ranked[:expansion_terms]
+
+
+def expand_from_results(q: str, res: Sequence[SearchResult], expansion_terms: int,
+                        stopwords: Sequence[str], idf: Optional[Callable[[str], float]] = None,
+                        min_idf: float = 0.0, stats: Optional[DocTermStats] = None) -> str:
+    """从首跳结果中抽取 RM3 扩展词（按权重降序）拼接到原查询后。"""
+    extra = [t for t, _ in rm3_terms(q, res, expansion_terms, stopwords, idf=idf,
+                                     min_idf=min_idf, stats=stats)]
+    return f"{q} " + " ".join(extra) if extra else q
+
+
+def rm3_expand_query(ret: Retriever, q: str, topk_initial: int, expansion_terms: int,
+                     stopwords: Sequence[str], first_hop: Optional[Sequence[SearchResult]] = None,
+                     min_idf: float = 0.0, stats: Optional[DocTermStats] = None) -> str:
+    """RM3 查询扩展；传入 first_hop（CQR 的检索池）时直接复用，不再发起首跳检索。"""
     if expansion_terms <= 0:
         return q
-    res = ret.search(q, topk=topk_initial)
-    corpus = " ".join([r.text for r in res])
-    toks = re.findall(r"[\p{L}\p{N}_]{2,}", corpus)
-    sw = set(w.lower() for w in stopwords) | {"2023", "2024", "faq", "spec"}  # 演示停用
-    cnt = Counter(w.lower() for w in toks if w.lower() not in sw and not w.isdigit())
-    extra = [w for w, _ in cnt.most_common(expansion_terms)]
-    return f"{q} " + " ".join(extra) if extra else q
+    res = first_hop if first_hop is not None else ret.search(q, topk=topk_initial)
+    return expand_from_results(q, list(res)[:topk_initial], expansion_terms, stopwords,
+                               idf=_idf_fn(ret), min_idf=min_idf, stats=stats)
+
+
+async def arm3_expand_query(ret: AsyncRetriever, q: str, topk_initial: int,
+                            expansion_terms: int, stopwords: Sequence[str],
+                            first_hop: Optional[Sequence[SearchResult]] = None,
+                            min_idf: float = 0.0, stats: Optional[DocTermStats] = None) -> str:
+    """rm3_expand_query 的异步版本。"""
+    if expansion_terms <= 0:
+        return q
+    res = first_hop if first_hop is not None else await ret.search(q, topk=topk_initial)
+    return expand_from_results(q, list(res)[:topk_initial], expansion_terms, stopwords,
+                               idf=_idf_fn(ret), min_idf=min_idf, stats=stats)
+
+
+_lock = threading.Lock()
+_stats: Dict[int, DocTermStats] = {}
+
+
+def _default_stats() -> DocTermStats:
+    return get_doc_term_stats(PRFConfig())
+
+
+def get_doc_term_stats(cfg: PRFConfig) -> DocTermStats:
+    """进程级文档词项统计缓存（按容量区分实例）。"""
+    st = _stats.get(cfg.doc_stats_cache_size)
+    if st is None:
+        with _lock:
+            st = _stats.get(cfg.doc_stats_cache_size)
+            if st is None:
+                st = _stats[cfg.doc_stats_cache_size] = DocTermStats(cfg.doc_stats_cache_size)
+    return st
@@ -2,14 +2,27 @@
 from __future__ import annotations
 
 from typing import Dict, Any
-from ..llm.base import LLMClient
+from ..llm.base import AsyncLLMClient, LLMClient
 
 
-def extract_filters(llm: LLMClient, q: str) -> Dict[str, Any]:
-    """从问句中抽取结构化过滤条件（演示：调用 LLM/dummy 规则）。"""
-    prompt = (
+def build_self_query_prompt(q: str) -> str:
+    """构造 Self-Query 提示词。"""
+    return (
         f'从问题“{q}”中抽取结构化过滤条件，输出 JSON：'
         '{"keywords":[],"must_filters":{},"should_filters":{},"not_filters":{}}'
     )
-    data = llm.generate_json(prompt)
+
+
+def coerce_filters(data: Any) -> Dict[str, Any]:
+    """LLM 输出非字典时视为无过滤条件。"""
     return data if isinstance(data, dict) else {}
+
+
+def extract_filters(llm: LLMClient, q: str) -> Dict[str, Any]:
+    """从问句中抽取结构化过滤条件（演示：调用 LLM/dummy 规则）。"""
+    return coerce_filters(llm.generate_json(build_self_query_prompt(q)))
+
+
+async def aextract_filters(llm: AsyncLLMClient, q: str) -> Dict[str, Any]:
+    """extract_filters 的异步版本。"""
+    return coerce_filters(await llm.generate_json(build_self_query_prompt(q)))
@@ -0,0 +1,133 @@
+"""JSON-over-HTTP front end for RewriteService: rewrite, rewrite+retrieve, health and readiness."""
+from __future__ import annotations
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, List, Optional, Tuple
+import json
+import os
+import socket
+
+from loguru import logger
+
+from ..telemetry.core import get_telemetry
+from ..telemetry.export import PROMETHEUS_CONTENT_TYPE, prometheus_text
+from .service import Item, RewriteService
+
+
+class BadRequest(ValueError):
+    """请求体不合法（HTTP 400）。"""
+
+
+def parse_items(body: Any, max_items: int) -> Tuple[List[Item], bool]:
+    """解析请求体：{"q", "ctx"} 为单条，{"items": [{"q", "ctx"}, ...]} 为批量；返回 (条目, 是否批量)。"""
+    if not isinstance(body, dict):
+        raise BadRequest("request body must be a JSON object")
+    batch = "items" in body
+    rows = body["items"] if batch else [body]
+    if not isinstance(rows, list) or not rows:
+        raise BadRequest("'items' must be a non-empty list")
+    if len(rows) > max_items:
+        raise BadRequest(f"too many items: {len(rows)} > {max_items}")
+    items: List[Item] = []
+    for row in rows:
+        q = row.get("q") if isinstance(row, dict) else None
+        ctx = row.get("ctx", "") if isinstance(row, dict) else None
+        if not isinstance(q, str) or not q.strip() or not isinstance(ctx, str):
+            raise BadRequest("each item needs a non-empty string 'q' and an optional string 'ctx'")
+        items.append((q, ctx))
+    return items, batch
+
+
+class ServingHTTPServer(ThreadingHTTPServer):
+    """多线程 HTTP 服务；可接管已监听的套接字（预派生模式下各工作进程共享同一个监听套接字）。
+
+    中文说明：
+        - 请求线程非守护：server_close() 会等待在途请求完成，停止时不截断响应；
+        - 路由：
+            GET  /healthz        存活探针（进程可响应即 200，附预热状态）
+            GET  /readyz         就绪探针（预热完成前 503）
+            GET  /metrics        Prometheus 文本（cfg.telemetry.enabled 时；按工作进程统计）
+            POST /v1/rewrite     只改写
+            POST /v1/search      改写 + 检索 + 融合（批量请求走批量流水线）
+            POST /admin/reload   重载配置与别名表
+    """
+    daemon_threads = False
+    block_on_close = True
+
+    def __init__(self, service: RewriteService, address: Tuple[str, int] = ("127.0.0.1", 0),
+                 sock: Optional[socket.socket] = None) -> None:
+        super().__init__(address, _Handler, bind_and_activate=sock is None)
+        if sock is not None:
+            self.socket.close()
+            self.socket = sock
+            self.server_address = sock.getsockname()
+        self.service = service
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: ServingHTTPServer
+
+    def _send(self, code: int, raw: bytes, content_type: str = "application/json") -> None:
+        self.send_response(code)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(raw)))
+        self.end_headers()
+        self.wfile.write(raw)
+
+    def _json(self, code: int, body: Any) -> None:
+        self._send(code, json.dumps(body, ensure_ascii=False).encode("utf-8"))
+
+    def do_GET(self) -> None:  # noqa: N802
+        service = self.server.service
+        if self.path == "/healthz":
+            self._json(200, {"status": "ok", "pid": os.getpid(), "state": service.status()["state"]})
+        elif self.path == "/readyz":
+            self._json(200 if service.ready else 503, service.status())
+        elif self.path == "/metrics":
+            tel = get_telemetry(service.cfg)
+            if not tel.enabled:
+                self._json(404, {"error": "telemetry disabled"})
+            else:
+                self._send(200, prometheus_text(tel.metrics).encode("utf-8"),
+                           PROMETHEUS_CONTENT_TYPE)
+        else:
+            self._json(404, {"error": "not found"})
+
+    def do_POST(self) -> None:  # noqa: N802
+        service = self.server.service
+        if self.path == "/admin/reload":
+            self._json(200, service.request_reload() or {"ok": True, "pending": True})
+            return
+        if self.path not in ("/v1/rewrite", "/v1/search"):
+            self._json(404, {"error": "not found"})
+            return
+        scfg = service.cfg.server
+        try:
+            n = int(self.headers.get("Content-Length") or 0)
+            if n > scfg.max_body_bytes:
+                self._json(413, {"error": f"body too large: {n} > {scfg.max_body_bytes}"})
+                return
+            body = json.loads(self.rfile.read(n).decode("utf-8") or "null")
+            items, batch = parse_items(body, scfg.max_batch_items)
+        except (ValueError, UnicodeDecodeError) as exc:
+            self._json(400, {"error": str(exc)})
+            return
+        if not service.ready:
+            self._json(503, {"error": "warming up", **service.status()})
+            return
+        try:
+            fn = service.rewrite if self.path == "/v1/rewrite" else service.search
+            results = fn(items)
+        except Exception as exc:  # noqa: BLE001
+            logger.exception("请求处理失败: {}", self.path)
+            self._json(500, {"error": f"{type(exc).__name__}: {exc}"})
+            return
+        self._json(200, {"results": results} if batch else results[0])
+
+    def log_message(self, fmt: str, *args: Any) -> None:
+        logger.debug("http: " + fmt, *args)
@@ -0,0 +1,171 @@
+"""Pre-fork process model: one master, N workers sharing a listening socket and read-only indexes."""
+from __future__ import annotations
+
+from typing import Any, Dict, Optional
+import os
+import signal
+import socket
+import threading
+import time
+
+from loguru import logger
+
+from ..rewrite.adaptive import save_adaptive_stats
+from .http import ServingHTTPServer
+from .service import RewriteService, ServiceOptions
+
+_RESPAWN_BACKOFF_S = 1.0
+
+
+def _run_worker(service: RewriteService, sock: socket.socket) -> None:
+    """工作进程主循环：后台预热、前台服务；SIGTERM/SIGINT 优雅停止，SIGHUP 重载配置。"""
+    httpd = ServingHTTPServer(service, sock=sock)
+
+    def stop(signum: int, frame: Any) -> None:
+        threading.Thread(target=httpd.shutdown, daemon=True).start()
+
+    def reload(signum: int, frame: Any) -> None:
+        threading.Thread(target=service.reload, daemon=True, name="rqw-reload").start()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    if hasattr(signal, "SIGHUP"):
+        signal.signal(signal.SIGHUP, reload)
+
+    def warm() -> None:
+        try:
+            service.warm_up()
+        except Exception:  # noqa: BLE001
+            logger.exception("工作进程预热失败: pid={}", os.getpid())
+
+    threading.Thread(target=warm, daemon=True, name="rqw-warmup").start()
+    try:
+        httpd.serve_forever(poll_interval=0.2)
+    finally:
+        httpd.server_close()  # 等待在途请求完成
+        save_adaptive_stats()  # 工作进程以 os._exit 退出，不会执行 atexit
+    logger.info("工作进程已停止: pid={}", os.getpid())
+
+
+class PreforkServer:
+    """主进程：监听、预热（不启动线程）后 fork 出 workers 个工作进程并看护。
+
+    中文说明：
+        - fork 前完成的预热（导入、别名匹配器、正则、mmap 索引）由子进程直接继承，只读页在
+          进程间共享；线程池、LLM 客户端与 SQLite 连接在子进程内创建；
+        - SIGHUP（或任一工作进程收到 POST /admin/reload）：主进程先校验并重载自身配置，
+          成功后向所有工作进程转发 SIGHUP，之后新派生的工作进程也使用新配置；
+        - SIGTERM / SIGINT：向工作进程转发 SIGTERM，等待其处理完在途请求，
+          超过 server.graceful_timeout_s 仍未退出的强制结束；
+        - 工作进程意外退出时按固定退避重新派生。
+    """
+
+    def __init__(self, service: RewriteService, sock: socket.socket, workers: int) -> None:
+        self.service = service
+        self.sock = sock
+        self.workers = workers
+        self.children: Dict[int, float] = {}
+        self._stopping = False
+        self._reload = False
+
+    def _spawn(self) -> int:
+        pid = os.fork()
+        if pid == 0:  # pragma: no cover - 子进程
+            code = 0
+            try:
+                for sig in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP):
+                    signal.signal(sig, signal.SIG_DFL)
+                self.service.request_reload = lambda: os.kill(os.getppid(), signal.SIGHUP)
+                _run_worker(self.service, self.sock)
+            except BaseException:  # noqa: BLE001
+                logger.exception("工作进程异常退出: pid={}", os.getpid())
+                code = 1
+            finally:
+                os._exit(code)
+        self.children[pid] = time.monotonic()
+        logger.info("已派生工作进程: pid={}", pid)
+        return pid
+
+    def _on_stop(self, signum: int, frame: Any) -> None:
+        self._stopping = True
+
+    def _on_reload(self, signum: int, frame: Any) -> None:
+        self._reload = True
+
+    def _broadcast(self, sig: int) -> None:
+        for pid in list(self.children):
+            try:
+                os.kill(pid, sig)
+            except ProcessLookupError:
+                self.children.pop(pid, None)
+
+    def _reap(self, block: bool = False) -> Optional[int]:
+        try:
+            pid, status = os.waitpid(-1, 0 if block else os.WNOHANG)
+        except ChildProcessError:
+            self.children.clear()
+            return None
+        if pid:
+            self.children.pop(pid, None)
+            if not self._stopping:
+                logger.warning("工作进程退出: pid={} status={}", pid, status)
+        return pid or None
+
+    def run(self) -> None:
+        signal.signal(signal.SIGTERM, self._on_stop)
+        signal.signal(signal.SIGINT, self._on_stop)
+        signal.signal(signal.SIGHUP, self._on_reload)
+        for _ in range(self.workers):
+            self._spawn()
+        last_death = 0.0
+        while not self._stopping:
+            if self._reload:
+                self._reload = False
+                if self.service.reload().get("ok"):
+                    self._broadcast(signal.SIGHUP)
+            if self._reap() is not None:
+                last_death = time.monotonic()
+            if len(self.children) < self.workers and not self._stopping \
+                    and time.monotonic() - last_death >= _RESPAWN_BACKOFF_S:
+                self._spawn()
+            time.sleep(0.1)
+        self.shutdown()
+
+    def shutdown(self) -> None:
+        self._broadcast(signal.SIGTERM)
+        deadline = time.monotonic() + self.service.cfg.server.graceful_timeout_s
+        while self.children and time.monotonic() < deadline:
+            if self._reap() is None:
+                time.sleep(0.05)
+        if self.children:
+            logger.warning("工作进程未在 {}s 内退出，强制结束: {}",
+                           self.service.cfg.server.graceful_timeout_s, sorted(self.children))
+            self._broadcast(signal.SIGKILL)
+            while self.children and self._reap(block=True) is not None:
+                pass
+        self.sock.close()
+        logger.info("服务已停止")
+
+
+def serve(options: ServiceOptions, host: Optional[str] = None, port: Optional[int] = None,
+          workers: Optional[int] = None) -> None:
+    """启动 HTTP 服务（阻塞直到收到停止信号）；host / port / workers 缺省取 cfg.server。
+
+    workers > 1 且平台支持 fork 时使用预派生模型，否则在当前进程内服务。
+    """
+    service = RewriteService(options)
+    scfg = service.cfg.server
+    host = host if host is not None else scfg.host
+    port = port if port is not None else scfg.port
+    workers = workers if workers is not None else scfg.workers
+    if workers > 1 and not hasattr(os, "fork"):
+        logger.warning("平台不支持 fork，改为单进程服务")
+        workers = 1
+    service.prepare()
+    sock = socket.create_server((host, port), backlog=max(128, 16 * workers))
+    logger.info("服务监听 http://{}:{} workers={} 预热: {}", host, sock.getsockname()[1],
+                workers, service.status()["warmup_ms"])
+    if workers == 1:
+        _run_worker(service, sock)
+    else:
+        PreforkServer(service, sock, workers).run()
@@ -0,0 +1,211 @@
+"""Warm, reloadable serving state behind the HTTP front end (one instance per worker process)."""
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import importlib
+import json
+import os
+import threading
+import time
+
+from loguru import logger
+from pydantic import ValidationError
+
+from ..config import AppConfig
+from ..exceptions import ConfigError
+from ..llm.base import LLMClient
+from ..llm.caching import cached_llm
+from ..llm.dummy import DummyLLM
+from ..retrievers.ann import IVFRetriever, read_ivf_manifest
+from ..retrievers.base import Retriever
+from ..retrievers.hybrid import HybridRetriever
+from ..retrievers.mmap_index import MmapBM25Retriever
+from ..retrievers.mock import MockRetriever
+from ..rewrite.cqr import cqr_rewrite
+from ..utils.alias_registry import alias_registry, get_alias_matcher
+from ..utils.embedding import get_embedder
+from ..utils.text_norm import load_alias_table
+from ..pipeline.batch import rewrite_and_retrieve_many
+from ..pipeline.orchestrator import _normalize, rewrite_and_retrieve, rewrite_query
+
+Item = Tuple[str, str]
+
+# 管线在首次用到时才导入的重依赖；prepare() 在 fork 前导入，worker 共享已加载的模块
+_PRELOAD_MODULES = (
+    "scipy.sparse",
+    "sklearn.feature_extraction.text",
+    "sklearn.preprocessing",
+    "dateparser",
+)
+
+
+@dataclass
+class ServiceOptions:
+    """启动参数：进程生命周期内不变（重载只重读 config_path 与别名表，索引需重启才会更换）。"""
+    config_path: Optional[str] = None  # AppConfig 的 JSON 文件
+    alias_path: Optional[str] = None  # 覆盖 normalizer.alias_table_path
+    index: Optional[str] = None  # mmap BM25 索引目录
+    ann_index: Optional[str] = None  # IVF 向量索引目录（与 index 同时给出时为混合检索）
+    nprobe: int = 8
+    llm_cache: Optional[str] = None  # 覆盖 llm_cache：启用并写入该 SQLite 文件
+
+
+def load_config(options: ServiceOptions) -> AppConfig:
+    """读取配置文件并叠加命令行覆盖项；有向量索引时沿用其 manifest 记录的嵌入配置。"""
+    cfg = AppConfig()
+    if options.config_path:
+        try:
+            with open(options.config_path, "r", encoding="utf-8") as f:
+                cfg = AppConfig.model_validate(json.load(f))
+        except (OSError, ValueError, ValidationError) as exc:
+            raise ConfigError(f"invalid config {options.config_path}: {exc}") from exc
+    if options.alias_path:
+        cfg.normalizer.alias_table_path = options.alias_path
+    if options.llm_cache:
+        cfg.llm_cache.enabled, cfg.llm_cache.path = True, options.llm_cache
+    if options.ann_index:
+        # 查询与 HyDE 向量须与建索引时的嵌入一致
+        emb = read_ivf_manifest(options.ann_index).get("embedding") or {}
+        cfg.embedding = cfg.embedding.model_copy(update=emb)
+    return cfg
+
+
+def build_retriever(cfg: AppConfig, options: ServiceOptions) -> Retriever:
+    """按启动参数打开检索器：mmap BM25 / IVF / 两者混合，都没有时使用 MockRetriever。"""
+    retriever: Retriever = MmapBM25Retriever(options.index) if options.index else MockRetriever()
+    if options.ann_index:
+        ann = IVFRetriever.open(options.ann_index, get_embedder(cfg.embedding),
+                                nprobe=options.nprobe)
+        retriever = HybridRetriever(retriever, ann, method=cfg.fusion.method,
+                                    k=cfg.fusion.rrf_k) if options.index else ann
+    return retriever
+
+
+def build_llm(cfg: AppConfig) -> LLMClient:
+    return cached_llm(DummyLLM(), cfg.llm_cache)
+
+
+class RewriteService:
+    """服务状态：配置、检索器、LLM 与预热 / 就绪状态。
+
+    中文说明：
+        - prepare()：不启动线程的预热（导入、别名匹配器编译、正则与日期解析首次调用），
+          可在 fork 之前于主进程执行，子进程直接继承；检索器（mmap 索引）同样在 fork 前打开，
+          各工作进程共享只读映射页；
+        - warm_up()：在工作进程内创建 LLM 客户端（SQLite 连接不能跨 fork）并以预热查询
+          跑通完整管线（线程池、嵌入与文档向量缓存），完成后 ready=True；
+        - reload()：重读配置文件与别名表，校验通过后原子替换 cfg（在途请求继续使用旧配置），
+          失败时保留旧配置；server.host / port / workers 的变化需要重启才生效；
+        - request_reload 为外部触发重载的入口（预派生模式下改为通知主进程统一下发）。
+    """
+
+    def __init__(self, options: ServiceOptions, cfg: Optional[AppConfig] = None,
+                 retriever: Optional[Retriever] = None,
+                 llm: Optional[LLMClient] = None) -> None:
+        self.options = options
+        self.cfg = cfg if cfg is not None else load_config(options)
+        self.retriever = retriever if retriever is not None else build_retriever(self.cfg, options)
+        self.llm = llm
+        self.generation = 0
+        self.request_reload: Callable[[], Any] = self.reload
+        self._lock = threading.Lock()
+        self._state = "starting"
+        self._steps: Dict[str, float] = {}
+        self._last_reload: Optional[Dict[str, Any]] = None
+
+    @property
+    def ready(self) -> bool:
+        return self._state == "ready"
+
+    def status(self) -> Dict[str, Any]:
+        """就绪状态与预热各步骤耗时（/readyz 的响应体）。"""
+        return {"ready": self.ready, "state": self._state, "pid": os.getpid(),
+                "generation": self.generation,
+                "warmup_ms": {k: round(v, 3) for k, v in self._steps.items()},
+                **({"last_reload": self._last_reload} if self._last_reload else {})}
+
+    def _step(self, name: str, fn: Callable[[], Any]) -> Any:
+        t0 = time.perf_counter()
+        out = fn()
+        self._steps[name] = (time.perf_counter() - t0) * 1000
+        return out
+
+    def _warm_text(self, cfg: AppConfig) -> None:
+        """编译别名匹配器，并让正则 / 日期解析 / CQR 在预热查询上各执行一次。"""
+        self._step("alias", lambda: get_alias_matcher(
+            cfg.normalizer.alias_table_path, check_interval_s=cfg.normalizer.alias_reload_interval_s))
+        self._step("normalize", lambda: [cqr_rewrite(_normalize(q, cfg))
+                                         for q in cfg.server.warmup_queries])
+
+    def prepare(self) -> "RewriteService":
+        """fork 前的预热：导入延迟加载的重依赖，并编译别名匹配器与文本处理路径。"""
+        self._state = "preparing"
+        self._step("imports", lambda: [importlib.import_module(m) for m in _PRELOAD_MODULES])
+        self._warm_text(self.cfg)
+        return self
+
+    def warm_up(self) -> "RewriteService":
+        """完整预热；失败时状态为 "failed"（/readyz 持续返回 503），异常照常抛出。"""
+        self._state = "warming"
+        try:
+            if self.llm is None:
+                self.llm = self._step("llm", lambda: build_llm(self.cfg))
+            if "alias" not in self._steps:
+                self._warm_text(self.cfg)
+            self._step("pipeline", lambda: [
+                rewrite_and_retrieve(q, "", self.cfg, self.llm, self.retriever)
+                for q in self.cfg.server.warmup_queries])
+        except Exception:
+            self._state = "failed"
+            raise
+        self._state = "ready"
+        logger.info("服务预热完成: pid={} {}", os.getpid(), self.status()["warmup_ms"])
+        return self
+
+    def reload(self) -> Dict[str, Any]:
+        """重读配置与别名表；返回 {"ok", "generation", ["error"]}。
+
+        别名表先严格校验（读取 / 解析失败即整体失败），通过后才使注册中心的缓存失效。
+        """
+        with self._lock:
+            try:
+                cfg = load_config(self.options)
+                alias_path = cfg.normalizer.alias_table_path
+                if alias_path:
+                    try:
+                        load_alias_table(alias_path, strict=True)
+                    except Exception as exc:  # noqa: BLE001
+                        raise ConfigError(f"invalid alias table {alias_path}: {exc}") from exc
+            except ConfigError as exc:
+                logger.error("配置重载失败，保留当前配置: {}", exc)
+                self._last_reload = {"ok": False, "error": str(exc)}
+                return {**self._last_reload, "generation": self.generation}
+            fixed = ("host", "port", "workers")
+            if any(getattr(cfg.server, k) != getattr(self.cfg.server, k) for k in fixed):
+                logger.warning("server.host / port / workers 的变化需要重启才生效")
+            reg = alias_registry()
+            reg.invalidate(self.cfg.normalizer.alias_table_path)
+            reg.invalidate(cfg.normalizer.alias_table_path)
+            self._warm_text(cfg)
+            llm = self.llm
+            if llm is not None and cfg.llm_cache != self.cfg.llm_cache:
+                llm = build_llm(cfg)
+            self.cfg, self.llm = cfg, llm
+            self.generation += 1
+            self._last_reload = {"ok": True, "at": time.time()}
+            logger.info("配置已重载: pid={} generation={}", os.getpid(), self.generation)
+            return {**self._last_reload, "generation": self.generation}
+
+    def rewrite(self, items: List[Item]) -> List[Dict[str, Any]]:
+        """只改写（不检索），逐条执行。"""
+        cfg, llm = self.cfg, self.llm
+        return [rewrite_query(q, ctx, cfg, llm) for q, ctx in items]
+
+    def search(self, items: List[Item]) -> List[Dict[str, Any]]:
+        """改写 + 检索：单条走阶段图流水线，多条走批量流水线（LLM 调用与检索跨查询合并）。"""
+        cfg, llm = self.cfg, self.llm
+        if len(items) == 1:
+            return [rewrite_and_retrieve(items[0][0], items[0][1], cfg, llm, self.retriever)]
+        return rewrite_and_retrieve_many(items, cfg, llm, self.retriever,
+                                         batch_size=cfg.server.max_batch_items)
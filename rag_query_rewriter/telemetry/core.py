@@ -0,0 +1,390 @@
+"""In-process tracing spans, latency histograms and counters with a no-op fast path."""
+from __future__ import annotations
+
+from bisect import bisect_left
+from collections import deque
+from contextvars import ContextVar
+from typing import Any, Callable, Deque, Dict, List, Optional, Sequence, Tuple
+import random
+import threading
+import time
+
+from loguru import logger
+
+from ..config import AppConfig, TelemetryConfig
+
+LabelKey = Tuple[Tuple[str, str], ...]
+SpanProcessor = Callable[["Span"], None]
+
+_CURRENT: ContextVar[Optional["Span"]] = ContextVar("rqw_current_span", default=None)
+
+
+def _key(labels: Dict[str, Any]) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items())) if labels else ()
+
+
+class Counter:
+    """单调递增计数器，按标签组合分别计数。"""
+    kind = "counter"
+
+    def __init__(self, name: str, help: str = "") -> None:
+        self.name, self.help = name, help
+        self._lock = threading.Lock()
+        self._values: Dict[LabelKey, float] = {}
+
+    def inc(self, n: float = 1, **labels: Any) -> None:
+        if not n:
+            return
+        key = _key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + n
+
+    def value(self, **labels: Any) -> float:
+        with self._lock:
+            return self._values.get(_key(labels), 0)
+
+    def collect(self) -> List[Tuple[LabelKey, float]]:
+        with self._lock:
+            return sorted(self._values.items())
+
+
+class Histogram:
+    """固定桶直方图（Prometheus 语义：样本计入第一个 ≥ 它的上界桶，超出末桶计入 +Inf）。
+
+    中文说明：
+        - 每个标签组合保存各桶计数（非累积）、总和与样本数，导出时再累积；
+        - quantile() 在桶内线性插值估计分位数，落在 +Inf 桶时返回末桶上界。
+    """
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str = "", buckets: Sequence[float] = (1, 10, 100)) -> None:
+        self.name, self.help = name, help
+        self.buckets: Tuple[float, ...] = tuple(float(b) for b in buckets)
+        self._lock = threading.Lock()
+        self._values: Dict[LabelKey, List[float]] = {}  # [c_0 .. c_n(+Inf), sum, count]
+
+    def observe(self, value: float, **labels: Any) -> None:
+        key = _key(labels)
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            row = self._values.get(key)
+            if row is None:
+                row = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+            row[i] += 1
+            row[-2] += value
+            row[-1] += 1
+
+    def snapshot(self, **labels: Any) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._values.get(_key(labels))
+            row = list(row) if row is not None else None
+        return self._as_dict(row) if row is not None else None
+
+    def _as_dict(self, row: List[float]) -> Dict[str, Any]:
+        return {"counts": [int(c) for c in row[:-2]], "sum": row[-2], "count": int(row[-1])}
+
+    def quantile(self, q: float, **labels: Any) -> Optional[float]:
+        snap = self.snapshot(**labels)
+        if snap is None or not snap["count"]:
+            return None
+        rank, seen = q * snap["count"], 0
+        for i, c in enumerate(snap["counts"]):
+            if c and seen + c >= rank:
+                if i == len(self.buckets):
+                    return self.buckets[-1]
+                lo = self.buckets[i - 1] if i > 0 else 0.0
+                return lo + (self.buckets[i] - lo) * (rank - seen) / c
+            seen += c
+        return self.buckets[-1]
+
+    def collect(self) -> List[Tuple[LabelKey, Dict[str, Any]]]:
+        with self._lock:
+            rows = [(k, list(v)) for k, v in self._values.items()]
+        return [(k, self._as_dict(v)) for k, v in sorted(rows)]
+
+
+class MetricsRegistry:
+    """进程内指标注册表：同名指标只创建一次（类型不一致时报错）。"""
+
+    def __init__(self, buckets: Sequence[float] = (1, 10, 100)) -> None:
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._metrics: Dict[str, Any] = {}
+
+    def _get(self, cls: type, name: str, **kw: Any) -> Any:
+        m = self._metrics.get(name)
+        if m is None:
+            with self._lock:
+                m = self._metrics.get(name)
+                if m is None:
+                    m = self._metrics[name] = cls(name, **kw)
+        if not isinstance(m, cls):
+            raise ValueError(f"metric '{name}' already registered as {m.kind}")
+        return m
+
+    def counter(self, name: str, help: str = "") -> Counter:
+        return self._get(Counter, name, help=help)
+
+    def histogram(self, name: str, help: str = "",
+                  buckets: Optional[Sequence[float]] = None) -> Histogram:
+        return self._get(Histogram, name, help=help, buckets=buckets or self.buckets)
+
+    def metrics(self) -> List[Any]:
+        with self._lock:
+            return [self._metrics[k] for k in sorted(self._metrics)]
+
+    def snapshot(self) -> Dict[str, Any]:
+        """可 JSON 序列化的快照：{name: {type, help, [buckets], series: [{labels, ...}]}}。"""
+        out: Dict[str, Any] = {}
+        for m in self.metrics():
+            entry: Dict[str, Any] = {"type": m.kind, "help": m.help, "series": []}
+            if isinstance(m, Histogram):
+                entry["buckets"] = list(m.buckets)
+                entry["series"] = [{"labels": dict(k), **v} for k, v in m.collect()]
+            else:
+                entry["series"] = [{"labels": dict(k), "value": v} for k, v in m.collect()]
+            out[m.name] = entry
+        return out
+
+
+class Span:
+    """一段计时区间；作为上下文管理器使用时成为当前 span（后续 span 默认以它为父）。
+
+    中文说明：
+        - kind 区分 "request" / "stage" / "retrieval" / "internal"，决定结束时计入哪个直方图；
+        - 上下文内抛出的异常记为 status="error"（异常照常向上抛出）；
+        - 时间戳：开始时刻为 Unix 纳秒（便于导出到 OpenTelemetry），时长取单调时钟。
+    """
+    __slots__ = ("name", "kind", "trace_id", "span_id", "parent_id", "attributes", "status",
+                 "error", "start_unix_ns", "duration_ns", "_t0", "_tracer", "_token")
+
+    def __init__(self, tracer: "Tracer", name: str, kind: str, trace_id: str, span_id: str,
+                 parent_id: Optional[str], attributes: Dict[str, Any]) -> None:
+        self.name, self.kind = name, kind
+        self.trace_id, self.span_id, self.parent_id = trace_id, span_id, parent_id
+        self.attributes = attributes
+        self.status = "ok"
+        self.error: Optional[str] = None
+        self.duration_ns: Optional[int] = None
+        self._tracer = tracer
+        self._token: Any = None
+        self.start_unix_ns = time.time_ns()
+        self._t0 = time.perf_counter_ns()
+
+    def set(self, key: str, value: Any) -> "Span":
+        self.attributes[key] = value
+        return self
+
+    def set_error(self, exc: BaseException) -> None:
+        self.status, self.error = "error", f"{type(exc).__name__}: {exc}"
+
+    @property
+    def duration_ms(self) -> Optional[float]:
+        return self.duration_ns / 1e6 if self.duration_ns is not None else None
+
+    @property
+    def end_unix_ns(self) -> Optional[int]:
+        return self.start_unix_ns + self.duration_ns if self.duration_ns is not None else None
+
+    def end(self) -> None:
+        if self.duration_ns is None:
+            self.duration_ns = time.perf_counter_ns() - self._t0
+            self._tracer._on_end(self)
+
+    def __enter__(self) -> "Span":
+        self._token = _CURRENT.set(self)
+        return self
+
+    def __exit__(self, exc_type: Any, exc: Optional[BaseException], tb: Any) -> bool:
+        if exc is not None:
+            self.set_error(exc)
+        _CURRENT.reset(self._token)
+        self.end()
+        return False
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"name": self.name, "kind": self.kind, "trace_id": self.trace_id,
+                "span_id": self.span_id, "parent_id": self.parent_id,
+                "start_unix_ns": self.start_unix_ns, "duration_ms": self.duration_ms,
+                "status": self.status, "error": self.error, "attributes": dict(self.attributes)}
+
+
+class _NoopSpan:
+    """关闭埋点时返回的共享空 span：所有方法都不做任何事。"""
+    __slots__ = ()
+
+    def set(self, key: str, value: Any) -> "_NoopSpan":
+        return self
+
+    def set_error(self, exc: BaseException) -> None:
+        pass
+
+    def end(self) -> None:
+        pass
+
+    def __enter__(self) -> "_NoopSpan":
+        return self
+
+    def __exit__(self, *exc: Any) -> bool:
+        return False
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class Tracer:
+    """创建 span 并保留最近结束的 max_spans 个；结束时依次调用已注册的处理器。
+
+    中文说明：
+        - 父 span 缺省取当前上下文（contextvars）；线程池中执行的任务需显式传入提交方的 span；
+        - 处理器（如指标聚合、OpenTelemetry 桥接）抛错只记日志，不影响请求。
+    """
+
+    def __init__(self, max_spans: int = 2048) -> None:
+        self._finished: Deque[Span] = deque(maxlen=max_spans)
+        self._processors: List[SpanProcessor] = []
+
+    @staticmethod
+    def current() -> Optional[Span]:
+        return _CURRENT.get()
+
+    def span(self, name: str, kind: str = "internal", parent: Optional[Span] = None,
+             **attributes: Any) -> Span:
+        parent = parent if parent is not None else _CURRENT.get()
+        if parent is None:
+            trace_id, parent_id = f"{random.getrandbits(128):032x}", None
+        else:
+            trace_id, parent_id = parent.trace_id, parent.span_id
+        return Span(self, name, kind, trace_id, f"{random.getrandbits(64):016x}", parent_id,
+                    attributes)
+
+    def add_processor(self, fn: SpanProcessor) -> None:
+        self._processors.append(fn)
+
+    def remove_processor(self, fn: SpanProcessor) -> None:
+        self._processors.remove(fn)
+
+    def _on_end(self, span: Span) -> None:
+        self._finished.append(span)
+        for fn in self._processors:
+            try:
+                fn(span)
+            except Exception as exc:  # noqa: BLE001
+                logger.warning("span 处理器失败: {} exc={}", fn, exc)
+
+    def spans(self, trace_id: Optional[str] = None) -> List[Span]:
+        spans = list(self._finished)
+        return spans if trace_id is None else [s for s in spans if s.trace_id == trace_id]
+
+    def clear(self) -> None:
+        self._finished.clear()
+
+
+class Telemetry:
+    """埋点门面：Tracer + MetricsRegistry 与流水线的标准指标。
+
+    中文说明：
+        - enabled=False 时 span() 返回共享空 span、record_request() 直接返回，
+          调用方无需判断开关，关闭时每个埋点点只多一次属性判断；
+        - span 结束时按 kind 计入直方图：request → rqw_request_latency_ms{mode}，
+          stage → rqw_stage_latency_ms{stage}，retrieval → rqw_retrieval_latency_ms{backend}；
+          出错的 span 计入 rqw_span_errors_total{kind, span}；
+        - 候选数、缓存命中、检索丢弃/超时/对冲与放弃的阶段由 record_request() 从返回的
+          metrics 中累加。
+    """
+
+    def __init__(self, cfg: Optional[TelemetryConfig] = None, enabled: bool = True) -> None:
+        cfg = cfg or TelemetryConfig()
+        self.enabled = enabled
+        self.tracer = Tracer(cfg.max_spans)
+        self.metrics = MetricsRegistry(cfg.latency_buckets_ms)
+        m = self.metrics
+        self.requests = m.counter("rqw_requests_total", "Completed rewrite_and_retrieve requests")
+        self.request_latency = m.histogram("rqw_request_latency_ms", "End-to-end request latency")
+        self.stage_latency = m.histogram("rqw_stage_latency_ms", "Pipeline stage latency")
+        self.retrieval_latency = m.histogram("rqw_retrieval_latency_ms",
+                                             "Retriever call latency (excluding queueing)")
+        self.span_errors = m.counter("rqw_span_errors_total", "Spans that ended with an exception")
+        self.candidates = m.counter("rqw_candidates_total", "Query candidates retrieved")
+        self.cache_lookups = m.counter("rqw_cache_lookups_total", "Layered cache lookups")
+        self.retrieval_dropped = m.counter("rqw_retrieval_dropped_total",
+                                           "Candidate retrievals shed or timed out")
+        self.retrieval_hedged = m.counter("rqw_retrieval_hedged_total", "Hedged retrieval calls")
+        self.stages_abandoned = m.counter("rqw_stages_abandoned_total",
+                                          "Stages abandoned at the request deadline")
+        self.tracer.add_processor(self._observe)
+
+    def span(self, name: str, kind: str = "internal", parent: Optional[Span] = None,
+             **attributes: Any) -> Any:
+        if not self.enabled:
+            return NOOP_SPAN
+        return self.tracer.span(name, kind, parent, **attributes)
+
+    def current_span(self) -> Optional[Span]:
+        return self.tracer.current() if self.enabled else None
+
+    def _observe(self, span: Span) -> None:
+        ms = span.duration_ms
+        if span.kind == "stage":
+            self.stage_latency.observe(ms, stage=span.name)
+        elif span.kind == "retrieval":
+            self.retrieval_latency.observe(ms, backend=span.attributes.get("backend", ""))
+        elif span.kind == "request":
+            self.request_latency.observe(ms, mode=span.attributes.get("mode", ""))
+        if span.status == "error":
+            self.span_errors.inc(kind=span.kind, span=span.name)
+
+    def record_request(self, metrics: Dict[str, Any], mode: str = "sync") -> None:
+        """按一次请求返回的 metrics 累加计数器（响应缓存命中时只计请求与缓存查找）。"""
+        if not self.enabled:
+            return
+        self.requests.inc(mode=mode)
+        cache = metrics.get("cache") or {}
+        for layer in ("response", "rewrite"):
+            if cache.get(layer, "disabled") != "disabled":
+                self.cache_lookups.inc(layer=layer, result=cache[layer])
+        self.cache_lookups.inc(cache.get("pool_hits", 0), layer="pool", result="hit")
+        self.cache_lookups.inc(cache.get("pool_misses", 0), layer="pool", result="miss")
+        if cache.get("response") in ("hit", "near_hit"):
+            return
+        self.candidates.inc(metrics.get("num_candidates", 0), mode=mode)
+        self.retrieval_dropped.inc(metrics.get("retrieval_shed", 0), reason="shed")
+        self.retrieval_dropped.inc(metrics.get("retrieval_missed", 0), reason="timeout")
+        self.retrieval_hedged.inc(metrics.get("retrieval_hedged", 0))
+        for st in metrics.get("stages_abandoned") or ():
+            self.stages_abandoned.inc(stage=st)
+
+    def snapshot(self, spans: bool = True) -> Dict[str, Any]:
+        """指标快照（及最近结束的 span），用于 JSON 导出。"""
+        out: Dict[str, Any] = {"metrics": self.metrics.snapshot()}
+        if spans:
+            out["spans"] = [s.to_dict() for s in self.tracer.spans()]
+        return out
+
+
+DISABLED = Telemetry(enabled=False)
+
+_lock = threading.Lock()
+_telemetry: Optional[Telemetry] = None
+
+
+def get_telemetry(cfg: Optional[AppConfig] = None) -> Telemetry:
+    """进程级埋点实例；cfg 为空或 telemetry.enabled=False 时返回共享的关闭实例。
+
+    进程内只有一个启用的实例（指标需在同一注册表中聚合），桶与缓冲容量取首次创建时的配置。
+    """
+    global _telemetry
+    if cfg is None or not cfg.telemetry.enabled:
+        return DISABLED
+    if _telemetry is None:
+        with _lock:
+            if _telemetry is None:
+                _telemetry = Telemetry(cfg.telemetry)
+    return _telemetry
+
+
+def set_telemetry(telemetry: Optional[Telemetry]) -> None:
+    """替换进程级埋点实例（传 None 则下次按配置重建）。"""
+    global _telemetry
+    with _lock:
+        _telemetry = telemetry
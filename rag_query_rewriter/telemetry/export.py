@@ -0,0 +1,234 @@
+"""Telemetry exporters: Prometheus text format, JSON dump, OTLP/JSON and an OpenTelemetry SDK bridge."""
+from __future__ import annotations
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Iterable, List, Optional
+from urllib.parse import parse_qs, urlparse
+import json
+import math
+import os
+import threading
+
+from loguru import logger
+
+from ..exceptions import ConfigError
+from .core import Histogram, LabelKey, MetricsRegistry, Span, Telemetry
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+_SERVICE_NAME = "rag-query-rewriter"
+
+
+def _escape(v: str) -> str:
+    return v.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(key: LabelKey, extra: Optional[Dict[str, str]] = None) -> str:
+    pairs = list(key) + list((extra or {}).items())
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}" if pairs else ""
+
+
+def _num(v: float) -> str:
+    if math.isinf(v):
+        return "+Inf" if v > 0 else "-Inf"
+    return str(int(v)) if float(v).is_integer() else repr(float(v))
+
+
+def prometheus_text(registry: MetricsRegistry) -> str:
+    """按 Prometheus 文本格式（0.0.4）渲染全部指标；直方图桶计数在此累积。"""
+    lines: List[str] = []
+    for m in registry.metrics():
+        lines.append(f"# HELP {m.name} {m.help}")
+        lines.append(f"# TYPE {m.name} {m.kind}")
+        if isinstance(m, Histogram):
+            for key, row in m.collect():
+                acc = 0
+                for le, c in zip(list(m.buckets) + [math.inf], row["counts"]):
+                    acc += c
+                    lines.append(f"{m.name}_bucket{_labels(key, {'le': _num(le)})} {acc}")
+                lines.append(f"{m.name}_sum{_labels(key)} {_num(row['sum'])}")
+                lines.append(f"{m.name}_count{_labels(key)} {row['count']}")
+        else:
+            for key, v in m.collect():
+                lines.append(f"{m.name}{_labels(key)} {_num(v)}")
+    return "\n".join(lines) + "\n"
+
+
+def _otlp_value(v: Any) -> Dict[str, Any]:
+    if isinstance(v, bool):
+        return {"boolValue": v}
+    if isinstance(v, int):
+        return {"intValue": str(v)}
+    if isinstance(v, float):
+        return {"doubleValue": v}
+    return {"stringValue": str(v)}
+
+
+def otlp_json(spans: Iterable[Span], service_name: str = _SERVICE_NAME) -> Dict[str, Any]:
+    """已结束的 span → OTLP/JSON 的 ExportTraceServiceRequest（可直接 POST 到 collector 的 /v1/traces）。"""
+    out = []
+    for s in spans:
+        if s.duration_ns is None:
+            continue
+        span: Dict[str, Any] = {
+            "traceId": s.trace_id, "spanId": s.span_id, "name": s.name,
+            "kind": 1,  # SPAN_KIND_INTERNAL
+            "startTimeUnixNano": str(s.start_unix_ns), "endTimeUnixNano": str(s.end_unix_ns),
+            "attributes": [{"key": k, "value": _otlp_value(v)}
+                           for k, v in {"rqw.kind": s.kind, **s.attributes}.items()],
+            "status": {"code": 2, "message": s.error or ""} if s.status == "error"
+            else {"code": 1},
+        }
+        if s.parent_id:
+            span["parentSpanId"] = s.parent_id
+        out.append(span)
+    return {"resourceSpans": [{
+        "resource": {"attributes": [{"key": "service.name",
+                                     "value": {"stringValue": service_name}}]},
+        "scopeSpans": [{"scope": {"name": "rag_query_rewriter"}, "spans": out}],
+    }]}
+
+
+def write_telemetry(telemetry: Telemetry, path: str, fmt: str = "json") -> None:
+    """按格式写出埋点数据："json"（指标 + span）、"metrics-json"、"prometheus"、"otlp"（span）。"""
+    if fmt == "prometheus":
+        body = prometheus_text(telemetry.metrics)
+    elif fmt == "otlp":
+        body = json.dumps(otlp_json(telemetry.tracer.spans()), ensure_ascii=False, indent=2)
+    elif fmt in ("json", "metrics-json"):
+        body = json.dumps(telemetry.snapshot(spans=fmt == "json"), ensure_ascii=False, indent=2)
+    else:
+        raise ValueError(f"unknown telemetry format: {fmt}")
+    d = os.path.dirname(path)
+    if d:
+        os.makedirs(d, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(body)
+
+
+class OTelSpanBridge:
+    """span 处理器：把结束的 span 转成 OpenTelemetry SDK 的 ReadableSpan，按批交给任意 SpanExporter。
+
+    中文说明：
+        - 需要安装 opentelemetry-sdk（可选依赖，构造时才导入）；exporter 可以是 OTLP、Console 等；
+        - 攒满 batch_size 个 span 时导出一次，flush() / shutdown() 导出剩余部分；
+        - 用法：tel.tracer.add_processor(OTelSpanBridge(exporter))。
+    """
+
+    def __init__(self, exporter: Any, batch_size: int = 64,
+                 service_name: str = _SERVICE_NAME) -> None:
+        try:
+            from opentelemetry.sdk.resources import Resource
+            from opentelemetry.sdk.trace import ReadableSpan
+            from opentelemetry.trace import SpanContext, Status, StatusCode, TraceFlags
+        except ImportError as exc:  # pragma: no cover - 可选依赖
+            raise ConfigError("OTelSpanBridge requires opentelemetry-sdk") from exc
+        self._readable, self._ctx, self._flags = ReadableSpan, SpanContext, TraceFlags(0x01)
+        self._status, self._code = Status, StatusCode
+        self._resource = Resource.create({"service.name": service_name})
+        self.exporter = exporter
+        self.batch_size = batch_size
+        self._lock = threading.Lock()
+        self._buf: List[Any] = []
+
+    def _convert(self, s: Span) -> Any:
+        ctx = self._ctx(int(s.trace_id, 16), int(s.span_id, 16), False, self._flags)
+        parent = self._ctx(int(s.trace_id, 16), int(s.parent_id, 16), False, self._flags) \
+            if s.parent_id else None
+        status = self._status(self._code.ERROR, s.error) if s.status == "error" \
+            else self._status(self._code.OK)
+        attrs = {k: v if isinstance(v, (bool, int, float, str)) else str(v)
+                 for k, v in {"rqw.kind": s.kind, **s.attributes}.items()}
+        return self._readable(name=s.name, context=ctx, parent=parent, resource=self._resource,
+                              attributes=attrs, status=status, start_time=s.start_unix_ns,
+                              end_time=s.end_unix_ns)
+
+    def __call__(self, span: Span) -> None:
+        with self._lock:
+            self._buf.append(self._convert(span))
+            if len(self._buf) < self.batch_size:
+                return
+            batch, self._buf = self._buf, []
+        self.exporter.export(batch)
+
+    def flush(self) -> None:
+        with self._lock:
+            batch, self._buf = self._buf, []
+        if batch:
+            self.exporter.export(batch)
+
+    def shutdown(self) -> None:
+        self.flush()
+        self.exporter.shutdown()
+
+
+class MetricsServer:
+    """指标导出 HTTP 端点。
+
+    中文说明：
+        - GET /metrics 返回 Prometheus 文本格式，GET /metrics.json 返回指标 JSON 快照，
+          GET /traces 返回最近 span 的 OTLP/JSON（可用 ?trace_id= 过滤）；
+        - port=0 时由系统分配端口，start() 后通过 url 属性获取地址。
+    """
+
+    def __init__(self, telemetry: Telemetry, host: str = "127.0.0.1", port: int = 0) -> None:
+        self.telemetry = telemetry
+        self._httpd = ThreadingHTTPServer((host, port), self._handler())
+        self._httpd.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _handler(self) -> type:
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _send(self, code: int, raw: bytes, content_type: str) -> None:
+                self.send_response(code)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(raw)))
+                self.end_headers()
+                self.wfile.write(raw)
+
+            def _json(self, body: Any, code: int = 200) -> None:
+                self._send(code, json.dumps(body, ensure_ascii=False).encode("utf-8"),
+                           "application/json")
+
+            def do_GET(self) -> None:  # noqa: N802
+                url = urlparse(self.path)
+                tel = server.telemetry
+                if url.path == "/metrics":
+                    self._send(200, prometheus_text(tel.metrics).encode("utf-8"),
+                               PROMETHEUS_CONTENT_TYPE)
+                elif url.path == "/metrics.json":
+                    self._json(tel.snapshot(spans=False))
+                elif url.path == "/traces":
+                    trace_id = (parse_qs(url.query).get("trace_id") or [None])[0]
+                    self._json(otlp_json(tel.tracer.spans(trace_id)))
+                else:
+                    self._json({"error": "not found"}, 404)
+
+            def log_message(self, fmt: str, *args: Any) -> None:
+                logger.debug("metrics: " + fmt, *args)
+
+        return Handler
+
+    def start(self) -> "MetricsServer":
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True,
+                                        name="rqw-metrics")
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self) -> "MetricsServer":
+        return self.start()
+
+    def __exit__(self, *exc: Any) -> None:
+        self.stop()
@@ -0,0 +1,112 @@
+"""Process-wide alias table registry: load once, hot-reload on file change."""
+from __future__ import annotations
+
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+from loguru import logger
+from .text_norm import AliasMatcher, load_alias_table
+
+_EMPTY = AliasMatcher({})
+
+
+@dataclass
+class _Entry:
+    """缓存条目：文件签名 + 已编译匹配器 + 最近一次检查时间。"""
+    signature: Tuple[int, int]
+    matcher: AliasMatcher
+    checked_at: float
+
+
+class AliasRegistry:
+    """别名表注册中心：按 (路径, mtime, size) 缓存编译好的 AliasMatcher。
+
+    中文说明：
+        - 热路径只做一次字典查找（间隔内）或一次 stat，不再重复读取/解析 YAML；
+        - 文件变化时由单个线程重新加载并原子替换条目，其余请求继续使用旧匹配器，不被阻塞；
+        - 加载失败保留上一次成功的版本。
+    """
+
+    def __init__(self) -> None:
+        self._entries: Dict[str, _Entry] = {}
+        self._lock = threading.Lock()
+
+    def get(self, path: Optional[str], check_interval_s: float = 1.0) -> AliasMatcher:
+        """返回路径对应的匹配器；距上次检查超过 check_interval_s 秒时校验文件签名。"""
+        if not path:
+            return _EMPTY
+        entry = self._entries.get(path)
+        now = time.monotonic()
+        if entry is not None and now - entry.checked_at < check_interval_s:
+            return entry.matcher
+
+        sig = self._signature(path)
+        if entry is not None and (sig is None or sig == entry.signature):
+            entry.checked_at = now
+            return entry.matcher
+
+        # 已有旧版本时不等待其他线程的重载，直接返回旧匹配器
+        if not self._lock.acquire(blocking=entry is None):
+            return entry.matcher  # type: ignore[union-attr]
+        try:
+            current = self._entries.get(path)
+            if current is not None and current is not entry and current.signature == sig:
+                return current.matcher
+            return self._load(path, sig, now, previous=entry)
+        finally:
+            self._lock.release()
+
+    def invalidate(self, path: Optional[str] = None) -> None:
+        """使指定路径（或全部）缓存失效，下次 get 时强制重新加载。"""
+        with self._lock:
+            if path is None:
+                self._entries = {}
+            else:
+                self._entries.pop(path, None)
+
+    def _load(self, path: str, sig: Optional[Tuple[int, int]], now: float,
+              previous: Optional[_Entry]) -> AliasMatcher:
+        if sig is None:
+            logger.warning("别名表不存在或不可读: {}", path)
+            if previous is not None:
+                return previous.matcher
+            self._entries[path] = _Entry((-1, -1), _EMPTY, now)
+            return _EMPTY
+        t0 = time.perf_counter()
+        try:
+            matcher = AliasMatcher(load_alias_table(path, strict=True))
+        except Exception as exc:  # noqa: BLE001
+            # 记录新签名：文件再次变化前不重复尝试
+            matcher = previous.matcher if previous is not None else _EMPTY
+            self._entries[path] = _Entry(sig, matcher, now)
+            logger.warning("别名表加载失败，{}: path={} err={}",
+                           "保留上一版本" if previous is not None else "使用空表", path, exc)
+            return matcher
+        self._entries[path] = _Entry(sig, matcher, now)
+        logger.info("别名表已加载: path={} size={} cost={}ms",
+                    path, len(matcher), int((time.perf_counter() - t0) * 1000))
+        return matcher
+
+    @staticmethod
+    def _signature(path: str) -> Optional[Tuple[int, int]]:
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+
+_REGISTRY = AliasRegistry()
+
+
+def get_alias_matcher(path: Optional[str], check_interval_s: float = 1.0) -> AliasMatcher:
+    """进程级别名表入口：返回缓存的已编译匹配器。"""
+    return _REGISTRY.get(path, check_interval_s=check_interval_s)
+
+
+def alias_registry() -> AliasRegistry:
+    """返回进程级注册中心（用于失效/重载）。"""
+    return _REGISTRY
@@ -0,0 +1,76 @@
+"""Thread-safe LRU cache with per-entry TTL and hit/miss counters."""
+from __future__ import annotations
+
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Generic, Hashable, Optional, Tuple, TypeVar
+import threading
+import time
+
+V = TypeVar("V")
+
+_MISSING = object()
+
+
+class TTLCache(Generic[V]):
+    """容量受限的 LRU 缓存，条目按写入时间过期。
+
+    中文说明：
+        - 超出 max_entries 时淘汰最久未访问的条目；ttl_s 为 None 时不过期；
+        - 读取时惰性清理过期条目，stats() 返回命中/未命中/淘汰/过期计数；
+        - clock 可注入（测试中模拟时间流逝）。
+    """
+
+    def __init__(self, max_entries: int = 10_000, ttl_s: Optional[float] = None,
+                 clock: Callable[[], float] = time.monotonic) -> None:
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        self._clock = clock
+        self._items: "OrderedDict[Hashable, Tuple[float, V]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "misses": 0, "evictions": 0, "expirations": 0}
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.get(key, _MISSING, count=False) is not _MISSING
+
+    def get(self, key: Hashable, default: Any = None, count: bool = True) -> Any:
+        with self._lock:
+            item = self._items.get(key)
+            if item is not None and self.ttl_s is not None \
+                    and self._clock() - item[0] > self.ttl_s:
+                del self._items[key]
+                self._counters["expirations"] += 1
+                item = None
+            if item is None:
+                if count:
+                    self._counters["misses"] += 1
+                return default
+            self._items.move_to_end(key)
+            if count:
+                self._counters["hits"] += 1
+            return item[1]
+
+    def put(self, key: Hashable, value: V) -> None:
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._items[key] = (self._clock(), value)
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_entries:
+                self._items.popitem(last=False)
+                self._counters["evictions"] += 1
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            item = self._items.pop(key, None)
+        return default if item is None else item[1]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"entries": len(self._items), **self._counters}
@@ -0,0 +1,34 @@
+"""Request deadline carried through the pipeline."""
+from __future__ import annotations
+
+from typing import Optional
+import time
+
+
+class Deadline:
+    """请求级截止时间（基于单调时钟）；budget_ms 为 None 表示不限时。"""
+
+    __slots__ = ("_expires_at",)
+
+    def __init__(self, budget_ms: Optional[float] = None) -> None:
+        self._expires_at = None if budget_ms is None else time.monotonic() + budget_ms / 1000.0
+
+    @property
+    def bounded(self) -> bool:
+        return self._expires_at is not None
+
+    def remaining_s(self) -> Optional[float]:
+        """剩余秒数（不小于 0）；不限时返回 None。"""
+        if self._expires_at is None:
+            return None
+        return max(0.0, self._expires_at - time.monotonic())
+
+    def expired(self) -> bool:
+        return self._expires_at is not None and time.monotonic() >= self._expires_at
+
+    def cap(self, timeout_s: Optional[float]) -> Optional[float]:
+        """取单次调用超时与剩余预算中的较小者。"""
+        rem = self.remaining_s()
+        if rem is None:
+            return timeout_s
+        return rem if timeout_s is None else min(rem, timeout_s)
@@ -0,0 +1,237 @@
+"""Pluggable text embedders with a shared, size-bounded LRU embedding cache."""
+from __future__ import annotations
+
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Protocol, Sequence, Tuple, runtime_checkable
+import hashlib
+import threading
+
+import numpy as np
+from loguru import logger
+
+from ..config import EmbeddingConfig
+from ..exceptions import ConfigError
+from .similarity import TfidfEmbedder
+from .tokenize import tokenize
+
+
+@runtime_checkable
+class Embedder(Protocol):
+    """文本嵌入器协议。
+
+    中文说明：
+        - embed 返回行 L2 归一化的矩阵（点积即余弦相似度），行与输入一一对应；
+        - name 标识向量空间（后端 + 关键参数），缓存以 (name, 文本哈希) 为键；
+        - 无状态嵌入器（哈希 / 本地模型）的输出可跨请求缓存；按请求拟合的 TF-IDF
+          （TfidfEmbedder）同样满足该协议，但其向量只在同一次拟合内可比，不应缓存。
+    """
+    name: str
+
+    def embed(self, texts: List[str]) -> Any:
+        ...
+
+
+class HashingEmbedder:
+    """哈希向量嵌入器：无需拟合、完全离线，输出稠密 float32 向量。
+
+    中文说明：
+        - 分词与 BM25 一致（英文词 + 中文单字/双字），经 HashingVectorizer 映射到固定维度；
+        - 维度越大碰撞越少，默认 4096 维在去重/MMR 场景足够且缓存友好。
+    """
+
+    def __init__(self, n_features: int = 4096) -> None:
+        self.n_features = n_features
+        self.name = f"hashing-{n_features}"
+        from sklearn.feature_extraction.text import HashingVectorizer
+        self._vec = HashingVectorizer(n_features=n_features, analyzer=tokenize,
+                                      alternate_sign=False, norm="l2")
+
+    @property
+    def dim(self) -> int:
+        return self.n_features
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        if not texts:
+            return np.zeros((0, self.n_features), dtype=np.float32)
+        return self.embed_sparse(texts).toarray()
+
+    def embed_sparse(self, texts: List[str]) -> Any:
+        """与 embed 相同但返回 CSR 稀疏矩阵（大批量投影/签名时避免稠密化）。"""
+        return self._vec.transform(texts).astype(np.float32)
+
+
+class LocalModelEmbedder:
+    """本地句向量模型嵌入器（sentence-transformers，可选依赖）。
+
+    中文说明：
+        - model_path 指向本地模型目录时完全离线；未安装 sentence-transformers 时抛出 ConfigError；
+        - 模型在首次 embed 时才加载，按 batch_size 批量编码。
+    """
+
+    def __init__(self, model_path: str, batch_size: int = 64,
+                 device: Optional[str] = None) -> None:
+        self.model_path = model_path
+        self.batch_size = batch_size
+        self.device = device
+        self.name = f"local:{model_path}"
+        self._model: Any = None
+        self._lock = threading.Lock()
+
+    def _load(self) -> Any:
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    try:
+                        from sentence_transformers import SentenceTransformer
+                    except ImportError as exc:
+                        raise ConfigError(
+                            "embedding backend 'local' requires sentence-transformers "
+                            "(pip install sentence-transformers)") from exc
+                    logger.info("加载本地嵌入模型: {}", self.model_path)
+                    self._model = SentenceTransformer(self.model_path, device=self.device)
+        return self._model
+
+    @property
+    def dim(self) -> int:
+        return int(self._load().get_sentence_embedding_dimension())
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        if not texts:
+            return np.zeros((0, self.dim), dtype=np.float32)
+        out = self._load().encode(list(texts), batch_size=self.batch_size,
+                                  normalize_embeddings=True, convert_to_numpy=True)
+        return np.asarray(out, dtype=np.float32)
+
+
+class EmbeddingCache:
+    """线程安全的 LRU 嵌入缓存，同时受条目数与字节数约束。"""
+
+    def __init__(self, max_entries: int = 50_000, max_bytes: int = 256 * 1024 * 1024) -> None:
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._items: "OrderedDict[Tuple[str, bytes], np.ndarray]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(space: str, text: str) -> Tuple[str, bytes]:
+        return space, hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    @property
+    def nbytes(self) -> int:
+        return self._bytes
+
+    def get_many(self, keys: Sequence[Tuple[str, bytes]]) -> List[Optional[np.ndarray]]:
+        out: List[Optional[np.ndarray]] = []
+        with self._lock:
+            for k in keys:
+                v = self._items.get(k)
+                if v is not None:
+                    self._items.move_to_end(k)
+                    self.hits += 1
+                else:
+                    self.misses += 1
+                out.append(v)
+        return out
+
+    def put_many(self, items: Sequence[Tuple[Tuple[str, bytes], np.ndarray]]) -> None:
+        with self._lock:
+            for k, v in items:
+                old = self._items.pop(k, None)
+                if old is not None:
+                    self._bytes -= old.nbytes
+                if v.nbytes > self.max_bytes:
+                    continue
+                self._items[k] = v
+                self._bytes += v.nbytes
+            while self._items and (len(self._items) > self.max_entries
+                                   or self._bytes > self.max_bytes):
+                _, old = self._items.popitem(last=False)
+                self._bytes -= old.nbytes
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"entries": len(self._items), "bytes": self._bytes,
+                    "hits": self.hits, "misses": self.misses}
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+            self._bytes = 0
+
+
+class CachedEmbedder:
+    """为嵌入器加上共享缓存与批量化：同批重复文本只编码一次，未命中部分合并为批量调用。"""
+
+    def __init__(self, embedder: Any, cache: EmbeddingCache, batch_size: int = 64) -> None:
+        self.embedder = embedder
+        self.cache = cache
+        self.batch_size = batch_size
+        self.name = embedder.name
+
+    @property
+    def dim(self) -> int:
+        return int(self.embedder.dim)
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        if not texts:
+            return np.zeros((0, self.dim), dtype=np.float32)
+        uniq = list(dict.fromkeys(texts))
+        keys = [EmbeddingCache.key(self.name, t) for t in uniq]
+        rows = self.cache.get_many(keys)
+        missing = [i for i, r in enumerate(rows) if r is None]
+        fresh: List[Tuple[Tuple[str, bytes], np.ndarray]] = []
+        for s in range(0, len(missing), self.batch_size):
+            chunk = missing[s:s + self.batch_size]
+            vecs = np.asarray(self.embedder.embed([uniq[i] for i in chunk]), dtype=np.float32)
+            for i, v in zip(chunk, vecs):
+                v = v.copy()
+                v.setflags(write=False)  # 缓存向量被多个请求共享，禁止原地修改
+                rows[i] = v
+                fresh.append((keys[i], v))
+        if fresh:
+            self.cache.put_many(fresh)
+        pos = {t: i for i, t in enumerate(uniq)}
+        return np.stack([rows[pos[t]] for t in texts])
+
+
+def build_embedder(cfg: EmbeddingConfig) -> Any:
+    """按配置构建（未缓存的）嵌入器；backend="tfidf" 返回未拟合的 TfidfEmbedder。"""
+    if cfg.backend == "hashing":
+        return HashingEmbedder(n_features=cfg.hashing_features)
+    if cfg.backend == "local":
+        if not cfg.model_path:
+            raise ConfigError("embedding backend 'local' requires embedding.model_path")
+        return LocalModelEmbedder(cfg.model_path, batch_size=cfg.batch_size, device=cfg.device)
+    return TfidfEmbedder()
+
+
+_lock = threading.Lock()
+_shared: Dict[Tuple[Any, ...], CachedEmbedder] = {}
+
+
+def get_embedder(cfg: EmbeddingConfig) -> Optional[CachedEmbedder]:
+    """进程级共享（带缓存）的嵌入器；backend="tfidf" 时返回 None（按请求拟合 TF-IDF，不缓存）。"""
+    if cfg.backend == "tfidf":
+        return None
+    key = (cfg.backend, cfg.model_path, cfg.hashing_features, cfg.device)
+    emb = _shared.get(key)
+    if emb is None:
+        with _lock:
+            emb = _shared.get(key)
+            if emb is None:
+                cache = EmbeddingCache(cfg.cache_max_entries, cfg.cache_max_mb * 1024 * 1024)
+                emb = _shared[key] = CachedEmbedder(build_embedder(cfg), cache,
+                                                    batch_size=cfg.batch_size)
+    return emb
+
+
+def unit_rows(X: Any) -> Any:
+    """稠密或稀疏矩阵的行 L2 归一化（零向量保持为零）。"""
+    from sklearn.preprocessing import normalize
+    return normalize(X, norm="l2", axis=1, copy=False)
@@ -0,0 +1,40 @@
+"""Deferred module imports for heavy optional-at-import-time dependencies (scipy, sklearn, ...)."""
+from __future__ import annotations
+
+from types import ModuleType
+from typing import Any, Optional
+import importlib
+
+
+class LazyModule:
+    """模块代理：首次访问属性时才真正导入，之后直接转发到已导入的模块。
+
+    中文说明：
+        - 用于 scipy.sparse 这类在模块内多处使用、但只有部分代码路径需要的重依赖，
+          例如 sp = lazy_module("scipy.sparse")，调用处写法不变；
+        - 导入由 importlib 加锁，并发首次访问是安全的；导入失败时在首次访问处抛出 ImportError；
+        - 仅在函数体内使用；模块顶层访问其属性会立即触发导入。
+    """
+
+    __slots__ = ("_name", "_mod")
+
+    def __init__(self, name: str) -> None:
+        self._name = name
+        self._mod: Optional[ModuleType] = None
+
+    def __getattr__(self, attr: str) -> Any:
+        mod = self._mod
+        if mod is None:
+            mod = self._mod = importlib.import_module(self._name)
+        return getattr(mod, attr)
+
+    @property
+    def loaded(self) -> bool:
+        return self._mod is not None
+
+    def __repr__(self) -> str:
+        return f"<lazy module {self._name!r}{' (loaded)' if self._mod is not None else ''}>"
+
+
+def lazy_module(name: str) -> LazyModule:
+    return LazyModule(name)
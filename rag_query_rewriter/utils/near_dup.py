@@ -0,0 +1,106 @@
+"""SimHash LSH near-duplicate filtering for large (streaming) candidate sets."""
+from __future__ import annotations
+
+from collections import defaultdict
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+import math
+
+import numpy as np
+
+from .embedding import HashingEmbedder
+
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint16)
+
+
+class SimHashDeduper:
+    """基于随机超平面 SimHash + 分段 LSH 的流式近重复过滤。
+
+    中文说明：
+        - 阈值语义与 RewriteRouterConfig.dedup_cosine_thr 相同：余弦相似度 ≥ thr 视为重复；
+          两向量夹角为 θ 时每一位签名相同的概率为 1-θ/π，故以汉明距离
+          ≤ n_bits·arccos(thr)/π 作为“估计余弦 ≥ thr”的判定；
+        - 签名切为 n_bits/band_bits 段，任一段相同即成为候选，仅对候选计算汉明距离，
+          单条查询代价与已保留规模基本无关，适合百万级改写日志的批量去重；
+          默认 256 位 / 16 位一段：余弦恰为 0.92 的对召回约 85%，余弦 ≥ 0.97 时接近 100%；
+        - 只保存签名（n_bits/8 字节/条），不保存向量；结果为近似（存在少量漏判/误判），
+          小规模精确去重请使用 similarity.greedy_keep_mask。
+    """
+
+    def __init__(self, thr: float, embedder: Optional[Any] = None, n_bits: int = 256,
+                 band_bits: int = 16, seed: int = 0, chunk_size: int = 4096) -> None:
+        if band_bits % 8 or n_bits % band_bits:
+            raise ValueError("band_bits must be a multiple of 8 and divide n_bits")
+        self.thr = thr
+        self.embedder = embedder if embedder is not None else HashingEmbedder()
+        self.n_bits = n_bits
+        self.band_bits = band_bits
+        self._band_bytes = band_bits // 8
+        self.chunk_size = chunk_size
+        self.max_hamming = n_bits * math.acos(max(-1.0, min(1.0, thr))) / math.pi
+        self._seed = seed
+        self._planes: Optional[np.ndarray] = None
+        self._sigs: List[np.ndarray] = []  # 已保留条目的打包签名
+        self._buckets: List[Dict[bytes, List[int]]] = [
+            defaultdict(list) for _ in range(n_bits // band_bits)]
+        self.seen = 0
+
+    def __len__(self) -> int:
+        return len(self._sigs)
+
+    def signatures(self, texts: List[str]) -> np.ndarray:
+        """批量计算打包后的 SimHash 签名，形状 (n, n_bits/8)，dtype=uint8。"""
+        embed = getattr(self.embedder, "embed_sparse", self.embedder.embed)
+        E = embed(texts)
+        if self._planes is None:
+            rng = np.random.default_rng(self._seed)
+            self._planes = rng.standard_normal((E.shape[1], self.n_bits)).astype(np.float32)
+        P = E @ self._planes
+        P = P.toarray() if hasattr(P, "toarray") else np.asarray(P)
+        return np.packbits(P > 0, axis=1)
+
+    def _bands(self, sig: np.ndarray) -> List[bytes]:
+        w = self._band_bytes
+        return [sig[b * w:(b + 1) * w].tobytes() for b in range(len(self._buckets))]
+
+    def _is_dup(self, sig: np.ndarray, bands: List[bytes]) -> bool:
+        cand: set = set()
+        for b, key in enumerate(bands):
+            cand.update(self._buckets[b].get(key, ()))
+        if not cand:
+            return False
+        kept = np.stack([self._sigs[j] for j in cand])
+        ham = _POPCOUNT[np.bitwise_xor(kept, sig)].sum(axis=1)
+        return bool((ham <= self.max_hamming).any())
+
+    def add_signature(self, sig: np.ndarray) -> bool:
+        """按签名判定并（若非重复）加入索引；返回是否保留。"""
+        self.seen += 1
+        bands = self._bands(sig)
+        if self._is_dup(sig, bands):
+            return False
+        j = len(self._sigs)
+        self._sigs.append(sig)
+        for b, key in enumerate(bands):
+            self._buckets[b][key].append(j)
+        return True
+
+    def iter_dedup(self, texts: Iterable[str]) -> Iterator[str]:
+        """流式去重：按 chunk_size 批量计算签名，按输入顺序产出被保留的文本。"""
+        chunk: List[str] = []
+        for t in texts:
+            if not t or not t.strip():
+                continue
+            chunk.append(t)
+            if len(chunk) >= self.chunk_size:
+                yield from self._flush(chunk)
+                chunk = []
+        if chunk:
+            yield from self._flush(chunk)
+
+    def _flush(self, chunk: List[str]) -> Iterator[str]:
+        for t, sig in zip(chunk, self.signatures(chunk)):
+            if self.add_signature(sig):
+                yield t
+
+    def dedup(self, texts: Iterable[str]) -> List[str]:
+        return list(self.iter_dedup(texts))
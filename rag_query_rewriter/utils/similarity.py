@@ -1,42 +1,176 @@
 """Similarity & embedding helpers with TF-IDF for lightweight dedup and MMR."""
 from __future__ import annotations
 
-from typing import List
+from collections import OrderedDict
+from typing import Any, Hashable, List, Optional, Sequence
+import threading
 import numpy as np
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
+
+from .lazy import lazy_module
+
+# scipy / scikit-learn 导入代价高（约 1s），推迟到首次拟合或相似度计算时
+sp = lazy_module("scipy.sparse")
 
 
 class TfidfEmbedder:
-    """基于 TF-IDF 的简易文本嵌入器。"""
+    """基于 TF-IDF 的简易文本嵌入器（拟合后满足 Embedder 协议，embed 返回稀疏矩阵）。"""
+
+    name = "tfidf"
 
     def __init__(self) -> None:
+        from sklearn.feature_extraction.text import TfidfVectorizer
         self._vec = TfidfVectorizer(ngram_range=(1, 2), min_df=1)
+        self.fitted = False
+
+    def fit(self, texts: List[str]) -> "TfidfEmbedder":
+        """仅拟合词表与 IDF（之后可反复 transform）。"""
+        if not texts:
+            raise ValueError("texts must be non-empty")
+        self._vec.fit(texts)
+        self.fitted = True
+        return self
 
     def fit_transform(self, texts: List[str]) -> np.ndarray:
         if not texts:
             raise ValueError("texts must be non-empty")
-        return self._vec.fit_transform(texts).astype(np.float32)
+        out = self._vec.fit_transform(texts).astype(np.float32)
+        self.fitted = True
+        return out
 
     def transform(self, texts: List[str]) -> np.ndarray:
         return self._vec.transform(texts).astype(np.float32)
 
+    def embed(self, texts: List[str]) -> Any:
+        if not self.fitted:
+            raise ValueError("TfidfEmbedder must be fitted before embed")
+        return self.transform(texts)
+
+    @property
+    def dim(self) -> int:
+        return len(self._vec.vocabulary_)
+
+
+class DocVectorCache:
+    """文档向量 LRU 缓存（绑定一个已拟合的 embedder）。
+
+    中文说明：
+        - 以 doc_id 等稳定键缓存 L2 归一化后的稀疏行向量，跨请求/批内复用；
+        - 未命中的文档合并为一次 transform 调用；
+        - 仅在词表固定（embedder 不再重新拟合）时有效，更换 embedder 需新建缓存。
+    """
+
+    def __init__(self, embedder: TfidfEmbedder, capacity: int = 100_000) -> None:
+        if not embedder.fitted:
+            raise ValueError("embedder must be fitted before caching doc vectors")
+        self.embedder = embedder
+        self.capacity = capacity
+        self._rows: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def matrix(self, keys: Sequence[Hashable], texts: Sequence[str]) -> sp.csr_matrix:
+        """按 keys 顺序返回文档向量矩阵（行与 texts 对齐）。"""
+        rows: List[Any] = [None] * len(keys)  # 每行缓存为 (indices, data)
+        missing: List[int] = []
+        with self._lock:
+            for i, k in enumerate(keys):
+                row = self._rows.get(k)
+                if row is None:
+                    missing.append(i)
+                else:
+                    self._rows.move_to_end(k)
+                    rows[i] = row
+            self.hits += len(keys) - len(missing)
+            self.misses += len(missing)
+        if missing:
+            X = self.embedder.transform([texts[i] for i in missing]).tocsr()
+            with self._lock:
+                for j, i in enumerate(missing):
+                    s, e = X.indptr[j], X.indptr[j + 1]
+                    rows[i] = (X.indices[s:e].copy(), X.data[s:e].copy())
+                    self._rows[keys[i]] = rows[i]
+                while len(self._rows) > self.capacity:
+                    self._rows.popitem(last=False)
+        if not rows:
+            return sp.csr_matrix((0, self.embedder.dim), dtype=np.float32)
+        # 直接拼接 CSR 三元组，避免逐行 vstack 的开销
+        indptr = np.zeros(len(rows) + 1, dtype=np.int64)
+        np.cumsum([len(r[0]) for r in rows], out=indptr[1:])
+        indices = np.concatenate([r[0] for r in rows])
+        data = np.concatenate([r[1] for r in rows]).astype(np.float32, copy=False)
+        return sp.csr_matrix((data, indices, indptr), shape=(len(rows), self.embedder.dim))
+
+
+def greedy_keep_mask(emb: Any, thr: float, block: int = 2048) -> np.ndarray:
+    """贪心近重复过滤：按顺序保留与已保留集合最大余弦相似度 < thr 的行。
+
+    中文说明：
+        - 行先做 L2 归一化，相似度即点积；每保留一行，用数组运算把与其相似度 ≥ thr 的
+          后续行整体标记为已压制，循环次数等于保留数而非候选数；
+        - 候选按 block 分块：块内一次计算块×块相似度矩阵，块间只与此前保留的行比较，
+          内存为 O(block²) 而非 O(n²)；结果与逐条比较的朴素实现一致。
+    """
+    from sklearn.preprocessing import normalize
+    X = normalize(emb, norm="l2", axis=1, copy=True)
+    n = X.shape[0]
+    keep = np.zeros(n, dtype=bool)
+    kept_rows: List[Any] = []
+    for s in range(0, n, block):
+        B = X[s:s + block]
+        m = B.shape[0]
+        suppressed = np.zeros(m, dtype=bool)
+        for K in kept_rows:  # 与此前各块已保留的行比较
+            sims = _dense(B @ K.T)
+            suppressed |= (sims >= thr).any(axis=1)
+        S = _dense(B @ B.T)
+        i = 0
+        while i < m:
+            if suppressed[i]:
+                nxt = np.flatnonzero(~suppressed[i:])
+                if nxt.size == 0:
+                    break
+                i += int(nxt[0])
+            keep[s + i] = True
+            suppressed |= S[i] >= thr
+            i += 1
+        if keep[s:s + m].any():
+            kept_rows.append(B[np.flatnonzero(keep[s:s + m])])
+    return keep
+
+
+def _dense(M: Any) -> np.ndarray:
+    return M.toarray() if sp.issparse(M) else np.asarray(M)
+
+
+def dedup_texts_by_cosine(texts: List[str], thr: float, embedder: Optional[Any] = None,
+                          method: str = "matrix") -> List[str]:
+    """按余弦相似度阈值去重，保留多样性。
 
-def dedup_texts_by_cosine(texts: List[str], thr: float) -> List[str]:
-    """按余弦相似度阈值去重，保留多样性。"""
+    中文说明：
+        - 传入 embedder（已拟合的 TfidfEmbedder 或 utils.embedding 中的嵌入器）时只调用其
+          embed，不再重新拟合（批量场景共享一次拟合，共享嵌入器可命中跨请求缓存）；
+        - method="matrix"（默认）为精确的向量化贪心过滤（greedy_keep_mask）；
+          method="simhash" 使用 SimHash LSH 近似（见 utils.near_dup），适合大规模候选，
+          阈值语义相同（余弦相似度 ≥ thr 视为重复）。
+    """
     if not texts:
         return []
     # 去除空白候选
     texts = [t for t in texts if t and t.strip()]
     if not texts:
         return []
-    emb = TfidfEmbedder().fit_transform(texts)
-    keep: List[int] = []
-    for i in range(len(texts)):
-        if not keep:
-            keep.append(i)
-            continue
-        sims = cosine_similarity(emb[i], emb[keep]).ravel()
-        if (sims.max(initial=0.0) if sims.size else 0.0) < thr:
-            keep.append(i)
-    return [texts[i] for i in keep]
+    if method == "simhash":
+        from .near_dup import SimHashDeduper
+        return SimHashDeduper(thr, embedder=embedder).dedup(texts)
+    if method != "matrix":
+        raise ValueError(f"unknown dedup method: {method}")
+    if embedder is not None:
+        emb = embedder.embed(texts)
+    else:
+        emb = TfidfEmbedder().fit_transform(texts)
+    keep = greedy_keep_mask(emb, thr)
+    return [t for t, k in zip(texts, keep) if k]
@@ -1,9 +1,9 @@
 """Text normalization utilities: case, punctuation, alias mapping, date unification."""
 from __future__ import annotations
 
+import string
 import regex as re
-import yaml
-from typing import Dict, Optional
+from typing import Any, Dict, List, Optional, Union
 from loguru import logger
 from .time_utils import to_absolute_date
 
@@ -11,40 +11,115 @@ from .time_utils import to_absolute_date
 _PUNCT_RE = re.compile(r"[^\p{L}\p{N}\s:/\-_.·，。；、：%（）()【】\[\]-]")
 
 # 中英混合“词边界”：
-# - 英文用\b，中文用环绕断言（非字母数字或边界）
-def _replace_alias_safe(text: str, alias: Dict[str, str]) -> str:
-    for k, v in alias.items():
-        # 同时支持纯英文别名与中文别名安全替换
-        # 英文：\b ；中文：(?<![0-9A-Za-z]) / (?![0-9A-Za-z])
-        pattern = (
-            rf"(?:(?<![0-9A-Za-z])){re.escape(k)}(?![0-9A-Za-z])"
-            if re.search(r"[^\p{Han}]", k) else rf"{re.escape(k)}"
-        )
-        text = re.sub(pattern, v, text, flags=re.IGNORECASE)
-    return text
-
-
-def load_alias_table(path: Optional[str]) -> Dict[str, str]:
-    """加载术语/别名映射表（YAML）。"""
+# - 含非汉字字符的别名要求两侧不是 ASCII 字母数字；纯中文别名不设边界
+_NON_HAN_RE = re.compile(r"[^\p{Han}]")
+_ASCII_ALNUM = frozenset(string.ascii_letters + string.digits)
+_TERM = ""  # 字典树终止标记（单字符边不可能为空串）
+
+
+class AliasMatcher:
+    """编译后的别名匹配器：别名表构建一次字典树，替换时单次左到右扫描。
+
+    中文说明：
+        - 大小写不敏感；边界语义与逐条正则替换一致（英文/混合别名要求 ASCII 边界）；
+        - 重叠时取最左最长匹配，替换结果不会被再次匹配（不做链式替换）；
+        - 扫描代价只与文本长度和最长别名有关，与别名表规模无关。
+    """
+
+    __slots__ = ("_root", "size")
+
+    def __init__(self, alias: Dict[str, str]) -> None:
+        self._root: Dict[str, Any] = {}
+        self.size = 0
+        for k, v in alias.items():
+            key = str(k)
+            if not key:
+                continue
+            node = self._root
+            for ch in key:
+                node = node.setdefault(ch.lower(), {})
+            # 折叠后相同的别名保留先出现者（与逐条替换的先后顺序一致）
+            if _TERM not in node:
+                node[_TERM] = (str(v), bool(_NON_HAN_RE.search(key)))
+                self.size += 1
+
+    def __len__(self) -> int:
+        return self.size
+
+    def replace(self, text: str) -> str:
+        """对文本执行一次别名替换。"""
+        root = self._root
+        if not text or not root:
+            return text
+        n = len(text)
+        out: List[str] = []
+        i = last = 0
+        while i < n:
+            node = root.get(text[i].lower())
+            if node is None:
+                i += 1
+                continue
+            best = None
+            j = i + 1
+            while True:
+                term = node.get(_TERM)
+                if term is not None and (not term[1] or self._bounded(text, i, j)):
+                    best = (j, term[0])
+                if j >= n:
+                    break
+                node = node.get(text[j].lower())
+                if node is None:
+                    break
+                j += 1
+            if best is None:
+                i += 1
+                continue
+            out.append(text[last:i])
+            out.append(best[1])
+            i = last = best[0]
+        if not out:
+            return text
+        out.append(text[last:])
+        return "".join(out)
+
+    @staticmethod
+    def _bounded(text: str, start: int, end: int) -> bool:
+        return ((start == 0 or text[start - 1] not in _ASCII_ALNUM)
+                and (end == len(text) or text[end] not in _ASCII_ALNUM))
+
+
+def load_alias_table(path: Optional[str], strict: bool = False) -> Dict[str, str]:
+    """加载术语/别名映射表（YAML）。
+
+    strict=False 时读取 / 解析失败记录告警并返回空表；strict=True 时抛出异常
+    （OSError、YAML 解析错误，或顶层不是映射时的 ValueError），供需要保留旧版本的调用方使用。
+    """
     if not path:
         return {}
     try:
+        import yaml  # 仅加载别名表时需要
         with open(path, "r", encoding="utf-8") as f:
             data = yaml.safe_load(f) or {}
+        if not isinstance(data, dict):
+            raise ValueError(f"alias table must be a mapping, got {type(data).__name__}")
         # 统一小写键
         return {str(k).lower(): str(v) for k, v in data.items()}
     except Exception as exc:  # noqa: BLE001
+        if strict:
+            raise
         logger.warning("未能加载别名表: {}", exc)
         return {}
 
 
-def normalize_text(text: str, alias_table: Optional[Dict[str, str]] = None,
+def normalize_text(text: str,
+                   alias_table: Optional[Union[Dict[str, str], AliasMatcher]] = None,
                    case_fold: bool = True, punct_trim: bool = True,
                    date_normalize: bool = True) -> str:
     """执行轻量规范化：大小写、标点清理、日期归一、术语替换。
 
     中文说明：
-        - 不改变语义，不创造实体；专注“检索友好”。
+        - 不改变语义，不创造实体；专注“检索友好”；
+        - alias_table 可传入预编译的 AliasMatcher，避免每次调用重建匹配器。
     """
     if not text:
         return text
@@ -57,7 +132,8 @@ def normalize_text(text: str, alias_table: Optional[Dict[str, str]] = None,
         s = to_absolute_date(s)
 
     if alias_table:
-        s = _replace_alias_safe(s, alias_table)
+        matcher = alias_table if isinstance(alias_table, AliasMatcher) else AliasMatcher(alias_table)
+        s = matcher.replace(s)
 
     if punct_trim:
         s = _PUNCT_RE.sub(" ", s)
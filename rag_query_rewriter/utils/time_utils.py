@@ -2,10 +2,17 @@
 from __future__ import annotations
 
 import regex as re
-import dateparser
+
+_RELATIVE_RE = re.compile(
+    r"\b(yesterday|today|tomorrow|last\s+week|last\s+month|"
+    r"\d+\s+(days?|weeks?|months?)\s+ago|"
+    r"上周|上个月|昨天|明天|今天)\b",
+    re.IGNORECASE,
+)
 
 
 def _replace_relative(match: re.Match) -> str:
+    import dateparser  # 导入约 0.3s，仅在出现相对日期时才需要
     text = match.group(0)
     dt = dateparser.parse(text)
     return dt.strftime("%Y-%m-%d") if dt else text
@@ -13,10 +20,4 @@ def _replace_relative(match: re.Match) -> str:
 
 def to_absolute_date(s: str) -> str:
     """归一化字符串中的相对日期表达。"""
-    pattern = re.compile(
-        r"\b(yesterday|today|tomorrow|last\s+week|last\s+month|"
-        r"\d+\s+(days?|weeks?|months?)\s+ago|"
-        r"上周|上个月|昨天|明天|今天)\b",
-        re.IGNORECASE,
-    )
-    return pattern.sub(_replace_relative, s)
+    return _RELATIVE_RE.sub(_replace_relative, s)
@@ -0,0 +1,26 @@
+"""CJK-aware tokenization shared by the local retrievers and PRF."""
+from __future__ import annotations
+
+from typing import List
+import regex as re
+
+# 汉字串单独成段；其余为字母/数字/下划线组成的词（不含汉字）
+_SEG_RE = re.compile(r"(\p{Han}+)|((?:(?!\p{Han})[\p{L}\p{N}_])+)")
+
+
+def tokenize(text: str, han_bigrams: bool = True) -> List[str]:
+    """中英混合分词：英文/数字按词切分并小写；汉字串切为单字 + 相邻双字。
+
+    中文说明：
+        - 不依赖外部分词器，索引与查询两侧使用同一规则即可保证匹配一致；
+        - 双字（bigram）提升中文短语的区分度，单字保证召回。
+    """
+    toks: List[str] = []
+    for han, word in _SEG_RE.findall(text):
+        if word:
+            toks.append(word.lower())
+            continue
+        toks.extend(han)
+        if han_bigrams and len(han) > 1:
+            toks.extend(han[i:i + 2] for i in range(len(han) - 1))
+    return toks
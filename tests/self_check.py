@@ -1,11 +1,81 @@
 """Self-check to verify pipeline logic, boundaries, and concurrency."""
 from __future__ import annotations
 
+import asyncio
+import dataclasses
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+
+import numpy as np
+
 from rag_query_rewriter.logging_setup import setup_logging
 from rag_query_rewriter.config import AppConfig
 from rag_query_rewriter.llm.dummy import DummyLLM
+from rag_query_rewriter.retrievers.base import Retriever, supports_search_many
 from rag_query_rewriter.retrievers.mock import MockRetriever
+from rag_query_rewriter.retrievers.bm25 import BM25Builder, BM25Retriever
+from rag_query_rewriter.retrievers.mmap_index import MmapBM25Retriever, write_index
 from rag_query_rewriter.pipeline.orchestrator import rewrite_and_retrieve
+from rag_query_rewriter.pipeline.batch import rewrite_and_retrieve_many
+from rag_query_rewriter.pipeline.response_cache import ResponseCache, get_response_cache
+from rag_query_rewriter.pipeline.async_orchestrator import arewrite_and_retrieve
+from rag_query_rewriter.llm.dummy import AsyncDummyLLM
+from rag_query_rewriter.pipeline.executor import (
+    RetrievalExecutor, backend_name, latency_tracker, set_retrieval_executor,
+)
+from rag_query_rewriter.exceptions import ConfigError, RetrievalOverloadError
+from rag_query_rewriter.retrievers.mock import AsyncMockRetriever
+from rag_query_rewriter.utils.text_norm import AliasMatcher
+from rag_query_rewriter.utils.alias_registry import AliasRegistry
+from rag_query_rewriter.utils.similarity import DocVectorCache, TfidfEmbedder
+from rag_query_rewriter.fusion.fuser import FusionAccumulator, fuse_pools, mmr_select, rrf_fuse
+from rag_query_rewriter.retrievers.base import SearchResult
+from rag_query_rewriter.utils.embedding import CachedEmbedder, EmbeddingCache, HashingEmbedder
+from rag_query_rewriter.retrievers.dense import DenseRetriever, VectorQueryRetriever
+from rag_query_rewriter.utils.near_dup import SimHashDeduper
+from rag_query_rewriter.utils.similarity import dedup_texts_by_cosine, greedy_keep_mask
+from rag_query_rewriter.utils.cache import TTLCache
+from rag_query_rewriter.llm.caching import AsyncCachingLLMClient, CachingLLMClient, LLMCacheStore
+from rag_query_rewriter.llm.http import HTTPLLMClient
+from rag_query_rewriter.llm.stub_server import StubLLMServer
+from rag_query_rewriter.rewrite.combined import parse_combined
+from rag_query_rewriter.rewrite.adaptive import (
+    AdaptiveRouter, StrategyClassifier, StrategyStats, get_adaptive_router, query_type,
+)
+from rag_query_rewriter.rewrite.router import StrategyPlan
+from rag_query_rewriter.config import AdaptiveRouterConfig
+from rag_query_rewriter.rewrite.prf import DocTermStats, rm3_terms
+from rag_query_rewriter.retrievers.ann import IVFRetriever, write_ivf_index
+from rag_query_rewriter.retrievers.hybrid import HybridRetriever
+from rag_query_rewriter.bench.workload import branch_coverage, generate_corpus, generate_queries
+from rag_query_rewriter.bench.stubs import LatencyLLM, LatencyModel, LatencyRetriever
+from rag_query_rewriter.bench.load import run_closed_loop, run_open_loop
+from rag_query_rewriter.bench.report import compare_to_baseline, summarize
+from rag_query_rewriter.telemetry.core import NOOP_SPAN, get_telemetry, set_telemetry
+from rag_query_rewriter.telemetry.export import MetricsServer, otlp_json, prometheus_text
+from rag_query_rewriter.serving.service import RewriteService, ServiceOptions
+from rag_query_rewriter.serving.http import ServingHTTPServer
+from rag_query_rewriter.rewrite.fast import normalize_and_cqr
+from rag_query_rewriter.utils.lazy import lazy_module
+
+
+def _http(url: str, body: object = None) -> tuple:
+    """GET（body 为 None）或 POST JSON，返回 (状态码, 解析后的响应体)。"""
+    data = json.dumps(body, ensure_ascii=False).encode("utf-8") if body is not None else None
+    try:
+        with urlopen(Request(url, data=data), timeout=30) as resp:
+            return resp.status, json.loads(resp.read().decode("utf-8"))
+    except HTTPError as exc:
+        return exc.code, json.loads(exc.read().decode("utf-8"))
 
 
 def _assert(cond: bool, msg: str) -> None:
@@ -13,6 +83,57 @@ def _assert(cond: bool, msg: str) -> None:
         raise AssertionError(msg)
 
 
+class _SlowLLM(DummyLLM):
+    """每次调用固定延迟的 DummyLLM，用于验证分支并发。"""
+
+    def __init__(self, delay_s: float) -> None:
+        self.delay_s = delay_s
+
+    def generate(self, prompt: str, max_tokens: int = 256) -> str:
+        time.sleep(self.delay_s)
+        return super().generate(prompt, max_tokens)
+
+    def generate_lines(self, prompt: str, n_lines: int = 6, max_tokens: int = 512):
+        time.sleep(self.delay_s)
+        return super().generate_lines(prompt, n_lines, max_tokens)
+
+    def generate_json(self, prompt: str, schema_hint=None, max_tokens: int = 512):
+        time.sleep(self.delay_s)
+        return super().generate_json(prompt, schema_hint, max_tokens)
+
+
+class _RecordingRetriever(Retriever):
+    """记录每次检索收到的 filters，再转发给内部检索器。"""
+
+    def __init__(self, inner: Retriever) -> None:
+        self.inner = inner
+        self.filters: list = []
+
+    def search(self, query, topk=10, filters=None):
+        self.filters.append(filters)
+        return self.inner.search(query, topk, filters)
+
+
+class _FlakyRetriever(MockRetriever):
+    """对指定查询的首次调用很慢（模拟长尾分片），其余调用正常。"""
+
+    name = "flaky"
+    search_many = Retriever.search_many  # 逐条检索，便于模拟单条长尾
+
+    def __init__(self, slow_query: str, delay_s: float) -> None:
+        super().__init__()
+        self.slow_query, self.delay_s, self._seen = slow_query, delay_s, set()
+        self._lock = threading.Lock()
+
+    def search(self, query, topk=10, filters=None):
+        with self._lock:
+            first = query not in self._seen
+            self._seen.add(query)
+        if query == self.slow_query and first:
+            time.sleep(self.delay_s)
+        return super().search(query, topk, filters)
+
+
 def run_checks() -> None:
     """运行关键自检：覆盖常见路径与边界。"""
     setup_logging("INFO")
@@ -37,13 +158,721 @@ def run_checks() -> None:
     _assert(out3["strategy"]["use_prf"] is True, "PRF 未触发")
 
     # 4) Self-Query filters 生效（限制年份）
-    out4 = rewrite_and_retrieve("2023 年的发布记录", "", cfg, llm, ret)
+    rec = _RecordingRetriever(ret)
+    out4 = rewrite_and_retrieve("2023 年的发布记录", "", cfg, llm, rec)
     # Dummy LLM 的 must_filters: {"year": ["2023","2024"]}，因此 d1/d2 均可；仅检查不为空
     _assert(out4["fused_docs"], "Self-Query 过滤后为空（mock）")
+    _assert(out4["strategy"]["use_self_query"] and out4["self_query_filters"], "Self-Query 未触发")
+    _assert(rec.filters and all(f == out4["self_query_filters"] for f in rec.filters),
+            "检索未收到 Self-Query filters")
 
     # 5) 并行检索计时指标
     _assert(out4["metrics"]["retrieval_ms"] >= 0, "计时指标异常")
 
+    # 6) 别名匹配器：英文边界、中文无边界、大小写不敏感、最左最长
+    am = AliasMatcher({"llm": "Large Language Model", "llm ops": "LLMOps", "大模型": "LLM"})
+    _assert(am.replace("LLM 与 llmx") == "Large Language Model 与 llmx", "英文别名边界异常")
+    _assert(am.replace("llm ops 平台") == "LLMOps 平台", "最长匹配异常")
+    _assert(am.replace("国产大模型发布") == "国产LLM发布", "中文别名替换异常")
+
+    # 7) 别名表注册中心：命中缓存、文件变更后热更新
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "alias.yaml")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("llm: Large Language Model\n")
+        reg = AliasRegistry()
+        m1 = reg.get(path, check_interval_s=0.0)
+        _assert(reg.get(path, check_interval_s=0.0) is m1, "别名表未命中缓存")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("llm: LLM\nqa: Question Answering\n")
+        os.utime(path, ns=(0, os.stat(path).st_mtime_ns + 1_000_000))
+        m2 = reg.get(path, check_interval_s=0.0)
+        _assert(m2 is not m1 and len(m2) == 2, "别名表未热更新")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("发布日: [unclosed\n")
+        os.utime(path, ns=(0, os.stat(path).st_mtime_ns + 2_000_000))
+        m3 = reg.get(path, check_interval_s=0.0)
+        _assert(m3 is m2 and m3.replace("qa") == "Question Answering", "YAML 损坏时应保留上一版本")
+
+    # 8) 批量接口：按输入顺序返回、跨查询检索去重
+    batch_in = [("它什么时候发布？", "上文实体=GPT-5"), ("2023 版与 2024 版有何差异？", ""),
+                ("它什么时候发布？", "上文实体=GPT-5")]
+    outs = rewrite_and_retrieve_many(batch_in, cfg, llm, ret, batch_size=3)
+    _assert([o["cqr"] for o in outs] == [out1["cqr"], out2["cqr"], out1["cqr"]], "批量结果顺序异常")
+    _assert(all(o["final_docs"] for o in outs), "批量终选为空")
+    total = sum(o["metrics"]["num_candidates"] for o in outs)
+    _assert(outs[0]["metrics"]["batch_unique_retrievals"] < total, "批内检索未去重")
+
+    # 9) 异步管线：与同步版本结果一致，LLM 调用并发重叠
+    async def _many():
+        allm, aret = AsyncDummyLLM(latency_s=0.05), AsyncMockRetriever(latency_s=0.01)
+        return await asyncio.gather(*(arewrite_and_retrieve(q, c, cfg, allm, aret)
+                                      for q, c in batch_in))
+    aouts = asyncio.run(_many())
+    _assert(aouts[0]["candidates"] == out1["candidates"], "异步候选与同步不一致")
+    _assert(aouts[1]["final_docs"] == out2["final_docs"], "异步终选与同步不一致")
+    _assert(aouts[0]["metrics"]["rewrite_ms"] < 3 * 50, "异步 LLM 调用未并发")
+    #    与同步版本共用分层缓存与超时：第二次命中响应层；检索超时的池计入 retrieval_missed 且不写入响应层
+    cfg_ac = AppConfig(cache={"enabled": True}, timeouts={"search_timeout_ms": 20})
+    allm, afast = AsyncDummyLLM(), AsyncMockRetriever()
+    a1, a2 = (asyncio.run(arewrite_and_retrieve("2024 版本更新", "", cfg_ac, allm, afast))
+              for _ in range(2))
+    _assert(a1["metrics"]["cache"] == {"response": "miss", "rewrite": "miss"}
+            and a1["metrics"]["retrieval_missed"] == 0
+            and {"normalize", "cqr", "route", "rewrite", "retrieve", "mmr"}
+            <= set(a1["metrics"]["stage_ms"]), "异步管线缓存 / 分阶段耗时异常")
+    _assert(a2["metrics"]["cache"] == {"response": "hit"}
+            and a2["final_docs"] == a1["final_docs"], "异步响应缓存未命中")
+    aslow = AsyncMockRetriever(latency_s=0.2)
+    a3, a4 = (asyncio.run(arewrite_and_retrieve("2024 版本更新", "", cfg_ac, allm, aslow))
+              for _ in range(2))
+    _assert(a3["metrics"]["retrieval_missed"] == a3["metrics"]["num_candidates"] > 0
+            and a4["metrics"]["cache"] == {"response": "miss", "rewrite": "hit"},
+            "异步检索超时未按部分结果处理")
+
+    # 10) 阶段 DAG：LLM 分支并发，关键路径≈最慢分支
+    out5 = rewrite_and_retrieve("它什么时候发布？", "上文实体=GPT-5", cfg, _SlowLLM(0.1), ret)
+    _assert(out5["candidates"] == out1["candidates"], "DAG 候选顺序异常")
+    _assert({"multiquery", "hyde", "retrieve:cqr", "mmr"} <= set(out5["metrics"]["stage_ms"]),
+            "阶段耗时缺失")
+    _assert(out5["metrics"]["elapsed_ms"] < 190, "LLM 分支未并发执行")
+
+    # 11) 共享检索执行器：单后端隔离舱 + 背压（丢弃/拒绝）
+    gate = threading.Event()
+    ex = RetrievalExecutor(max_workers=2, max_queue=0, per_backend_limit=1)
+    f1 = ex.submit("slow", gate.wait, 5)
+    _assert(ex.submit("slow", gate.wait, 5) is None, "隔离舱未生效")
+    f2 = ex.submit("fast", gate.wait, 5)
+    _assert(ex.submit("other", gate.wait, 5) is None, "全局并发上限未生效")
+    ex.overload_policy = "reject"
+    try:
+        ex.submit("other", gate.wait, 5)
+        _assert(False, "reject 策略未抛出异常")
+    except RetrievalOverloadError:
+        pass
+    gate.set()
+    f1.result()
+    f2.result()
+    st = ex.stats()
+    _assert(st["shed"] == 2 and st["rejected"] == 1 and st["in_flight"] == 0, "执行器计数异常")
+    ex.shutdown()
+
+    # 12) 截止时间 / 单次超时 / 对冲：慢分片不再拖住整个请求
+    tcfg = AppConfig()
+    tcfg.router.enable_multiquery = tcfg.router.enable_hyde = False
+    tcfg.timeouts.search_timeout_ms = 50
+    slow = _FlakyRetriever("发布记录", delay_s=0.3)
+    t_start = time.perf_counter()
+    out6 = rewrite_and_retrieve("发布记录", "", tcfg, llm, slow)
+    _assert(time.perf_counter() - t_start < 0.25, "单次检索超时未生效")
+    _assert(out6["metrics"]["retrieval_missed"] == 1, "超时检索未计入 missed")
+    tcfg.timeouts.search_timeout_ms = None
+    tcfg.timeouts.hedge_enabled, tcfg.timeouts.hedge_min_samples = True, 1
+    slow2 = _FlakyRetriever("版本说明", delay_s=0.3)
+    latency_tracker("flaky").record(0.01)  # 预置耗时样本，使对冲延迟≈10ms
+    out7 = rewrite_and_retrieve("版本说明", "", tcfg, llm, slow2)
+    _assert(out7["metrics"]["retrieval_hedged"] >= 1 and out7["metrics"]["elapsed_ms"] < 250
+            and out7["fused_docs"],
+            "对冲请求未生效")
+    #     放弃等待（超时 / 对冲落败）且仍在排队的检索被撤回，不再占用隔离舱名额
+    ex1 = RetrievalExecutor(max_workers=1, max_queue=8)
+    set_retrieval_executor(ex1)
+    try:
+        hold = threading.Event()
+        busy = ex1.submit("other", hold.wait, 5)
+        tcfg.timeouts.hedge_enabled, tcfg.timeouts.search_timeout_ms = False, 30
+        out7b = rewrite_and_retrieve("发布记录", "", tcfg, llm, MockRetriever())
+        _assert(out7b["metrics"]["retrieval_missed"] >= 1
+                and ex1.stats()["per_backend"] == {"other": 1}, "超时检索未撤回，仍占用隔离舱")
+        hold.set()
+        busy.result()
+    finally:
+        set_retrieval_executor(None)
+
+    # 13) 批量检索接口：原生 search_many 与逐条 search 结果一致，管线走批量路径
+    qs = ["2023 发布", "版本 对比", "FAQ", ""]
+    _assert(ret.search_many(qs, 3) == [ret.search(x, 3) for x in qs], "search_many 结果不一致")
+    _assert(supports_search_many(ret) and not supports_search_many(slow), "search_many 探测异常")
+
+    # 14) BM25 倒排检索：中英混合分词、must/not 位图过滤、JSONL 加载、接入管线
+    with tempfile.TemporaryDirectory() as tmp:
+        corpus = os.path.join(tmp, "corpus.jsonl")
+        with open(corpus, "w", encoding="utf-8") as f:
+            for doc_id, obj in ret._docs.items():
+                f.write(json.dumps({"id": doc_id, **obj}, ensure_ascii=False) + "\n")
+        bm25 = BM25Retriever.from_jsonl(corpus)
+        # 15) mmap 持久化索引：落盘后重新打开，检索与过滤结果与内存索引一致
+        write_index(bm25._a, os.path.join(tmp, "idx"))
+        mm = MmapBM25Retriever(os.path.join(tmp, "idx"))
+        for x in ["2024 版本更新", "版本", "FAQ", "不存在的词", ""]:
+            for flt in (None, {"must_filters": {"year": ["2023"]}, "not_filters": {"type": ["faq"]}}):
+                _assert(mm.search(x, 5, flt) == bm25.search(x, 5, flt), "mmap 索引结果不一致")
+        _assert(mm.idf("版本") == bm25.idf("版本") and mm.num_docs == bm25.num_docs,
+                "mmap 索引统计不一致")
+        #     重写索引经同级临时目录原子换入：中途失败时旧索引保持完整，且不留临时目录
+        other = BM25Builder()
+        other.add("x1", "另一份 语料", {})
+        broken = dataclasses.replace(other.build(), texts=None)
+        try:
+            write_index(broken, os.path.join(tmp, "idx"))
+        except TypeError:
+            pass
+        else:
+            _assert(False, "写入残缺索引未报错")
+        _assert(MmapBM25Retriever(os.path.join(tmp, "idx")).search("版本", 5) == bm25.search("版本", 5),
+                "写入失败破坏了旧索引")
+        write_index(bm25._a, os.path.join(tmp, "idx"))
+        _assert(sorted(os.listdir(tmp)) == ["corpus.jsonl", "idx"], "索引换入后残留临时目录")
+        _assert(MmapBM25Retriever(os.path.join(tmp, "idx")).num_docs == bm25.num_docs, "重写索引异常")
+        try:
+            write_index(bm25._a, tmp)
+        except ConfigError:
+            pass
+        else:
+            _assert(False, "覆盖了非索引目录")
+        del mm
+    hits = bm25.search("2024 版本更新")
+    _assert(hits and hits[0].doc_id == "d2", "BM25 排序异常")
+    hits = bm25.search("版本", filters={"must_filters": {"year": ["2023"]},
+                                        "not_filters": {"type": ["faq"]}})
+    _assert([h.doc_id for h in hits] == ["d1"], "BM25 过滤异常")
+    out8 = rewrite_and_retrieve("2023 版与 2024 版有何差异？", "", cfg, llm, bm25)
+    _assert(out8["final_docs"], "BM25 接入管线结果为空")
+
+    # 16) 增量 MMR：近重复文档被压后，复用词表/文档向量缓存时结果不变且命中缓存
+    docs = ["gpt 发布 时间 2024", "gpt 发布 时间 2024", "gpt 技术 规格 参数", "faq 常见 问题"]
+    _assert(mmr_select("gpt 发布 时间", docs, topk=2, lamb=0.5) == [0, 2], "MMR 未去冗")
+    cache = DocVectorCache(TfidfEmbedder().fit(["gpt 发布 时间"] + docs))
+    keys = ["a", "a", "b", "c"]
+    picks = [mmr_select("gpt 发布 时间", docs, 3, 0.5, embedder=cache.embedder,
+                        doc_vectors=cache.matrix(keys, docs)) for _ in range(2)]
+    _assert(picks[0] == picks[1] == mmr_select("gpt 发布 时间", docs, 3, 0.5,
+                                               embedder=cache.embedder), "MMR 向量缓存结果不一致")
+    _assert(len(cache) == 3 and cache.hits >= 4, "文档向量缓存未命中")
+
+    # 17) 嵌入后端：缓存命中与容量约束、稠密检索过滤、HyDE 走向量路径
+    small = EmbeddingCache(max_entries=2)
+    cemb = CachedEmbedder(HashingEmbedder(256), small)
+    v = cemb.embed(["版本 发布", "版本 发布", "FAQ"])
+    _assert(v.shape == (3, 256) and small.misses == 2 and (v[0] == v[1]).all(), "嵌入批内去重异常")
+    cemb.embed(["版本 发布", "规格"])
+    _assert(small.hits == 1 and len(small) == 2, "嵌入缓存 LRU 异常")
+    dense = DenseRetriever.from_docs([{"id": k, **o} for k, o in ret._docs.items()],
+                                     HashingEmbedder())
+    hits = dense.search("版本 更新", filters={"must_filters": {"year": ["2024"]}})
+    _assert(hits and {h.doc_id for h in hits} <= {"d2", "d5"}, "稠密检索过滤异常")
+    dense.search_many = lambda qs, topk=10, filters=None: [[] for _ in qs]  # 屏蔽文本检索路径
+    cfg_e = cfg.model_copy(deep=True)
+    cfg_e.embedding.backend = "hashing"
+    out9 = rewrite_and_retrieve("GPT-5 发布时间", "", cfg_e, llm, dense)
+    _assert(out9["strategy"]["use_hyde"] and out9["final_docs"], "HyDE 向量检索路径未生效")
+
+    # 18) 近重复过滤：向量化贪心与分块结果一致；SimHash 模式压掉重复、保留不同文本
+    cands = ["gpt 发布 时间", "gpt 发布 时间", " ", "技术 规格 参数", "gpt 发布 时间 说明"]
+    _assert(dedup_texts_by_cosine(cands, 0.92) == ["gpt 发布 时间", "技术 规格 参数",
+                                                   "gpt 发布 时间 说明"], "向量化去重异常")
+    X = np.random.default_rng(0).random((300, 8))
+    _assert((greedy_keep_mask(X, 0.99, block=32) == greedy_keep_mask(X, 0.99)).all(),
+            "分块贪心去重结果不一致")
+    lsh = SimHashDeduper(0.92)
+    _assert(lsh.dedup(cands * 50) == ["gpt 发布 时间", "技术 规格 参数", "gpt 发布 时间 说明"]
+            and lsh.seen == 200, "SimHash 去重异常")
+
+    # 19) 融合引擎：流式累加与一次性融合一致，来源加权、CombMNZ 与 top_n 截断
+    def _pool(*ids):
+        return [SearchResult(d, 1.0 / (r + 1), d) for r, d in enumerate(ids)]
+    pools = [_pool("a", "b", "c"), None, _pool("c", "d"), _pool("b", "c")]
+    acc = FusionAccumulator("rrf")
+    for p in pools:
+        acc.add(p)
+    full = rrf_fuse(pools)
+    _assert(acc.result() == full and [r.doc_id for r in full] == ["c", "b", "a", "d"],
+            "流式 RRF 结果异常")
+    _assert(rrf_fuse(pools, top_n=2) == full[:2], "top_n 截断与完整排序不一致")
+    _assert([r.doc_id for r in rrf_fuse(pools, weights=[1.0, 1.0, 0.0, 0.0])][:3]
+            == ["a", "b", "c"], "来源加权未生效")
+    _assert([r.doc_id for r in fuse_pools(pools, "combmnz")][:1] == ["c"]
+            and fuse_pools(pools, "combsum")[0].score > 0, "CombSUM/CombMNZ 异常")
+
+    # 20) 分层结果缓存：重复问句命中响应层；近重复命中；索引失效只清检索层，改写层保留
+    class _Counting(MockRetriever):
+        calls = 0
+
+        def search_many(self, queries, topk=10, filters=None):
+            type(self).calls += len(queries)
+            return super().search_many(queries, topk, filters)
+    cfg_c = AppConfig(cache={"enabled": True, "near_dup_thr": 0.9, "max_entries": 64})
+    cret, q = _Counting(), "请提供 2023 与 2024 的版本更新摘要与时间线说明"
+    c1 = rewrite_and_retrieve(q, "", cfg_c, llm, cret)
+    n_calls = _Counting.calls
+    c2 = rewrite_and_retrieve(q, "", cfg_c, llm, cret)
+    _assert(c1["metrics"]["cache"]["response"] == "miss" and c2["metrics"]["cache"]["response"]
+            == "hit" and _Counting.calls == n_calls, "响应缓存未命中")
+    _assert(c2["final_docs"] == c1["final_docs"], "缓存响应与原结果不一致")
+    c3 = rewrite_and_retrieve(q + "。", "", cfg_c, llm, cret)
+    _assert(c3["metrics"]["cache"]["response"] in ("hit", "near_hit"), "近重复问句未命中")
+    get_response_cache(cfg_c).invalidate_retrieval()
+    c4 = rewrite_and_retrieve(q, "", cfg_c, llm, cret)
+    _assert(c4["metrics"]["cache"] == {"response": "miss", "rewrite": "hit", "pool_hits": 0,
+                                       "pool_misses": c4["metrics"]["num_candidates"]}
+            and c4["final_docs"] == c1["final_docs"], "索引失效后改写层应保留、检索层应重算")
+    _assert("cache" in out1["metrics"] and out1["metrics"]["cache"]["response"] == "disabled",
+            "未启用缓存时应标记 disabled")
+    # 检索器回收后地址会被复用，新实例不能读到旧实例的缓存
+    _assert(ResponseCache.retrieval_ns(cret) == ResponseCache.retrieval_ns(cret)
+            and len({ResponseCache.retrieval_ns(MockRetriever()) for _ in range(50)}) == 50,
+            "检索器命名空间不唯一")
+    _assert(rewrite_and_retrieve(q, "", cfg_c, llm, _Counting())["metrics"]["cache"]["response"]
+            == "miss", "新检索器命中了其他实例的缓存响应")
+    class _Slotted:
+        __slots__ = ()  # 无 __dict__、不可弱引用
+    slotted = _Slotted()
+    _assert(ResponseCache.retrieval_ns(slotted) == ResponseCache.retrieval_ns(slotted)
+            != ResponseCache.retrieval_ns(_Slotted()), "__slots__ 检索器命名空间异常")
+    #     HyDE 每次请求新建的向量适配器沿用被包装检索器的命名空间，检索池可跨请求命中
+    dense_c = DenseRetriever.from_docs([{"id": d, **o} for d, o in ret._docs.items()],
+                                       HashingEmbedder(64))
+    _assert(ResponseCache.retrieval_ns(VectorQueryRetriever(dense_c))
+            == ResponseCache.retrieval_ns(VectorQueryRetriever(dense_c))
+            == ResponseCache.retrieval_ns(dense_c) + "|vector", "HyDE 检索池命名空间不稳定")
+    now = [0.0]
+    ttl = TTLCache(max_entries=2, ttl_s=10, clock=lambda: now[0])
+    ttl.put("a", 1)
+    ttl.put("b", 2)
+    ttl.put("c", 3)
+    now[0] = 11.0
+    _assert("a" not in ttl and ttl.get("b") is None and ttl.stats()["evictions"] == 1
+            and ttl.stats()["expirations"] == 1, "TTL / LRU 淘汰异常")
+
+    # 21) LLM 调用缓存：并发相同 prompt 只发一次上游请求；SQLite 持久化跨实例复用
+    clm = CachingLLMClient(_SlowLLM(0.1))
+    res: list = []
+    th = [threading.Thread(target=lambda: res.append(clm.generate_lines("“GPT 发布”", 4)))
+          for _ in range(8)]
+    for t in th:
+        t.start()
+    for t in th:
+        t.join()
+    _assert(clm.upstream_calls == 1 and clm.coalesced == 7 and len(res) == 8
+            and all(r == res[0] for r in res), "single-flight 未合并并发调用")
+    _assert(len({id(r) for r in res}) == 8, "调用方共享了同一结果对象")
+    res[0].append("x")
+    _assert(clm.generate_lines("“GPT 发布”", 4) == res[1], "缓存结果被调用方修改")
+
+    class _OddLLM(_SlowLLM):
+        """generate_json 返回不可序列化的值；批量接口少返回一条。"""
+        def generate_json(self, prompt, schema_hint=None, max_tokens=512):
+            time.sleep(self.delay_s)
+            return {"tags": {prompt}}
+
+        def generate_json_batch(self, prompts, schema_hint=None, max_tokens=512):
+            return [self.generate_json(p) for p in prompts][:max(1, len(prompts) - 1)]
+    codd = CachingLLMClient(_OddLLM(0.05))
+    res = []
+    th = [threading.Thread(target=lambda: res.append(codd.generate_json("q"))) for _ in range(4)]
+    for t in th:
+        t.start()
+    for t in th:
+        t.join()
+    _assert(len(res) == 4 and all(r == {"tags": {"q"}} for r in res), "不可序列化结果未传给跟随者")
+    _assert(codd.generate_json_batch(["a", "b", "c"]) == [{"tags": {x}} for x in "abc"],
+            "批量返回条数不符时未逐条回退")
+
+    async def _cancel_leader() -> list:
+        acl = AsyncCachingLLMClient(AsyncDummyLLM(0.05))
+        leader = asyncio.ensure_future(acl.generate("hello"))
+        await asyncio.sleep(0)
+        follower = asyncio.ensure_future(acl.generate("hello"))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        return [await follower, acl.upstream_calls, leader.cancelled()]
+    _assert(asyncio.run(_cancel_leader()) == [DummyLLM().generate("hello"), 1, True],
+            "发起者被取消波及了等待者")
+    _assert(clm.generate_json_batch(["a", "b", "a"]) == [llm.generate_json("a")] * 3
+            and clm.upstream_calls == 2, "批量缓存调用异常")
+    rewrite_and_retrieve("它什么时候发布？", "上文实体=GPT-5", cfg, clm, ret)
+    n_up = clm.upstream_calls
+    rewrite_and_retrieve("它什么时候发布？", "上文实体=GPT-5", cfg, clm, ret)
+    _assert(clm.upstream_calls == n_up, "重复请求未命中 LLM 缓存")
+    with tempfile.TemporaryDirectory() as tmp:
+        db = os.path.join(tmp, "llm.sqlite")
+        first = CachingLLMClient(DummyLLM(), LLMCacheStore(path=db))
+        first.generate("hello")
+        first.store.close()
+        second = CachingLLMClient(DummyLLM(), LLMCacheStore(path=db))
+        second.generate("hello")
+        _assert(second.upstream_calls == 0 and second.store.stats()["disk_hits"] == 1,
+                "SQLite 持久化未命中")
+        second.store.close()
+
+    # 22) 组合提示词：多路 LLM 改写一次往返，结果与逐策略调用一致；解析失败时逐策略回退
+    cfg_m = AppConfig()
+    cfg_m.router.combined_prompt = True
+    with StubLLMServer() as stub:
+        hl = HTTPLLMClient(stub.url)
+        base = rewrite_and_retrieve("它什么时候发布？", "上文实体=GPT-5", cfg, hl, ret)
+        n_sep = stub.stats()["total"]
+        stub.reset()
+        comb = rewrite_and_retrieve("它什么时候发布？", "上文实体=GPT-5", cfg_m, hl, ret)
+        _assert(n_sep >= 2 and stub.stats() == {"generate": 0, "generate_lines": 0,
+                                                "generate_json": 1, "total": 1},
+                "组合提示词未合并 LLM 往返")
+        _assert(comb["candidates"] == base["candidates"]
+                and comb["self_query_filters"] == base["self_query_filters"],
+                "组合提示词结果与逐策略调用不一致")
+
+    class _BadJsonLLM(DummyLLM):
+        def generate_json(self, prompt, schema_hint=None, max_tokens=512):
+            return "抱歉" if schema_hint else super().generate_json(prompt, schema_hint)
+    bad = rewrite_and_retrieve("它什么时候发布？", "上文实体=GPT-5", cfg_m, _BadJsonLLM(), ret)
+    _assert(bad["candidates"] == base["candidates"], "组合响应解析失败后未回退")
+    _assert(parse_combined('好的：```json\n{"queries": ["a", "b"], "hyde": 1}\n```',
+                           ["multiquery", "hyde"]) == {"multiquery": ["a", "b"]},
+            "组合响应解析异常")
+
+    # 23) 自适应路由：按 (问句类型, 策略) 的收益/延迟统计裁剪计划；延迟预算；离线分类器
+    ar = AdaptiveRouter(AdaptiveRouterConfig(min_samples=3, explore_rate=0.0))
+    base_plan = StrategyPlan(use_multiquery=True, use_hyde=True, use_self_query=True)
+    _assert(ar.plan("GPT 发布", base_plan) == base_plan, "冷启动应沿用启发式计划")
+    for _ in range(3):
+        ar.record("GPT 发布", {"multiquery": 20.0, "hyde": 300.0}, {"multiquery": 0.5, "hyde": 0.0})
+    _assert(ar.plan("GPT 发布", base_plan) == StrategyPlan(use_multiquery=True,
+                                                           use_self_query=True),
+            "无收益的高成本策略未被关闭")
+    ar.cfg = AdaptiveRouterConfig(min_samples=3, explore_rate=0.0, latency_budget_ms=10)
+    _assert(not ar.plan("GPT 发布", base_plan).use_multiquery, "延迟预算未生效")
+    cfg_a = AppConfig(router={"mode": "adaptive", "adaptive": {"min_samples": 2,
+                                                               "explore_rate": 0.0}})
+    for _ in range(3):
+        oa = rewrite_and_retrieve("它什么时候发布？", "上文实体=GPT-5", cfg_a, llm, ret)
+    _assert("strategy_gain" in oa["metrics"] and get_adaptive_router(cfg_a).stats.snapshot(),
+            "管线未记录策略统计")
+    #     统计周期写回 stats_path，新进程（新路由实例）启动时加载
+    with tempfile.TemporaryDirectory() as tmp:
+        acfg_p = AdaptiveRouterConfig(min_samples=3, explore_rate=0.0, stats_save_interval_s=0.01,
+                                      stats_path=os.path.join(tmp, "stats.json"))
+        ar_p = AdaptiveRouter(acfg_p)
+        ar_p.record("GPT 发布", {"hyde": 300.0}, {"hyde": 0.0})
+        time.sleep(0.02)
+        ar_p.record("GPT 发布", {"hyde": 300.0}, {"hyde": 0.0})
+        loaded = StrategyStats()
+        loaded.load(acfg_p.stats_path)
+        _assert(loaded.snapshot() == ar_p.stats.snapshot()
+                and os.listdir(tmp) == ["stats.json"], "自适应路由统计未写回 stats_path")
+    clf = StrategyClassifier.fit([{"q": q, "strategy": "hyde", "gain": g} for q, g in
+                                  [("GPT 发布", 0.5), ("它何时发布", 0.4), ("版本 说明", 0.3)] * 3
+                                  + [("请提供 2023 与 2024 的版本更新摘要与时间线说明", 0.0),
+                                     ("请对比 2023 版与 2024 版在功能与价格上的全部差异", 0.0)] * 3])
+    _assert(clf.predict("它发布了吗")["hyde"] > clf.predict(
+        "请详细说明 2024 版本更新摘要与对应的时间线及差异")["hyde"], "分类器预测异常")
+    _assert(query_type("2023 版与 2024 版有何差异？") == "mid|compare|time", "问句分桶异常")
+
+    # 24) 分段执行：首跳置信时跳过 MultiQuery/HyDE/Decompose；PRF 复用首跳结果不再单独检索
+    class _SearchCounting(MockRetriever):
+        single = 0
+
+        def search(self, query, topk=10, filters=None):
+            type(self).single += 1
+            return super().search(query, topk, filters)
+    cfg_e = AppConfig(early_exit={"enabled": True})
+    cfg_e.normalizer.alias_table_path = cfg.normalizer.alias_table_path
+    clm_e = CachingLLMClient(DummyLLM())
+    e1 = rewrite_and_retrieve("技术规格 接口", "", cfg_e, clm_e, ret)
+    _assert(e1["metrics"]["early_exit"]["confident"] and e1["candidates"] == ["技术规格 接口"]
+            and clm_e.upstream_calls == 0 and e1["final_docs"][0]["doc_id"] == "d3",
+            "置信首跳未提前结束")
+    e2 = rewrite_and_retrieve("它什么时候发布？", "上文实体=GPT-5", cfg_e, llm, ret)
+    _assert(not e2["metrics"]["early_exit"]["confident"]
+            and e2["candidates"] == out1["candidates"], "不置信时应执行完整扩展")
+    e3 = rewrite_and_retrieve(q, "", cfg_e, llm, _SearchCounting())
+    _assert(e3["strategy"]["use_prf"] and _SearchCounting.single == 0
+            and e3["metrics"]["early_exit"]["overlap"] is not None, "PRF 未复用首跳检索")
+    cfg_ce = AppConfig(cache={"enabled": True})
+    cfg_ce.normalizer.alias_table_path = cfg.normalizer.alias_table_path
+    full = rewrite_and_retrieve("技术规格 接口", "", cfg_ce, llm, ret)
+    cfg_ce.early_exit.enabled = True
+    e4 = rewrite_and_retrieve("技术规格 接口", "", cfg_ce, llm, ret)
+    _assert(len(full["candidates"]) > 1 and e4["metrics"]["cache"]["response"] == "miss"
+            and e4["candidates"] == ["技术规格 接口"] and "early_exit" in e4["metrics"],
+            "开启 early_exit 后不应命中完整管线的缓存响应")
+    #     反向：提前结束的请求不写入不完整的改写层条目，之后不开启 early_exit 的请求完整执行
+    cfg_ce2 = AppConfig(cache={"enabled": True}, early_exit={"enabled": True})
+    cfg_ce2.normalizer.alias_table_path = cfg.normalizer.alias_table_path
+    cfg_ce2.cache.max_entries += 1  # 与上面的配置区分缓存实例
+    e5 = rewrite_and_retrieve("2024 版本更新", "", cfg_ce2, llm, ret)
+    cfg_ce2.early_exit.enabled = False
+    f5 = rewrite_and_retrieve("2024 版本更新", "", cfg_ce2, llm, ret)
+    _assert(e5["candidates"] == ["2024 版本更新"] and e5["strategy"]["use_self_query"]
+            and f5["metrics"]["cache"]["rewrite"] == "miss" and len(f5["candidates"]) > 1,
+            "提前结束的请求写入了不完整的改写缓存")
+
+    # 25) RM3 共享首跳：每条候选只检索一次；BM25 提供 IDF 时高频词被丢弃；文档词项统计复用
+    class _QueryLog(MockRetriever):
+        def __init__(self):
+            super().__init__()
+            self.queries = []
+
+        def search_many(self, queries, topk=10, filters=None):
+            self.queries.extend(queries)
+            return super().search_many(queries, topk, filters)
+    qlog = _QueryLog()
+    p1 = rewrite_and_retrieve(q, "", cfg, llm, qlog)
+    _assert(p1["strategy"]["use_prf"] and len(qlog.queries) == len(set(qlog.queries))
+            and qlog.queries.count(p1["cqr"]) == 1, "PRF 未复用 CQR 首跳")
+    _assert(all(len(d) for d in p1["final_docs"]), "PRF 复用后终选异常")
+    blog = _QueryLog()
+    pb = rewrite_and_retrieve_many([(q, ""), (q, "")], cfg, llm, blog)
+    _assert(blog.queries.count(pb[0]["cqr"]) == 1 and pb[0]["candidates"] == p1["candidates"],
+            "批量 PRF 未复用首跳")
+    pa = asyncio.run(arewrite_and_retrieve(q, "", cfg, AsyncDummyLLM(), AsyncMockRetriever()))
+    _assert(pa["candidates"] == p1["candidates"] and pa["final_docs"] == p1["final_docs"],
+            "异步 PRF 与同步不一致")
+    dts = DocTermStats(16)
+    first = bm25.search("版本 更新", 5)
+    t_plain = dict(rm3_terms("版本 更新", first, 50, [], stats=dts))
+    t_idf = dict(rm3_terms("版本 更新", first, 50, [], idf=bm25.idf, min_idf=0.5, stats=dts))
+    common = [t for t in t_plain if bm25.idf(t) < 0.5]
+    _assert(dts.stats()["hits"] >= len(first), "文档词项统计未复用")
+    _assert(t_idf and all(t not in t_idf for t in common)
+            and all(t in t_plain for t in t_idf), "IDF 加权扩展词异常")
+
+    # 26) IVF 近似检索：全量探测与精确检索一致；持久化后结果不变；混合检索融合两路、HyDE 走稠密路
+    docs_i = [{"id": d, **o} for d, o in ret._docs.items()]
+    emb_i = HashingEmbedder(256)
+    exact = DenseRetriever.from_docs(docs_i, emb_i)
+    ivf = IVFRetriever.from_docs(docs_i, emb_i, n_lists=2, nprobe=2, quantize="float32")
+    for x in ["2024 版本更新", "FAQ 常见问题"]:
+        _assert([(r.doc_id, round(r.score, 5)) for r in ivf.search(x, 3) if r.score > 0]
+                == [(r.doc_id, round(r.score, 5)) for r in exact.search(x, 3) if r.score > 0],
+                "IVF 全量探测与精确检索不一致")
+    ivf8 = IVFRetriever.from_docs(docs_i, emb_i, n_lists=2, nprobe=1)
+    _assert(ivf8.search("版本", 5, {"must_filters": {"year": ["2023"]}})
+            and all(d.startswith("d") for d in (r.doc_id for r in ivf8.search("版本", 5))),
+            "IVF int8 / 过滤检索异常")
+    with tempfile.TemporaryDirectory() as tmp:
+        write_ivf_index(ivf8.arrays, tmp)
+        ivf_o = IVFRetriever.open(tmp, emb_i, nprobe=1)
+        _assert(ivf_o.search_many(["版本 更新", "接口"], 3) == ivf8.search_many(["版本 更新", "接口"], 3),
+                "IVF 索引持久化后结果不一致")
+        try:
+            write_ivf_index(dataclasses.replace(ivf.arrays, texts=None), tmp)
+        except TypeError:
+            pass
+        else:
+            _assert(False, "写入残缺 IVF 索引未报错")
+        _assert(IVFRetriever.open(tmp, emb_i, nprobe=1).search_many(["版本 更新", "接口"], 3)
+                == ivf8.search_many(["版本 更新", "接口"], 3), "IVF 写入失败破坏了旧索引")
+        del ivf_o
+    hyb = HybridRetriever(bm25, ivf)
+    hits = hyb.search("2024 版本更新", 5)
+    _assert(hits and {h.doc_id for h in hits} >= {bm25.search("2024 版本更新", 1)[0].doc_id,
+                                                   ivf.search("2024 版本更新", 1)[0].doc_id},
+            "混合检索未融合两路结果")
+    _assert(hyb.idf("版本") == bm25.idf("版本") and hyb.embedder is emb_i, "混合检索未透出 idf/embedder")
+    out9 = rewrite_and_retrieve("它什么时候发布？", "上文实体=GPT-5", cfg, llm, hyb)
+    _assert(out9["final_docs"], "混合检索接入管线结果为空")
+    #     两路经检索执行器各自的隔离舱提交；在唯一工作线程内嵌套调用时排队的一路撤回到调用线程，不会饿死
+    hex1 = RetrievalExecutor(max_workers=1, max_queue=4)
+    hyb1 = HybridRetriever(bm25, ivf, executor=hex1)
+    nested = hex1.submit("hybrid", hyb1.search_many, ["2024 版本更新"], 5)
+    _assert(nested is not None and nested.result(timeout=10) == [hits], "混合检索嵌套调用异常")
+    _assert(hex1.stats()["submitted"] == 3 and hex1.stats()["in_flight"] == 0,
+            "混合检索未经执行器隔离舱或名额未归还")
+    hex1.shutdown()
+    #     执行器饱和：被丢弃的一路在调用线程执行；reject 策略下第二路被拒时撤回已提交的一路
+    hex0 = RetrievalExecutor(max_workers=1, max_queue=0)
+    hold = threading.Event()
+    busy = hex0.submit("other", hold.wait, 5)
+    _assert(HybridRetriever(bm25, ivf, executor=hex0).search("2024 版本更新", 5) == hits
+            and hex0.stats()["shed"] == 2, "被丢弃的一路未在调用线程执行")
+    hold.set()
+    busy.result()
+    hex0.shutdown()
+    hexr = RetrievalExecutor(max_workers=1, max_queue=4, per_backend_limit=1,
+                             overload_policy="reject")
+    hold = threading.Event()
+    busy = hexr.submit(backend_name(ivf), hold.wait, 5)
+    try:
+        HybridRetriever(bm25, ivf, executor=hexr).search("2024 版本更新", 5)
+        _assert(False, "reject 策略下混合检索未抛出异常")
+    except RetrievalOverloadError:
+        pass
+    _assert(hexr.stats()["in_flight"] == 1, "被拒时已提交的一路未撤回")
+    hold.set()
+    busy.result()
+    hexr.shutdown()
+
+    # 27) 压测套件：查询日志覆盖全部路由分支；闭环/开环压测产出逐阶段分位数；基线回归门禁
+    qlog_b = generate_queries(100, seed=3)
+    _assert(all(branch_coverage(qlog_b).values()), "查询日志未覆盖全部路由分支")
+    _assert(qlog_b == generate_queries(100, seed=3), "查询日志生成不确定")
+    bret = LatencyRetriever(BM25Retriever.from_docs(generate_corpus(300)), LatencyModel(1.0))
+    lat_llm = LatencyLLM(LatencyModel(5.0, 1.0, seed=1))
+    run = lambda it: rewrite_and_retrieve(it.q, it.ctx, cfg, lat_llm, bret)  # noqa: E731
+    rep = summarize(run_closed_loop(run, qlog_b, concurrency=4, requests=40))
+    _assert(rep["errors"] == 0 and rep["latency"]["total"]["n"] == 40
+            and rep["latency"]["stage:multiquery"]["p50"] >= 4.0
+            and rep["latency"]["total"]["p95"] >= rep["latency"]["total"]["p50"], "闭环压测报告异常")
+    rep_o = summarize(run_open_loop(run, qlog_b, rate_qps=200, requests=20, seed=1))
+    _assert(rep_o["requests"] == 20 and rep_o["latency"]["total"]["p50"] > 0, "开环压测报告异常")
+    _assert(not compare_to_baseline(rep, rep), "与自身比较不应回归")
+    slow = json.loads(json.dumps(rep))
+    slow["latency"]["stage:multiquery"]["p95"] += 100.0
+    regs = compare_to_baseline(slow, rep)
+    _assert([(r["metric"], r["quantile"]) for r in regs] == [("stage:multiquery", "p95")],
+            "回归门禁未识别阶段退化")
+
+    # 28) 埋点：关闭时为空操作；开启时请求→阶段→检索调用嵌套 span，直方图/计数器可导出
+    _assert(get_telemetry(cfg).span("x") is NOOP_SPAN
+            and not get_telemetry(cfg).tracer.spans(), "关闭埋点时不应记录 span")
+    set_telemetry(None)
+    cfg_t = AppConfig(telemetry={"enabled": True})
+    tel = get_telemetry(cfg_t)
+    out_t = rewrite_and_retrieve("2024 年 GPT-5 与 K8s 的发布对比", "", cfg_t, llm, ret)
+    spans = {s.span_id: s for s in tel.tracer.spans()}
+    root = [s for s in spans.values() if s.kind == "request"]
+    _assert(len(root) == 1 and root[0].attributes["mode"] == "sync", "请求 span 异常")
+    _assert(all(s.trace_id == root[0].trace_id for s in spans.values()), "span 不在同一 trace")
+    stage_names = {s.name for s in spans.values() if s.kind == "stage"}
+    _assert({"normalize", "cqr", "route", "fuse", "mmr", "retrieve:cqr"} <= stage_names
+            and set(out_t["metrics"]["stage_ms"]) <= stage_names, "阶段 span 不完整")
+    calls = [s for s in spans.values() if s.kind == "retrieval"]
+    _assert(calls and all(spans[s.parent_id].name.startswith(("retrieve:", "prf"))
+                          for s in calls), "检索调用 span 未挂在检索阶段下")
+    _assert(tel.stage_latency.snapshot(stage="mmr")["count"] == 1
+            and tel.candidates.value(mode="sync") == out_t["metrics"]["num_candidates"]
+            and tel.requests.value(mode="sync") == 1, "直方图 / 计数器未累加")
+    try:
+        with tel.span("boom", kind="stage"):
+            raise ValueError("x")
+    except ValueError:
+        pass
+    _assert(tel.span_errors.value(kind="stage", span="boom") == 1, "出错 span 未计数")
+    asyncio.run(arewrite_and_retrieve("它什么时候发布？", "上文实体=GPT-5", cfg_t,
+                                      AsyncDummyLLM(), AsyncMockRetriever()))
+    _assert(tel.requests.value(mode="async") == 1
+            and tel.retrieval_latency.snapshot(backend="AsyncMockRetriever")["count"] > 0,
+            "异步请求埋点异常")
+    prom = prometheus_text(tel.metrics)
+    _assert('rqw_requests_total{mode="sync"} 1' in prom
+            and 'rqw_stage_latency_ms_bucket{stage="mmr",le="+Inf"} 2' in prom, "Prometheus 导出异常")
+    otlp = otlp_json(tel.tracer.spans())["resourceSpans"][0]["scopeSpans"][0]["spans"]
+    _assert(len(otlp) == len(tel.tracer.spans())
+            and sum("parentSpanId" not in s for s in otlp) == 3, "OTLP 导出异常")
+    with MetricsServer(tel) as ms:
+        body = urlopen(ms.url + "/metrics", timeout=5).read().decode("utf-8")
+    _assert(body == prometheus_text(tel.metrics), "指标端点输出不一致")
+    set_telemetry(None)
+
+    # 29) HTTP 服务：预热前未就绪；改写 / 检索支持单条与 JSON 批量；重载别名表；预派生多进程优雅停止
+    with tempfile.TemporaryDirectory() as tmp:
+        alias_path = os.path.join(tmp, "alias.yaml")
+        with open(alias_path, "w", encoding="utf-8") as f:
+            f.write("gpt5: GPT-5\n")
+        svc = RewriteService(ServiceOptions(alias_path=alias_path), retriever=ret)
+        httpd = ServingHTTPServer(svc)
+        th = threading.Thread(target=httpd.serve_forever, daemon=True)
+        th.start()
+        try:
+            _assert(_http(httpd.url + "/readyz")[0] == 503
+                    and _http(httpd.url + "/v1/rewrite", {"q": "x"})[0] == 503, "预热前不应就绪")
+            svc.prepare().warm_up()
+            code, st = _http(httpd.url + "/readyz")
+            _assert(code == 200 and {"alias", "normalize", "pipeline"} <= set(st["warmup_ms"]),
+                    "预热后未就绪")
+            code, rw = _http(httpd.url + "/v1/rewrite", {"q": "它什么时候发布？", "ctx": "上文实体=GPT-5"})
+            _assert(code == 200 and rw["cqr"] == "GPT-5什么时候发布" and "multiquery" in rw["candidates"],
+                    "改写接口异常")
+            items_h = [{"q": "2024 版本更新"}, {"q": "它什么时候发布？", "ctx": "上文实体=GPT-5"}]
+            code, sr = _http(httpd.url + "/v1/search", {"items": items_h})
+            ref = rewrite_and_retrieve_many([(d["q"], d.get("ctx", "")) for d in items_h],
+                                            svc.cfg, svc.llm, ret)
+            _assert(code == 200 and [r["final_docs"] for r in sr["results"]]
+                    == [r["final_docs"] for r in ref], "批量检索接口与批量流水线不一致")
+            _assert(_http(httpd.url + "/v1/search", {"items": []})[0] == 400
+                    and _http(httpd.url + "/v1/search", {"q": ""})[0] == 400
+                    and _http(httpd.url + "/nope")[0] == 404, "非法请求未拒绝")
+            with open(alias_path, "a", encoding="utf-8") as f:
+                f.write("发布日: release date\n")
+            code, rl = _http(httpd.url + "/admin/reload", {})
+            _assert(code == 200 and rl["ok"] and rl["generation"] == 1
+                    and _http(httpd.url + "/v1/rewrite", {"q": "发布日"})[1]["normalized"]
+                    == "release date", "重载后别名表未生效")
+            with open(alias_path, "w", encoding="utf-8") as f:
+                f.write("发布日: [unclosed\n")
+            code, rl = _http(httpd.url + "/admin/reload", {})
+            _assert(code == 200 and not rl["ok"] and rl["generation"] == 1
+                    and _http(httpd.url + "/v1/rewrite", {"q": "发布日"})[1]["normalized"]
+                    == "release date", "别名表损坏时重载应失败并保留旧别名")
+            with open(alias_path, "w", encoding="utf-8") as f:
+                f.write("gpt5: GPT-5\n发布日: release date\n")
+        finally:
+            httpd.shutdown()
+            httpd.server_close()
+        with socket.socket() as probe:
+            probe.bind(("127.0.0.1", 0))
+            port = probe.getsockname()[1]
+        proc = subprocess.Popen(
+            [sys.executable, "cli.py", "--log-level", "WARNING", "serve", "--port", str(port),
+             "--workers", "2", "--alias", alias_path],
+            env={**os.environ, "PYTHONPATH": "."}, stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL)
+        try:
+            url, pids = f"http://127.0.0.1:{port}", set()
+            for _ in range(300):
+                try:
+                    code, st = _http(url + "/readyz")
+                    if code == 200:
+                        pids.add(st["pid"])
+                    if len(pids) == 2:
+                        break
+                except OSError:
+                    pass
+                time.sleep(0.1)
+            _assert(len(pids) == 2 and proc.pid not in pids, "预派生工作进程未就绪")
+            _assert(_http(url + "/v1/search", {"q": "发布日"})[1]["normalized"] == "release date",
+                    "工作进程检索异常")
+            proc.send_signal(signal.SIGTERM)
+            _assert(proc.wait(timeout=30) == 0, "预派生服务未优雅退出")
+        finally:
+            if proc.poll() is None:
+                proc.kill()
+
+    # 30) 启动开销：导入管线不加载 sklearn / scipy / dateparser / yaml；快速路径不加载 pydantic / NumPy，
+    #     结果与完整管线一致；prepare() 在 fork 前导入延迟加载的重依赖；cqr 子命令逐行输出
+    probe = ("import sys; {stmt}; print(','.join(h for h in ('sklearn', 'scipy', 'dateparser', "
+             "'yaml', 'pydantic', 'numpy') if h in sys.modules))")
+
+    def _loaded(stmt: str) -> set:
+        out = subprocess.run([sys.executable, "-c", probe.format(stmt=stmt)], capture_output=True,
+                             text=True, check=True, env={**os.environ, "PYTHONPATH": "."})
+        return set(filter(None, out.stdout.strip().split(",")))
+
+    _assert(not _loaded("import rag_query_rewriter.pipeline.orchestrator")
+            & {"sklearn", "scipy", "dateparser", "yaml"}, "导入管线时加载了重依赖")
+    _assert(not _loaded("import rag_query_rewriter.rewrite.fast"), "快速路径导入了重依赖")
+    _assert({"sklearn", "scipy", "dateparser"} <= _loaded(
+        "from rag_query_rewriter.serving.service import RewriteService, ServiceOptions; "
+        "RewriteService(ServiceOptions()).prepare()"), "prepare() 未在 fork 前导入重依赖")
+    lazy_json = lazy_module("json")
+    _assert(not lazy_json.loaded and lazy_json.loads("[1]") == [1] and lazy_json.loaded,
+            "lazy_module 行为异常")
+    for q, ctx in [("它什么时候发布？", "上文实体=GPT-5"), ("gpt5 昨天 的 Release Notes", "")]:
+        full = rewrite_and_retrieve(q, ctx, cfg, llm, ret)
+        fast = normalize_and_cqr(q, ctx, cfg.normalizer.alias_table_path)
+        _assert((fast["normalized"], fast["cqr"]) == (full["normalized"], full["cqr"]),
+                "快速路径与完整管线的规范化 / CQR 不一致")
+    with tempfile.TemporaryDirectory() as tmp:
+        inp = os.path.join(tmp, "q.jsonl")
+        with open(inp, "w", encoding="utf-8") as f:
+            f.write(json.dumps({"q": "它什么时候发布？", "ctx": "上文实体=GPT-5"}, ensure_ascii=False)
+                    + "\n" + json.dumps({"q": "gpt5 版本"}) + "\n")
+        out = subprocess.run([sys.executable, "cli.py", "--log-level", "WARNING", "cqr", "--in", inp],
+                             capture_output=True, text=True, check=True,
+                             env={**os.environ, "PYTHONPATH": "."})
+        rows = [json.loads(ln) for ln in out.stdout.splitlines() if ln.startswith("{")]
+        _assert([r["cqr"] for r in rows] == ["GPT-5什么时候发布", "GPT-5 版本"], "cqr 子命令输出异常")
+
     print("✅ Self-check passed: all core flows, boundaries, and metrics OK.")
 
 